@@ -0,0 +1,299 @@
+import argparse
+import json
+import os
+import random
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from utils.java_code.function_info import FunctionInfo
+from .clone_class import CloneClass
+from .clone_pair import ClonePair
+from .clone_type import CloneType
+
+# BigCloneEval 覆盖匹配的默认阈值：检测结果需覆盖参考片段至少70%的行
+DEFAULT_MIN_COVERAGE = 0.7
+
+FileKey = Tuple[str, str]
+
+
+def file_key(path: str) -> FileKey:
+    """
+    BigCloneEval 用 (子目录, 文件名) 标识文件，如 ("selected", "123.java")。
+    取路径的最后两级，使绝对路径和数据集内的相对路径得到同一个键。
+    """
+    head, name = os.path.split(os.path.normpath(path))
+    return os.path.basename(head), name
+
+
+class GroundTruthIndex:
+    """
+    按文件建立区间索引的参考克隆对集合。
+
+    每个文件的参考片段按起始行排序，查询一个检测片段时只用二分查找定位可能与之重叠的片段，
+    再按覆盖匹配规则筛选；每个片段记录它参与的参考克隆对，检测克隆对的两端各自查询后求交即可。
+    """
+
+    def __init__(self, pairs: Iterable[ClonePair], min_coverage: float = DEFAULT_MIN_COVERAGE):
+        self.min_coverage = min_coverage
+        self.pair_types: List[CloneType] = []
+        self._fragment_ids: Dict[Tuple[FileKey, int, int], int] = {}
+        self._partners: List[Dict[int, int]] = []  # 片段ID -> {另一端片段ID: 参考克隆对ID}
+        by_file: Dict[FileKey, List[Tuple[int, int, int]]] = {}
+        for p in pairs:
+            a = self._fragment(by_file, p.file1, p.start1, p.end1)
+            b = self._fragment(by_file, p.file2, p.start2, p.end2)
+            if b in self._partners[a]:
+                continue
+            pair_id = len(self.pair_types)
+            self.pair_types.append(p.clone_type)
+            self._partners[a][b] = pair_id
+            self._partners[b][a] = pair_id
+
+        self._starts: Dict[FileKey, List[int]] = {}
+        self._intervals: Dict[FileKey, List[Tuple[int, int, int]]] = {}
+        self._max_length: Dict[FileKey, int] = {}
+        for key, intervals in by_file.items():
+            intervals.sort()
+            self._intervals[key] = intervals
+            self._starts[key] = [s for s, _, _ in intervals]
+            self._max_length[key] = max(e - s + 1 for s, e, _ in intervals)
+
+    def _fragment(self, by_file, path: str, start: int, end: int) -> int:
+        key = (file_key(path), start, end)
+        frag = self._fragment_ids.get(key)
+        if frag is None:
+            frag = self._fragment_ids[key] = len(self._partners)
+            self._partners.append({})
+            by_file.setdefault(key[0], []).append((start, end, frag))
+        return frag
+
+    def __len__(self) -> int:
+        return len(self.pair_types)
+
+    @classmethod
+    def from_csv(cls, path: str, min_coverage: float = DEFAULT_MIN_COVERAGE) -> "GroundTruthIndex":
+        from .clone_class_parser import CloneClassParser
+
+        return cls(CloneClassParser(path).clone_pairs, min_coverage)
+
+    def covered_fragments(self, path: str, start: int, end: int) -> List[int]:
+        """被检测片段 [start, end] 覆盖（覆盖行数不少于参考片段的 min_coverage）的参考片段ID。"""
+        key = file_key(path)
+        starts = self._starts.get(key)
+        if not starts:
+            return []
+        intervals = self._intervals[key]
+        # 与 [start, end] 有重叠的片段满足 rs <= end 且 re >= start，后者意味着 rs > start - 最长片段长度
+        lo = bisect_left(starts, start - self._max_length[key] + 1)
+        hi = bisect_right(starts, end)
+        covered = []
+        for rs, re, frag in intervals[lo:hi]:
+            overlap = min(end, re) - max(start, rs) + 1
+            if overlap > 0 and overlap >= self.min_coverage * (re - rs + 1):
+                covered.append(frag)
+        return covered
+
+    def match(self, pair: ClonePair) -> List[int]:
+        """检测克隆对匹配到的参考克隆对ID（两端分别覆盖某个参考克隆对的两个片段，顺序不限）。"""
+        left = self.covered_fragments(pair.file1, pair.start1, pair.end1)
+        if not left:
+            return []
+        right = set(self.covered_fragments(pair.file2, pair.start2, pair.end2))
+        matched = []
+        for a in left:
+            partners = self._partners[a]
+            for b in right:
+                pair_id = partners.get(b)
+                if pair_id is not None:
+                    matched.append(pair_id)
+        return matched
+
+
+@dataclass
+class EvaluationReport:
+    detected: int
+    recall_by_type: Dict[CloneType, Tuple[int, int]]  # 类型 -> (找到的参考克隆对数, 参考克隆对总数)
+    sample_size: int = 0
+    sample_true: int = 0
+    sample_false: int = 0
+    unjudged_sample: List[ClonePair] = field(default_factory=list)
+
+    @property
+    def recall(self) -> float:
+        found = sum(f for f, _ in self.recall_by_type.values())
+        total = sum(t for _, t in self.recall_by_type.values())
+        return found / total if total else 0.0
+
+    @property
+    def precision(self) -> Optional[float]:
+        """样本中已判定（匹配参考克隆对或误报集合）的克隆对里真克隆的比例，没有已判定样本时为None。"""
+        judged = self.sample_true + self.sample_false
+        return self.sample_true / judged if judged else None
+
+    def to_dict(self) -> dict:
+        return {
+            "detected": self.detected,
+            "recall": self.recall,
+            "recall_by_type": {t.value: {"found": f, "total": n} for t, (f, n) in self.recall_by_type.items()},
+            "precision": self.precision,
+            "precision_sample": self.sample_size,
+            "sample_true": self.sample_true,
+            "sample_false": self.sample_false,
+            "sample_unjudged": len(self.unjudged_sample),
+        }
+
+    def format(self) -> str:
+        lines = [f"Detected clone pairs: {self.detected}", f"Recall: {self.recall * 100:.2f}%"]
+        for clone_type, (found, total) in sorted(self.recall_by_type.items(), key=lambda kv: kv[0].value):
+            rate = found / total * 100 if total else 0.0
+            lines.append(f"  {clone_type.value}: {found}/{total} ({rate:.2f}%)")
+        if self.sample_size:
+            precision = "n/a" if self.precision is None else f"{self.precision * 100:.2f}%"
+            lines.append(
+                f"Precision on {self.sample_size} sampled pairs: {precision} "
+                f"({self.sample_true} true, {self.sample_false} false, {len(self.unjudged_sample)} unjudged)"
+            )
+        return "\n".join(lines)
+
+
+def evaluate(
+    detected: Iterable[ClonePair],
+    truth: GroundTruthIndex,
+    precision_sample: int = 0,
+    false_positives: Optional[GroundTruthIndex] = None,
+    seed: int = 0,
+) -> EvaluationReport:
+    """
+    计算按克隆类型的召回率，并在随机抽样的检测克隆对上估计精确率。
+
+    :param precision_sample: 精确率样本大小（蓄水池抽样，单遍完成），0表示不估计
+    :param false_positives: 已知误报克隆对的索引（如BigCloneBench的false positives表）。提供时，
+        样本中既不匹配参考克隆对也不匹配误报的克隆对记为未判定，留待人工确认；
+        不提供时，不匹配参考克隆对的一律视为误报，得到的是精确率的下界
+    """
+    rng = random.Random(seed)
+    found = set()
+    sample: List[Tuple[ClonePair, bool]] = []
+    count = 0
+    for pair in detected:
+        matched = truth.match(pair)
+        found.update(matched)
+        if precision_sample:
+            if len(sample) < precision_sample:
+                sample.append((pair, bool(matched)))
+            else:
+                j = rng.randrange(count + 1)
+                if j < precision_sample:
+                    sample[j] = (pair, bool(matched))
+        count += 1
+
+    recall_by_type: Dict[CloneType, Tuple[int, int]] = {}
+    for pair_id, clone_type in enumerate(truth.pair_types):
+        hit, total = recall_by_type.get(clone_type, (0, 0))
+        recall_by_type[clone_type] = (hit + (pair_id in found), total + 1)
+
+    report = EvaluationReport(detected=count, recall_by_type=recall_by_type, sample_size=len(sample))
+    for pair, is_true in sample:
+        if is_true:
+            report.sample_true += 1
+        elif false_positives is None or false_positives.match(pair):
+            report.sample_false += 1
+        else:
+            report.unjudged_sample.append(pair)
+    return report
+
+
+def results_to_clone_pairs(
+    results: Iterable[dict],
+    functions: Sequence[FunctionInfo],
+    clone_classes: Sequence[CloneClass],
+) -> Iterator[ClonePair]:
+    """
+    把 generate_prompts 的输出记录展开为克隆对：目标函数与所判定克隆类（ID从1开始）的每个成员片段各成一对。
+    """
+    members: Dict[int, List[Tuple[str, int, int]]] = {}
+    for record in results:
+        class_id = record.get("matched_clone_class_id")
+        if class_id is None or "error" in record or not 1 <= class_id <= len(clone_classes):
+            continue
+        target = functions[record["id"]]
+        fragments = members.get(class_id)
+        if fragments is None:
+            unique = {}
+            for p in clone_classes[class_id - 1].clone_pairs:
+                unique.setdefault((p.file1, p.start1, p.end1))
+                unique.setdefault((p.file2, p.start2, p.end2))
+            fragments = members[class_id] = list(unique)
+        target_key = (file_key(target.path), target.start_line, target.end_line)
+        for path, start, end in fragments:
+            if (file_key(path), start, end) == target_key:
+                continue
+            yield ClonePair(
+                file1=target.path, start1=target.start_line, end1=target.end_line,
+                file2=path, start2=start, end2=end,
+            )
+
+
+def export_bigcloneeval(pairs: Iterable[ClonePair], path: str) -> int:
+    """
+    写出 BigCloneEval 的导入格式，每行 dir1,file1,start1,end1,dir2,file2,start2,end2。
+
+    :return: 写入的克隆对数量
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    count = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for p in pairs:
+            d1, f1 = file_key(p.file1)
+            d2, f2 = file_key(p.file2)
+            f.write(f"{d1},{f1},{p.start1},{p.end1},{d2},{f2},{p.start2},{p.end2}\n")
+            count += 1
+    return count
+
+
+def main(argv=None):
+    from clone.clone_class_parser import CloneClassParser
+    from utils.file.file_io import read_functions_from_disk
+    from utils.file.jsonl_journal import load_journal
+
+    parser = argparse.ArgumentParser(description="Evaluate detected clones against ground truth, BigCloneEval style")
+    parser.add_argument("--truth", required=True, help="参考克隆对CSV（CloneClassParser格式，第7列可选为克隆类型）")
+    parser.add_argument("--detected", help="检测结果CSV（CloneClassParser格式）")
+    parser.add_argument("--results", help="generate_prompts 输出的JSONL，需同时提供 --functions 和 --clone_csv")
+    parser.add_argument("--functions", help="functions.pkl path")
+    parser.add_argument("--clone_csv", help="generate_prompts 使用的克隆类CSV")
+    parser.add_argument("--min-coverage", type=float, default=DEFAULT_MIN_COVERAGE)
+    parser.add_argument("--precision-sample", type=int, default=1000, help="估计精确率的样本大小，0表示不估计")
+    parser.add_argument("--false-positives", help="已知误报克隆对CSV")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--export", help="另外写出 BigCloneEval 导入格式的检测结果")
+    parser.add_argument("--report", help="评估结果JSON路径")
+    args = parser.parse_args(argv)
+
+    if args.results:
+        if not (args.functions and args.clone_csv):
+            parser.error("--results requires --functions and --clone_csv")
+        functions = read_functions_from_disk(args.functions)
+        clone_classes = CloneClassParser(args.clone_csv).parse()
+        records = load_journal(args.results).values()
+        detected = list(results_to_clone_pairs(records, functions, clone_classes))
+    elif args.detected:
+        detected = CloneClassParser(args.detected).clone_pairs
+    else:
+        parser.error("one of --detected or --results is required")
+
+    truth = GroundTruthIndex.from_csv(args.truth, args.min_coverage)
+    false_positives = GroundTruthIndex.from_csv(args.false_positives, args.min_coverage) if args.false_positives else None
+    report = evaluate(detected, truth, args.precision_sample, false_positives, args.seed)
+    print(report.format())
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report.to_dict(), f, ensure_ascii=False, indent=2)
+    if args.export:
+        count = export_bigcloneeval(detected, args.export)
+        print(f"Exported {count} clone pairs to {args.export}")
+
+
+if __name__ == "__main__":
+    main()
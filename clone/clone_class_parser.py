@@ -5,6 +5,7 @@ from tqdm import tqdm
 
 from clone.clone_class import CloneClass
 from clone.clone_pair import ClonePair
+from clone.clone_type import CloneType
 from clone.pair_filter_strategy import ClonePairFilterStrategy
 
 
@@ -44,7 +45,14 @@ class CloneClassParser:
         e2 = int(fields[5].strip())
         f1 = os.path.normpath(f1)
         f2 = os.path.normpath(f2)
-        return ClonePair(file1=f1, start1=s1, end1=e1, file2=f2, start2=s2, end2=e2)
+        # 可选的第7列为克隆类型（如内置检测器写出的 Type-1/Type-2/Type-3）
+        clone_type = CloneType.UNKNOWN
+        if len(fields) > 6:
+            try:
+                clone_type = CloneType(fields[6].strip())
+            except ValueError:
+                pass
+        return ClonePair(file1=f1, start1=s1, end1=e1, file2=f2, start2=s2, end2=e2, clone_type=clone_type)
 
     def _parse_clone_class(self, clone_pairs):
         # 使用并查集（DSU）将每个片段(file,start,end)作为节点，根据克隆对进行合并，
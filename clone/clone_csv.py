@@ -0,0 +1,33 @@
+import csv
+import os
+from typing import Iterable, Optional, Sequence
+
+from .clone_pair import ClonePair
+from .clone_type import CloneType
+
+
+def write_clone_pairs_csv(
+    pairs: Iterable[ClonePair],
+    filepath: str,
+    with_type: bool = True,
+    scores: Optional[Sequence[float]] = None,
+) -> int:
+    """
+    把克隆对写成 CloneClassParser 读取的CSV格式：file1,start1,end1,file2,start2,end2[,clone_type[,score]]。
+    克隆类型未知且没有得分时省略第7列；提供scores时第8列为得分（解析时忽略）。
+
+    :return: 写入的克隆对数量
+    """
+    os.makedirs(os.path.dirname(filepath) or ".", exist_ok=True)
+    count = 0
+    with open(filepath, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f, lineterminator="\n")
+        for i, p in enumerate(pairs):
+            row = [p.file1, p.start1, p.end1, p.file2, p.start2, p.end2]
+            if scores is not None:
+                row += [p.clone_type.value, f"{scores[i]:.4f}"]
+            elif with_type and p.clone_type != CloneType.UNKNOWN:
+                row.append(p.clone_type.value)
+            writer.writerow(row)
+            count += 1
+    return count
@@ -1,7 +1,14 @@
+from __future__ import annotations
+
 import difflib
 from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
 from .clone_type import CloneType
-from utils.file.file_cache import FileCache
+
+if TYPE_CHECKING:
+    # 只用于类型标注；运行时不导入，解析克隆对不会连带加载FileCache及其依赖
+    from utils.file.file_cache import FileCache
 
 
 @dataclass
@@ -50,11 +57,11 @@ class ClonePair:
             FileNotFoundError: 如果文件不存在或在缓存中找不到
         """
         if file_cache:
-            # 尝试从缓存中获取文件内容
-            content = file_cache.get_file(file_path)
+            # 尝试从缓存中获取片段；共享内存模式下直接在共享内存上按行切片，不取出整个文件
+            snippet = file_cache.get_snippet(file_path, start_line, end_line)
             
-            if content:
-                lines = content.splitlines(keepends=True)
+            if snippet is not None:
+                return snippet
             else:
                 # 查找缓存中最相似的文件路径
                 similar_paths = self._find_similar_paths(file_path, file_cache)
@@ -85,8 +92,8 @@ class ClonePair:
         Returns:
             list[str]: 最相似的文件路径列表
         """
-        # 获取缓存中所有的文件路径 - 使用正确的属性名'cache'
-        cache_paths = list(file_cache.cache.keys())
+        # 获取缓存中所有的文件路径
+        cache_paths = file_cache.get_all_files()
         
         # 计算相似度并排序
         similarities = [(path, difflib.SequenceMatcher(None, target_path, path).ratio()) for path in cache_paths]
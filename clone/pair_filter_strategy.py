@@ -4,9 +4,6 @@ from abc import ABC, abstractmethod
 from enum import Enum, auto
 from typing import Callable, Iterable, List
 
-from utils.java_code.function_validator import is_java_function
-from utils.file.file_cache import FileCache
-
 from .clone_pair import ClonePair
 
 
@@ -0,0 +1,197 @@
+import math
+from collections import Counter
+from dataclasses import dataclass
+from typing import Optional, Sequence, Tuple
+
+import javalang
+
+from utils.java_code.code_normalizer import code_tokens
+from utils.java_code.function_info import FunctionInfo
+
+
+@dataclass(frozen=True)
+class CodeFeatures:
+    tokens: frozenset
+    node_types: Counter
+    size: int
+
+
+def ast_node_histogram(code: str) -> Counter:
+    """
+    方法片段的AST节点类型直方图。片段包进一个类中解析；无法解析时退化为词法单元类别直方图，
+    仍能反映结构上的粗略差异。
+    """
+    try:
+        tree = javalang.parse.parse("class __Wrapper__ {\n" + code + "\n}")
+    except Exception:
+        histogram = Counter()
+        try:
+            for token in javalang.tokenizer.tokenize(code):
+                histogram[type(token).__name__] += 1
+        except Exception:
+            # 保留出错位置之前已经得到的词法单元
+            pass
+        return histogram
+    histogram = Counter(type(node).__name__ for _, node in tree)
+    # 去掉包装用的编译单元和类声明
+    histogram.subtract({"CompilationUnit": 1, "ClassDeclaration": 1})
+    return +histogram
+
+
+def extract_features(code: str) -> CodeFeatures:
+    tokens = code_tokens(code)
+    return CodeFeatures(frozenset(tokens), ast_node_histogram(code), len(tokens))
+
+
+def _cosine(a: Counter, b: Counter) -> float:
+    if not a or not b:
+        return 0.0
+    dot = sum(v * b.get(k, 0) for k, v in a.items())
+    return dot / (math.sqrt(sum(v * v for v in a.values())) * math.sqrt(sum(v * v for v in b.values())))
+
+
+def similarity(a: CodeFeatures, b: CodeFeatures, weights: Tuple[float, float, float] = (0.5, 0.3, 0.2)) -> float:
+    """
+    组合相似度，取值[0, 1]：词法单元集合Jaccard、AST节点类型直方图余弦相似度、规模比（小/大）的加权和。
+    """
+    union = len(a.tokens | b.tokens)
+    jac = len(a.tokens & b.tokens) / union if union else 1.0
+    size_ratio = min(a.size, b.size) / max(a.size, b.size) if max(a.size, b.size) else 1.0
+    w_jac, w_ast, w_size = weights
+    return w_jac * jac + w_ast * _cosine(a.node_types, b.node_types) + w_size * size_ratio
+
+
+class PreScreener:
+    """
+    LLM之前的本地打分级联：目标与候选代表函数的最高相似度低于 low 时直接判为非克隆，
+    不低于 high 时直接判为与最相似代表同类的克隆，其余的才交给LLM。
+    代表函数的特征只计算一次。
+    """
+
+    def __init__(self, low: float = 0.0, high: float = 1.01):
+        """
+        :param low: 低于该分数判为非克隆，0表示不启用
+        :param high: 不低于该分数判为克隆，大于1表示不启用
+        """
+        self.low = low
+        self.high = high
+        self._features = {}
+
+    def features(self, func: FunctionInfo) -> CodeFeatures:
+        key = (func.path, func.start_line, func.end_line)
+        feats = self._features.get(key)
+        if feats is None:
+            feats = self._features[key] = extract_features(func.code_snippet or "")
+        return feats
+
+    def best_match(self, target: FunctionInfo, representatives: Sequence[dict]) -> Tuple[float, Optional[int]]:
+        """返回 (最高相似度, 对应代表在列表中的下标)，没有代表时为 (0.0, None)。"""
+        target_feats = extract_features(target.code_snippet or "")
+        best, best_i = 0.0, None
+        for i, r in enumerate(representatives):
+            score = similarity(target_feats, self.features(r["function"]))
+            if score > best:
+                best, best_i = score, i
+        return best, best_i
+
+    def decide(self, target: FunctionInfo, representatives: Sequence[dict]) -> Tuple[Optional[bool], float, Optional[int]]:
+        """
+        :return: (判定, 最高分, 代表下标)。判定为True/False表示已由本地打分决定，None表示需要调用LLM
+        """
+        score, rep_i = self.best_match(target, representatives)
+        if score < self.low:
+            return False, score, rep_i
+        if rep_i is not None and score >= self.high:
+            return True, score, rep_i
+        return None, score, rep_i
+
+
+@dataclass
+class CalibrationReport:
+    low: float
+    high: float
+    samples: int
+    positives: int
+    skipped_as_non_clone: int
+    accepted_as_clone: int
+    missed_clones: int
+    false_clones: int  # 被直接判为克隆但判错的：不是克隆，或归入了错误的克隆类
+
+    @property
+    def calls_saved(self) -> int:
+        return self.skipped_as_non_clone + self.accepted_as_clone
+
+    @property
+    def accuracy_lost(self) -> float:
+        """相对于全部交给LLM（视为标注结果），被本地判错的样本比例。"""
+        return (self.missed_clones + self.false_clones) / self.samples if self.samples else 0.0
+
+    def format(self) -> str:
+        saved = self.calls_saved / self.samples * 100 if self.samples else 0.0
+        return (
+            f"Pre-screen calibration on {self.samples} labeled targets ({self.positives} clones):\n"
+            f"  low threshold  {self.low:.3f}: {self.skipped_as_non_clone} skipped as non-clones, "
+            f"{self.missed_clones} of them were clones\n"
+            f"  high threshold {self.high:.3f}: {self.accepted_as_clone} accepted as clones, "
+            f"{self.false_clones} of them wrong\n"
+            f"  LLM calls saved: {self.calls_saved} ({saved:.1f}%), accuracy lost: {self.accuracy_lost * 100:.2f}%"
+        )
+
+
+def calibrate(
+    scores: Sequence[float],
+    labels: Sequence[bool],
+    max_miss_rate: float = 0.02,
+    min_precision: float = 0.98,
+    accept_correct: Optional[Sequence[bool]] = None,
+) -> CalibrationReport:
+    """
+    在带标注的样本上选择阈值。
+
+    low取满足“被跳过的克隆不超过全部克隆的 max_miss_rate”的最大阈值；
+    high取满足“高于阈值的样本中判对的比例不低于 min_precision”的最小阈值，没有满足的则不启用。
+
+    :param scores: 每个样本的最高相似度
+    :param labels: 每个样本是否为克隆（如LLM或人工标注的结果）
+    :param accept_correct: 每个样本被high阈值直接判为克隆时是否判对，即不仅是克隆，而且最相似代表
+        所属的克隆类就是标注的克隆类。缺省时与 labels 相同（只要是克隆就算判对）
+    """
+    if accept_correct is None:
+        accept_correct = labels
+    pairs = sorted(zip(scores, labels, accept_correct))
+    n = len(pairs)
+    positives = sum(1 for _, y, _ in pairs if y)
+    allowed_misses = math.floor(max_miss_rate * positives)
+
+    # low：从低分往上扫，阈值取第一个“会多漏掉一个克隆”的分数
+    low, misses = 0.0, 0
+    for score, y, _ in pairs:
+        if y:
+            if misses + 1 > allowed_misses:
+                low = score
+                break
+            misses += 1
+    else:
+        low = pairs[-1][0] + 1e-9 if pairs else 0.0
+
+    # high：从高分往下扫，保持判对的比例不低于要求
+    high, tp, total = 1.01, 0, 0
+    for score, _, correct in reversed(pairs):
+        total += 1
+        tp += correct
+        if tp / total < min_precision:
+            break
+        high = score
+
+    skipped = [y for s, y, _ in pairs if s < low]
+    accepted = [correct for s, _, correct in pairs if s >= high and s >= low]
+    return CalibrationReport(
+        low=low,
+        high=high,
+        samples=n,
+        positives=positives,
+        skipped_as_non_clone=len(skipped),
+        accepted_as_clone=len(accepted),
+        missed_clones=sum(skipped),
+        false_clones=len(accepted) - sum(accepted),
+    )
@@ -0,0 +1,153 @@
+import hashlib
+import json
+import os
+import random
+from typing import Dict, FrozenSet, Iterable, List, Optional, Sequence, Tuple
+
+from utils.java_code.code_normalizer import code_tokens
+from utils.java_code.function_info import FunctionInfo
+from .clone_class import CloneClass
+
+# 目录格式或选择算法变化时递增，旧目录的指纹随之失效
+CATALOG_VERSION = 1
+
+
+def token_set(code: str) -> FrozenSet[str]:
+    """代码的词法单元集合（去掉注释和空白），用于廉价的相似度计算。"""
+    return frozenset(code_tokens(code))
+
+
+def jaccard(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def select_medoids(token_sets: Sequence[FrozenSet[str]], k: int = 1) -> List[int]:
+    """
+    在成员中贪心选择k个中心点（medoid）：第一个是与其余成员Jaccard相似度之和最大的成员，
+    之后每次加入使“各成员到最近中心点的相似度之和”增加最多的成员。
+
+    :return: 选中成员的下标，按选择顺序
+    """
+    n = len(token_sets)
+    if n == 0:
+        return []
+    k = min(k, n)
+    sim = [[1.0] * n for _ in range(n)]
+    for i in range(n):
+        for j in range(i + 1, n):
+            sim[i][j] = sim[j][i] = jaccard(token_sets[i], token_sets[j])
+
+    chosen: List[int] = []
+    best = [0.0] * n  # 每个成员到已选中心点的最大相似度
+    for _ in range(k):
+        gain, pick = -1.0, None
+        for c in range(n):
+            if c in chosen:
+                continue
+            g = sum(max(0.0, sim[c][m] - best[m]) for m in range(n))
+            if g > gain:
+                gain, pick = g, c
+        chosen.append(pick)
+        best = [max(best[m], sim[pick][m]) for m in range(n)]
+    return chosen
+
+
+class FunctionResolver:
+    """
+    把克隆对中的 (文件, 起始行, 结束行) 解析为函数ID。
+
+    先按 (文件名, 起始行, 结束行) 精确查找，未命中时只在起止行相同的少数函数中按路径后缀匹配，
+    不再扫描整个函数索引。
+    """
+
+    def __init__(self, functions: Sequence[FunctionInfo]):
+        self.by_name: Dict[Tuple[str, int, int], int] = {}
+        self.by_lines: Dict[Tuple[int, int], List[int]] = {}
+        for i, f in enumerate(functions):
+            self.by_name.setdefault((f.filename, f.start_line, f.end_line), i)
+            self.by_lines.setdefault((f.start_line, f.end_line), []).append(i)
+        self.functions = functions
+
+    def resolve(self, file_path: str, start: int, end: int) -> Optional[int]:
+        i = self.by_name.get((os.path.basename(file_path), start, end))
+        if i is not None:
+            return i
+        for i in self.by_lines.get((start, end), ()):
+            if file_path.endswith(self.functions[i].filename):
+                return i
+        return None
+
+    def class_members(self, clone_class: CloneClass) -> List[int]:
+        """克隆类中能解析到的函数ID，去重并保持出现顺序。"""
+        members: Dict[int, None] = {}
+        for p in clone_class.clone_pairs:
+            for file_path, start, end in ((p.file1, p.start1, p.end1), (p.file2, p.start2, p.end2)):
+                i = self.resolve(file_path, start, end)
+                if i is not None:
+                    members.setdefault(i)
+        return list(members)
+
+
+def build_catalog(
+    clone_classes: Sequence[CloneClass],
+    functions: Sequence[FunctionInfo],
+    medoids_per_class: int = 1,
+    sample_size: int = 64,
+    seed: int = 0,
+) -> Dict[int, List[int]]:
+    """
+    为每个克隆类选择代表函数。
+
+    :param medoids_per_class: 每个克隆类的代表函数数
+    :param sample_size: 成员数超过该值时先随机抽样，控制两两相似度的计算量
+    :param seed: 抽样随机种子，同样的输入得到同样的目录
+    :return: 克隆类ID（从1开始，与克隆类列表顺序对应）-> 代表函数ID列表
+    """
+    resolver = FunctionResolver(functions)
+    rng = random.Random(seed)
+    catalog: Dict[int, List[int]] = {}
+    for class_id, clone_class in enumerate(clone_classes, start=1):
+        members = resolver.class_members(clone_class)
+        if not members:
+            continue
+        if len(members) > sample_size:
+            members = rng.sample(members, sample_size)
+        sets = [token_set(functions[i].code_snippet or "") for i in members]
+        catalog[class_id] = [members[j] for j in select_medoids(sets, medoids_per_class)]
+    return catalog
+
+
+def input_fingerprint(paths: Iterable[str], **params) -> str:
+    """
+    由输入文件的路径、大小、修改时间和选择参数计算指纹。只读文件元数据，不读内容，
+    因此校验目录是否过期几乎没有开销。
+    """
+    h = hashlib.sha256()
+    for path in paths:
+        stat = os.stat(path)
+        h.update(f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}\n".encode("utf-8"))
+    h.update(json.dumps({"version": CATALOG_VERSION, **params}, sort_keys=True).encode("utf-8"))
+    return h.hexdigest()
+
+
+def save_catalog(path: str, catalog: Dict[int, List[int]], fingerprint: str):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"fingerprint": fingerprint, "classes": {str(k): v for k, v in catalog.items()}}, f)
+    os.replace(tmp, path)
+
+
+def load_catalog(path: str, fingerprint: Optional[str] = None) -> Optional[Dict[int, List[int]]]:
+    """
+    读取代表函数目录。文件不存在，或给出的指纹与保存时不一致（输入已变化）时返回None。
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if fingerprint is not None and data.get("fingerprint") != fingerprint:
+        return None
+    return {int(k): v for k, v in data["classes"].items()}
@@ -0,0 +1,218 @@
+import argparse
+import concurrent.futures
+import math
+from collections import Counter
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import javalang
+
+from utils.java_code.code_normalizer import code_tokens
+from utils.java_code.function_info import FunctionInfo
+from .clone_pair import ClonePair
+from .clone_type import CloneType
+
+# 分隔符和运算符几乎出现在每个函数中，对区分克隆没有帮助
+_SKIPPED_TOKEN_TYPES = (javalang.tokenizer.Separator, javalang.tokenizer.Operator)
+
+
+def block_tokens(code: str, ngram: int = 1) -> List[str]:
+    """
+    函数体的词袋：标识符、关键字和字面量（不含分隔符和运算符），ngram>1时取连续n个词法单元组成的n-gram。
+    """
+    try:
+        tokens = [t.value for t in javalang.tokenizer.tokenize(code) if not isinstance(t, _SKIPPED_TOKEN_TYPES)]
+    except (javalang.tokenizer.LexerError, TypeError):
+        tokens = code_tokens(code)
+    if ngram > 1:
+        tokens = [" ".join(tokens[i:i + ngram]) for i in range(len(tokens) - ngram + 1)]
+    return tokens
+
+
+def build_blocks(
+    functions: Sequence[FunctionInfo], ngram: int = 1, min_tokens: int = 10
+) -> Tuple[List[int], List[List[int]]]:
+    """
+    把函数转换为按全局词频升序（稀有在前）排序的整数词袋。
+
+    :return: (函数ID列表, 对应的排序后词袋)，少于 min_tokens 个词法单元的函数被跳过
+    """
+    bags = []
+    ids = []
+    frequency: Counter = Counter()
+    for i, f in enumerate(functions):
+        tokens = block_tokens(f.code_snippet or "", ngram)
+        if len(tokens) < min_tokens:
+            continue
+        ids.append(i)
+        bags.append(tokens)
+        frequency.update(set(tokens))
+
+    # 全局词频排序：出现在越少函数中的词排名越靠前，前缀因此由最有区分度的词组成
+    rank = {token: r for r, (token, _) in enumerate(sorted(frequency.items(), key=lambda kv: (kv[1], kv[0])))}
+    blocks = [sorted(rank[t] for t in bag) for bag in bags]
+    return ids, blocks
+
+
+def _prefix_length(size: int, threshold: float) -> int:
+    return size - math.ceil(threshold * size) + 1
+
+
+def _overlap(a: List[int], b: List[int], needed: int) -> int:
+    """两个排序词袋的多重集交集大小；确定达不到needed时提前返回已计数的值。"""
+    i = j = common = 0
+    while i < len(a) and j < len(b):
+        if common + min(len(a) - i, len(b) - j) < needed:
+            return common
+        if a[i] == b[j]:
+            common += 1
+            i += 1
+            j += 1
+        elif a[i] < b[j]:
+            i += 1
+        else:
+            j += 1
+    return common
+
+
+_BLOCKS: List[List[int]] = []
+
+
+def _init_worker(blocks: List[List[int]]):
+    global _BLOCKS
+    _BLOCKS = blocks
+
+
+def _search_partition(lo: int, hi: int, threshold: float, batch_size: int = 256) -> List[Tuple[int, int, float]]:
+    """
+    为下标在 [lo, hi) 内的词袋建前缀倒排索引，用下标更大的所有词袋查询，返回 (i, j, 重叠得分)，i < j。
+    每个克隆对恰好由包含较小下标的分区找到一次。
+    """
+    blocks = _BLOCKS
+    index: Dict[int, List[Tuple[int, int]]] = {}
+    for b in range(lo, hi):
+        block = blocks[b]
+        seen = set()
+        for pos in range(_prefix_length(len(block), threshold)):
+            token = block[pos]
+            if token not in seen:
+                seen.add(token)
+                index.setdefault(token, []).append((b, pos))
+
+    results: List[Tuple[int, int, float]] = []
+    pending: List[Tuple[int, int, int]] = []
+
+    def verify():
+        # 候选对攒成一批再逐个核实，核实时可以提前终止
+        for q, c, needed in pending:
+            common = _overlap(blocks[q], blocks[c], needed)
+            if common >= needed:
+                results.append((c, q, common / max(len(blocks[q]), len(blocks[c]))))
+        pending.clear()
+
+    for q in range(lo + 1, len(blocks)):
+        query = blocks[q]
+        size_q = len(query)
+        min_size = math.ceil(threshold * size_q)
+        max_size = size_q / threshold
+        counts: Dict[int, int] = {}
+        for i in range(_prefix_length(size_q, threshold)):
+            for c, j in index.get(query[i], ()):
+                if c >= q:
+                    continue
+                size_c = len(blocks[c])
+                if size_c < min_size or size_c > max_size:
+                    continue
+                needed = math.ceil(threshold * max(size_q, size_c))
+                count = counts.get(c, 0)
+                if count < 0:
+                    continue
+                # 位置过滤：即使剩余部分全部匹配也达不到要求的候选直接丢弃
+                if count + 1 + min(size_q - i - 1, size_c - j - 1) < needed:
+                    counts[c] = -1
+                    continue
+                counts[c] = count + 1
+        for c, count in counts.items():
+            if count > 0:
+                pending.append((q, c, math.ceil(threshold * max(size_q, len(blocks[c])))))
+        if len(pending) >= batch_size:
+            verify()
+    verify()
+    return results
+
+
+def find_near_miss_clones(
+    functions: Sequence[FunctionInfo],
+    threshold: float = 0.7,
+    ngram: int = 1,
+    min_tokens: int = 10,
+    workers: int = 1,
+    partitions: Optional[int] = None,
+) -> List[Tuple[int, int, float]]:
+    """
+    SourcererCC风格的Type-3候选检测：按全局词频排序的词袋、前缀过滤、带规模剪枝的倒排索引，批量核实。
+
+    :param threshold: 重叠相似度阈值，overlap / max(|A|, |B|)
+    :param ngram: 词袋中n-gram的长度
+    :param min_tokens: 少于该数量词法单元的函数不参与
+    :param workers: 进程数，每个进程负责倒排索引的一个分区
+    :param partitions: 分区数，默认等于 workers
+    :return: (函数ID, 函数ID, 得分) 列表
+    """
+    ids, blocks = build_blocks(functions, ngram, min_tokens)
+    n = len(blocks)
+    partitions = max(1, min(partitions or workers, n or 1))
+    # 下标靠前的分区要查询的词袋更多，按 1 - sqrt 切分使各分区工作量大致相当
+    bounds = sorted({round(n * (1 - math.sqrt(1 - k / partitions))) for k in range(partitions + 1)})
+
+    raw: List[Tuple[int, int, float]] = []
+    if workers <= 1:
+        _init_worker(blocks)
+        for lo, hi in zip(bounds, bounds[1:]):
+            raw.extend(_search_partition(lo, hi, threshold))
+    else:
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker, initargs=(blocks,)
+        ) as executor:
+            futures = [executor.submit(_search_partition, lo, hi, threshold) for lo, hi in zip(bounds, bounds[1:])]
+            for future in futures:
+                raw.extend(future.result())
+    return sorted((ids[a], ids[b], score) for a, b, score in raw)
+
+
+def to_clone_pairs(functions: Sequence[FunctionInfo], matches: Sequence[Tuple[int, int, float]]) -> List[ClonePair]:
+    pairs = []
+    for a, b, _ in matches:
+        fa, fb = functions[a], functions[b]
+        pairs.append(ClonePair(
+            file1=fa.path, start1=fa.start_line, end1=fa.end_line,
+            file2=fb.path, start2=fb.start_line, end2=fb.end_line,
+            clone_type=CloneType.TYPE_3,
+        ))
+    return pairs
+
+
+def main(argv=None):
+    from clone.clone_csv import write_clone_pairs_csv
+    from utils.file.file_io import read_functions_from_disk
+
+    parser = argparse.ArgumentParser(description="Generate Type-3 clone candidates with a SourcererCC-style index")
+    parser.add_argument("--functions", required=True, help="functions.pkl path")
+    parser.add_argument("--out", required=True, help="输出CSV路径（CloneClassParser格式，附带得分列）")
+    parser.add_argument("--threshold", type=float, default=0.7)
+    parser.add_argument("--ngram", type=int, default=1)
+    parser.add_argument("--min-tokens", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--partitions", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    functions = read_functions_from_disk(args.functions)
+    matches = find_near_miss_clones(
+        functions, threshold=args.threshold, ngram=args.ngram, min_tokens=args.min_tokens,
+        workers=args.workers, partitions=args.partitions,
+    )
+    count = write_clone_pairs_csv(to_clone_pairs(functions, matches), args.out, scores=[m[2] for m in matches])
+    print(f"Wrote {count} Type-3 candidate pairs to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
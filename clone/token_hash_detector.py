@@ -0,0 +1,151 @@
+import argparse
+import concurrent.futures
+import hashlib
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import javalang
+
+from utils.java_code.code_normalizer import code_tokens
+from utils.java_code.function_info import FunctionInfo
+from .clone_class import CloneClass
+from .clone_pair import ClonePair
+from .clone_type import CloneType
+
+_LITERAL_TYPES = (
+    javalang.tokenizer.Literal,
+    javalang.tokenizer.Boolean,
+    javalang.tokenizer.Null,
+)
+
+
+def _digest(tokens: Sequence[str]) -> str:
+    return hashlib.blake2b(" ".join(tokens).encode("utf-8"), digest_size=16).hexdigest()
+
+
+def token_hashes(code: str) -> Optional[Tuple[str, str, int]]:
+    """
+    计算一个函数的两种哈希：
+
+    - Type-1哈希：原始词法单元序列（只忽略空白和注释）
+    - Type-2哈希：标识符统一替换为 $id、字面量统一替换为 $lit 后的序列
+
+    :return: (type1哈希, type2哈希, 词法单元数)，无法词法分析时返回None
+    """
+    if not code:
+        return None
+    try:
+        tokens = list(javalang.tokenizer.tokenize(code))
+    except (javalang.tokenizer.LexerError, TypeError):
+        # 无法词法分析的片段只参与Type-1（退化的按空白切分）比较
+        raw = code_tokens(code)
+        digest = _digest(raw)
+        return digest, "raw:" + digest, len(raw)
+
+    raw = [t.value for t in tokens]
+    normalized = []
+    for t in tokens:
+        if isinstance(t, javalang.tokenizer.Identifier):
+            normalized.append("$id")
+        elif isinstance(t, _LITERAL_TYPES):
+            normalized.append("$lit")
+        else:
+            normalized.append(t.value)
+    return _digest(raw), _digest(normalized), len(tokens)
+
+
+def _hash_many(codes: List[str]) -> List[Optional[Tuple[str, str, int]]]:
+    return [token_hashes(code) for code in codes]
+
+
+def compute_hashes(
+    functions: Sequence[FunctionInfo], workers: int = 1, chunk_size: int = 2000
+) -> List[Optional[Tuple[str, str, int]]]:
+    """为所有函数计算哈希，workers>1时按块分发到多个进程。"""
+    codes = [f.code_snippet or "" for f in functions]
+    if workers <= 1:
+        return _hash_many(codes)
+    chunks = [codes[i:i + chunk_size] for i in range(0, len(codes), chunk_size)]
+    results: List[Optional[Tuple[str, str, int]]] = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        for part in executor.map(_hash_many, chunks):
+            results.extend(part)
+    return results
+
+
+def _pair(a: FunctionInfo, b: FunctionInfo, clone_type: CloneType) -> ClonePair:
+    return ClonePair(
+        file1=a.path, start1=a.start_line, end1=a.end_line,
+        file2=b.path, start2=b.start_line, end2=b.end_line,
+        clone_type=clone_type,
+    )
+
+
+def detect_exact_clones(
+    functions: Sequence[FunctionInfo],
+    min_tokens: int = 10,
+    workers: int = 1,
+    hashes: Optional[List[Optional[Tuple[str, str, int]]]] = None,
+) -> List[CloneClass]:
+    """
+    检测Type-1/Type-2克隆：按Type-2哈希一次分组，组内成员不少于2个即为一个克隆类。
+
+    组内所有成员Type-1哈希相同时克隆类为TYPE_1，否则为TYPE_2。每个克隆类以第一个成员为中心
+    生成 n-1 个克隆对（足以让 CloneClassParser 还原出同一个克隆类），克隆对的类型按两端的
+    Type-1哈希是否相同分别标注。
+
+    :param min_tokens: 少于该词法单元数的函数（如getter/setter）不参与检测
+    :param workers: 计算哈希的进程数
+    :param hashes: 预先算好的 compute_hashes() 结果
+    """
+    if hashes is None:
+        hashes = compute_hashes(functions, workers=workers)
+
+    groups: Dict[str, List[int]] = {}
+    for i, h in enumerate(hashes):
+        if h is None or h[2] < min_tokens:
+            continue
+        groups.setdefault(h[1], []).append(i)
+
+    clone_classes = []
+    for members in groups.values():
+        if len(members) < 2:
+            continue
+        # Type-1子组排在前面，中心取最大的Type-1子组中的成员，使尽量多的克隆对是Type-1
+        t1_counts: Dict[str, int] = {}
+        for i in members:
+            t1_counts[hashes[i][0]] = t1_counts.get(hashes[i][0], 0) + 1
+        members.sort(key=lambda i: -t1_counts[hashes[i][0]])
+        center = members[0]
+        pairs = [
+            _pair(
+                functions[center], functions[i],
+                CloneType.TYPE_1 if hashes[i][0] == hashes[center][0] else CloneType.TYPE_2,
+            )
+            for i in members[1:]
+        ]
+        clone_type = CloneType.TYPE_1 if len(t1_counts) == 1 else CloneType.TYPE_2
+        clone_classes.append(CloneClass(clone_pairs=pairs, clone_type=clone_type))
+    return clone_classes
+
+
+def main(argv=None):
+    from clone.clone_csv import write_clone_pairs_csv
+    from utils.file.file_io import read_functions_from_disk
+
+    parser = argparse.ArgumentParser(description="Detect Type-1/Type-2 clones by normalized token hashing")
+    parser.add_argument("--functions", required=True, help="functions.pkl path")
+    parser.add_argument("--out", required=True, help="输出CSV路径（CloneClassParser格式）")
+    parser.add_argument("--min-tokens", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    functions = read_functions_from_disk(args.functions)
+    clone_classes = detect_exact_clones(functions, min_tokens=args.min_tokens, workers=args.workers)
+    count = write_clone_pairs_csv((p for cc in clone_classes for p in cc.clone_pairs), args.out)
+    type1 = sum(1 for cc in clone_classes if cc.clone_type == CloneType.TYPE_1)
+    print(f"Found {len(clone_classes)} clone classes ({type1} Type-1, {len(clone_classes) - type1} Type-2), "
+          f"wrote {count} clone pairs to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
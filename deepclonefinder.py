@@ -0,0 +1,44 @@
+import argparse
+import importlib
+import sys
+from typing import List, Optional
+
+# 子命令 -> (实现该子命令的模块, 说明)。模块在子命令被选中时才导入，
+# 因此 --help 和导入本文件都不会加载 javalang、numpy、httpx、zai 等依赖
+COMMANDS = {
+    "extract": ("get_all_functions", "提取数据集中的所有Java函数，写出 functions.pkl"),
+    "parse-classes": ("parse_clone_class", "由克隆对CSV求克隆类，写出 clone_classes.pkl 和 function_index.pkl"),
+    "prompts": ("generate_prompts", "为待检测函数生成提示词并调用LLM判断克隆"),
+    "embed": ("embed_functions", "计算函数的向量表示"),
+    "summarize": ("utils.llm.clone_class_summary", "通过批处理接口为克隆类生成摘要"),
+    "stats": ("utils.file.corpus_stats", "统计语料的文件数、行数、字节数和每文件方法数"),
+    "merge": ("merge_shards", "合并分片运行的输出"),
+    "evaluate": ("clone.bigclone_eval", "按BigCloneEval规则评估检测结果"),
+}
+
+
+def build_parser() -> argparse.ArgumentParser:
+    commands = "\n".join(f"  {name:<14} {help_text}" for name, (_, help_text) in COMMANDS.items())
+    parser = argparse.ArgumentParser(
+        prog="deepclonefinder",
+        description="DeepCloneFinder command line",
+        epilog=f"commands:\n{commands}\n\n各子命令的参数见 deepclonefinder <command> --help",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("command", choices=list(COMMANDS), metavar="command", help="要运行的子命令，见下表")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None):
+    """
+    解析子命令名后导入对应模块，把其余参数原样交给该模块的 main(argv)。
+    """
+    argv = sys.argv[1:] if argv is None else list(argv)
+    # 只解析第一个参数：子命令名、-h 或缺省时由 argparse 给出用法
+    args = build_parser().parse_args(argv[:1])
+    module_name, _ = COMMANDS[args.command]
+    return importlib.import_module(module_name).main(argv[1:])
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,48 @@
-import pickle
-from transformers import AutoModel, AutoTokenizer
-from tqdm.auto import tqdm
+import argparse
+from typing import List, Optional
 
-if __name__ == "__main__":
-    
-    checkpoint = "codet5p-110m-embedding"
-    device = "cuda"  # for GPU usage or "cpu" for CPU usage
+from utils.embedding.batch_embedder import TransformersEncoder, embed_to_store
+from utils.embedding.embedding_cache import EmbeddingCache
+from utils.file.file_io import read_functions_from_disk
+from utils.java_code.code_normalizer import code_hash
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Embed all extracted functions into a float16 .npy aligned to function IDs")
+    parser.add_argument("--functions", default="functions.pkl", help="functions.pkl path")
+    parser.add_argument("--out", default="embeddings.npy", help="output .npy path (row i = function i)")
+    parser.add_argument("--checkpoint", default="codet5p-110m-embedding")
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--threads", type=int, default=None, help="torch CPU threads")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--max-length", type=int, default=512, help="truncate snippets to this many tokens")
+    parser.add_argument("--max-batch-tokens", type=int, default=None, help="cap padded tokens per batch")
+    parser.add_argument("--cache", default="embedding_cache.sqlite", help="persistent embedding cache keyed by code hash")
+    parser.add_argument("--no-cache", action="store_true", help="embed without reading or writing the cache")
+    args = parser.parse_args(argv)
 
-    tokenizer = AutoTokenizer.from_pretrained(checkpoint, trust_remote_code=True)
-    model = AutoModel.from_pretrained(checkpoint, trust_remote_code=True).to(device)
+    encoder = TransformersEncoder(args.checkpoint, device=args.device, threads=args.threads, max_length=args.max_length)
+    functions = read_functions_from_disk(args.functions)
+    texts = [func.code_snippet or "" for func in functions]
+    # 仅空白或注释不同的片段哈希相同，只嵌入一次
+    keys = [code_hash(text) for text in texts]
+    cache = None if args.no_cache else EmbeddingCache(args.cache)
 
-    with open("functions.pkl", 'rb') as f:
-        functions = pickle.load(f)
-        
-    for func in tqdm(functions, desc="Embedding functions"):
-        inputs = tokenizer.encode(func.code_snippet, return_tensors="pt").to(device)
-        embedding = model(inputs)[0]
-        func.embedding = embedding
-    
-    with open("functions.pkl", 'wb') as f:
-        pickle.dump(functions, f)
+    matrix = embed_to_store(
+        texts,
+        args.out,
+        encode=encoder.encode,
+        token_lengths=encoder.token_lengths,
+        batch_size=args.batch_size,
+        max_batch_tokens=args.max_batch_tokens,
+        tag=f"{args.checkpoint}:{args.max_length}",
+        keys=keys,
+        cache=cache,
+    )
+    if cache is not None:
+        cache.close()
+    print(f"Wrote {matrix.shape[0]} embeddings of dim {matrix.shape[1]} to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,46 @@
 from __future__ import annotations
 
 import argparse
+import hashlib
 import json
 import os
 import re
-import threading
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from typing import List, Optional, Dict, Tuple
+from concurrent.futures import FIRST_COMPLETED, Executor, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Callable, Iterable, Iterator, List, Optional, Dict, Tuple, TypeVar
 
+import numpy as np
+
+from utils.embedding.batch_embedder import load_embeddings
+from utils.embedding.vector_index import VectorIndex, as_vector
 from utils.file.file_io import read_functions_from_disk
-from utils.java_code.function_extract import FunctionInfo
-from clone.clone_class_parser import parse_clone_classes_from_csv
+from utils.file.sharding import Shard
+from utils.file.jsonl_journal import JsonlJournal, load_journal
+from utils.llm.accounting import BudgetExceededError, UsageLedger, load_price_table
+from utils.llm.llm_client import (
+    PROVIDERS,
+    chat_sync,
+    close_all_clients,
+    configure_provider,
+    set_response_cache,
+    set_usage_ledger,
+)
+from utils.llm.response_cache import ResponseCache
+from utils.llm.token_counter import estimate_tokens
+from utils.java_code.code_compactor import CompactionStats, compact_code_cached
+from utils.java_code.code_normalizer import code_hash
+from utils.java_code.function_info import FunctionInfo
+from clone.clone_class_parser import CloneClassParser
+from clone.prescreen import CalibrationReport, PreScreener, calibrate
+from clone.representative_catalog import (
+    build_catalog, input_fingerprint, load_catalog, save_catalog,
+)
 from clone.clone_class import CloneClass
 from clone.clone_pair import ClonePair
 
+T = TypeVar("T")
+R = TypeVar("R")
+
 # -----------------------------
 # 数据结构
 # -----------------------------
@@ -34,51 +61,140 @@ class _Cls:
 # 解析克隆类（使用 parse_clone_class.py 接口）
 # -----------------------------
 def read_clone_classes_from_csv(filepath: str) -> List[CloneClass]:
-    """使用 parse_clone_class.py 接口解析克隆类"""
-    return parse_clone_classes_from_csv(filepath, "utf-8")
+    """使用 CloneClassParser 解析克隆类"""
+    return CloneClassParser(filepath, "utf-8").parse()
+
+# -----------------------------
+# 代表函数（见 clone/representative_catalog.py）
+# -----------------------------
+def load_or_build_representatives(
+    functions: List[FunctionInfo],
+    functions_pkl: str,
+    clone_csv: str,
+    catalog_path: Optional[str] = None,
+    medoids_per_class: int = 1,
+    sample_size: int = 64,
+) -> List[dict]:
+    """
+    返回代表函数列表 [{"class_id", "function"}]。
+
+    提供 catalog_path 且其中的指纹与当前输入（functions.pkl、克隆类CSV及选择参数）一致时直接加载，
+    连克隆类CSV都不必解析；否则解析克隆类、为每个类选出medoid并保存目录。
+    """
+    params = {"medoids_per_class": medoids_per_class, "sample_size": sample_size}
+    fingerprint = input_fingerprint([functions_pkl, clone_csv], **params)
+    catalog = load_catalog(catalog_path, fingerprint) if catalog_path else None
+    if catalog is not None:
+        print(f"Loaded representative catalog from {catalog_path}.")
+    else:
+        print(f"Loading clone classes from {clone_csv}...")
+        clone_classes = read_clone_classes_from_csv(clone_csv)
+        print(f"Loaded {len(clone_classes)} clone classes.")
+        catalog = build_catalog(clone_classes, functions, **params)
+        if catalog_path:
+            save_catalog(catalog_path, catalog, fingerprint)
+            print(f"Saved representative catalog to {catalog_path}.")
+
+    return [
+        {"class_id": class_id, "function": functions[func_id]}
+        for class_id in sorted(catalog)
+        for func_id in catalog[class_id]
+    ]
+
+def first_classes(representatives: List[dict], max_classes: int) -> List[dict]:
+    """
+    只保留前 max_classes 个克隆类（按类ID）的代表函数，每个类的全部medoid都保留。
+    """
+    kept = set(sorted({r["class_id"] for r in representatives})[:max_classes])
+    return [r for r in representatives if r["class_id"] in kept]
 
 # -----------------------------
-# 函数索引
+# 代表函数向量检索
 # -----------------------------
-def build_index(functions: List[FunctionInfo]) -> Dict[Tuple[str, int, int], FunctionInfo]:
-    """构建函数索引，用于快速查找函数信息"""
-    idx: Dict[Tuple[str, int, int], FunctionInfo] = {}
-    for f in functions:
-        key = (f.filename, f.start_line, f.end_line)
-        idx[key] = f
-    return idx
-
-def find_function_info(
-    index: Dict[Tuple[str, int, int], FunctionInfo], file_path: str, start: int, end: int
-) -> Optional[FunctionInfo]:
-    """根据文件路径和行号查找函数信息"""
-    basename = os.path.basename(file_path)
-    key = (basename, start, end)
-    if key in index:
-        return index[key]
-
-    for (fn, s, e), finfo in index.items():
-        if s == start and e == end and file_path.endswith(fn):
-            return finfo
-    return None
-
-def pick_representative_for_clone_class(
-    clone_class: CloneClass, index: Dict[Tuple[str, int, int], FunctionInfo]
-) -> Optional[FunctionInfo]:
-    """为克隆类选择代表函数，选择最短的函数作为代表"""
-    candidates: List[FunctionInfo] = []
-    for p in clone_class.clone_pairs:
-        f1 = find_function_info(index, p.file1, p.start1, p.end1)
-        f2 = find_function_info(index, p.file2, p.start2, p.end2)
-        if f1: candidates.append(f1)
-        if f2: candidates.append(f2)
-
-    if not candidates:
+def make_embedding_lookup(
+    functions: List[FunctionInfo], embeddings_path: Optional[str] = None
+) -> Callable[[FunctionInfo], Optional[np.ndarray]]:
+    """
+    返回 函数 -> 嵌入向量 的查找函数。
+
+    提供 embeddings_path 时从 embed_functions.py 写出的 .npy（行号即函数ID）中读取，
+    全零行视为尚未嵌入；否则回退到旧版 functions.pkl 中的 FunctionInfo.embedding。
+    """
+    if not embeddings_path:
+        return lambda func: as_vector(func.embedding)
+
+    matrix = load_embeddings(embeddings_path)
+    if len(matrix) != len(functions):
+        raise ValueError(f"{embeddings_path} has {len(matrix)} rows but there are {len(functions)} functions")
+    func_ids = {(f.path, f.start_line, f.end_line): i for i, f in enumerate(functions)}
+
+    def lookup(func: FunctionInfo):
+        i = func_ids.get((func.path, func.start_line, func.end_line))
+        if i is None or not matrix[i].any():
+            return None
+        return as_vector(matrix[i])
+
+    return lookup
+
+def load_or_build_rep_index(
+    representatives: List[dict],
+    index_dir: str,
+    embedding_of: Callable[[FunctionInfo], Optional[np.ndarray]],
+    nlist: int = 0,
+    nprobe: int = 8,
+) -> Optional[VectorIndex]:
+    """
+    加载代表函数向量索引。索引目录中记录的指纹（代表函数的类别标签和嵌入，以及 nlist）与当前不一致时，
+    例如代表目录或 max_reps 变化后，重新构建并覆盖保存，不会沿用返回错误类别的旧索引。
+    """
+    vectors, labels = [], []
+    for r in representatives:
+        vec = embedding_of(r["function"])
+        if vec is not None:
+            vectors.append(vec)
+            labels.append(r["class_id"])
+    if not vectors:
+        print("WARNING: representatives have no embeddings, retrieval disabled")
         return None
 
-    # 按代码长度+行跨度选择最短的函数作为代表
-    candidates.sort(key=lambda fi: (len(fi.code_snippet or ""), fi.end_line - fi.start_line))
-    return candidates[0]
+    digest = hashlib.sha256(json.dumps({"labels": labels, "nlist": nlist}).encode("utf-8"))
+    for vec in vectors:
+        digest.update(np.ascontiguousarray(vec, dtype=np.float32).tobytes())
+    fingerprint = digest.hexdigest()
+    stored = VectorIndex.stored_fingerprint(index_dir)
+    if stored == fingerprint:
+        return VectorIndex.load(index_dir, nprobe=nprobe)
+    if os.path.exists(os.path.join(index_dir, "meta.json")):
+        print(f"Representative index in {index_dir} does not match the current representatives, rebuilding.")
+
+    rep_index = VectorIndex.build(vectors, labels, nlist=nlist, nprobe=nprobe)
+    rep_index.save(index_dir, fingerprint=fingerprint)
+    return rep_index
+
+def select_candidate_representatives(
+    rep_index: VectorIndex,
+    targets: List[Tuple[int, FunctionInfo]],
+    representatives: List[dict],
+    top_k: int,
+    embedding_of: Callable[[FunctionInfo], Optional[np.ndarray]],
+) -> Dict[int, List[dict]]:
+    """为每个有嵌入的目标函数检索 top-k 个候选克隆类，返回 目标ID -> 候选代表函数列表。"""
+    rep_by_class: Dict[int, List[dict]] = {}
+    for r in representatives:
+        rep_by_class.setdefault(r["class_id"], []).append(r)
+    ids, vectors = [], []
+    for idx, target in targets:
+        vec = embedding_of(target)
+        if vec is not None and len(vec) == rep_index.dim:
+            ids.append(idx)
+            vectors.append(vec)
+    if not vectors:
+        return {}
+
+    candidates: Dict[int, List[dict]] = {}
+    for idx, class_ids in zip(ids, rep_index.top_classes(vectors, k=top_k)):
+        candidates[idx] = [r for c in class_ids for r in rep_by_class.get(c, ())]
+    return candidates
 
 # -----------------------------
 # 提示词构建
@@ -100,71 +216,233 @@ def truncate_code(code: str, max_chars: int = 2000) -> str:
     out.append("/* TRUNCATED */")
     return "\n".join(out)
 
-PROMPT_TEMPLATE = (
+# 提示词布局：静态说明和代表函数目录在前，逐次变化的目标内容在最后。
+# 代表函数列表相同的调用因此共享同一个长前缀，可以命中服务商侧的提示词缓存（prefix caching）。
+PROMPT_PREFIX_TEMPLATE = (
     "You are a precise code clone detection assistant.\n"
-    "You will be given a TARGET Java function and a list of REPRESENTATIVE functions.\n"
+    "You will be given a list of REPRESENTATIVE Java functions, followed by the TARGET function(s) to judge.\n"
     "Each representative corresponds to a clone class (i.e., a group of functions considered clones of each other).\n"
-    "Your job: determine whether the TARGET function is a clone of any of the provided representatives.\n"
     "Definitions and expectations:\n"
-    "  - \"Clone\" may be syntactic or semantic. Be conservative if unsure.\n"
+    "  - \"Clone\" may be syntactic or semantic. Be conservative if unsure.\n\n"
+    "REPRESENTATIVE FUNCTIONS:\n{rep_block}\n\n"
+)
+
+PROMPT_TEMPLATE = PROMPT_PREFIX_TEMPLATE + (
+    "Your job: determine whether the TARGET function is a clone of any of the representatives above.\n"
     "Output EXACTLY one JSON object:\n"
     "{{ \"is_clone\": true|false, \"matched_rep_id\": int|null, \"confidence\": float, \"reason\": string }}\n\n"
-    "TARGET FUNCTION (metadata + code):\n{target_block}\n\n"
-    "REPRESENTATIVE FUNCTIONS:\n{rep_block}\n"
+    "TARGET FUNCTION (metadata + code):\n{target_block}\n"
 )
 
-def build_prompt(target: FunctionInfo, representatives: List[dict], max_code_chars: int = 2000) -> str:
-    target_block = json.dumps({
-        "filename": target.filename,
-        "subdirectory": target.subdirectory,
-        "start_line": target.start_line,
-        "end_line": target.end_line,
-        "code": truncate_code(target.code_snippet or "", max_chars=max_code_chars),
-    }, indent=2)
+PACKED_PROMPT_TEMPLATE = PROMPT_PREFIX_TEMPLATE + (
+    "Your job: for EACH target, determine whether it is a clone of any of the representatives above.\n"
+    "Judge every target independently of the other targets.\n"
+    "Output EXACTLY one JSON object with one entry per target_id:\n"
+    "{{ \"results\": {{ \"<target_id>\": {{ \"is_clone\": true|false, \"matched_rep_id\": int|null, "
+    "\"confidence\": float, \"reason\": string }} }} }}\n\n"
+    "TARGET FUNCTIONS (metadata + code):\n{target_block}\n"
+)
+
+# 默认的单次提示词 token 上限（输入 + 预留输出），超过时把代表函数列表拆成多块分别判定
+DEFAULT_MAX_PROMPT_TOKENS = 24000
+
+# 单目标调用为输出预留的 token 数
+SINGLE_RESULT_TOKENS = 1024
 
-    rep_list = []
+# 打包模式下为每个目标的输出（一条判定JSON）预留的token数，打包调用的 max_tokens 即为各目标预留之和
+PACKED_RESULT_TOKENS = 160
+
+@dataclass
+class CodeFormat:
+    """
+    提示词中代码片段的格式设置。
+
+    compact为True时用Java词法分析压缩代码（去注释、合并空白，可选缩写长标识符），
+    并按 max_code_tokens 截断；否则保留原文，按 max_code_chars 截断。
+    stats非空时，每次实际发出的提示词都会记录代码压缩节省的token数。
+    """
+
+    compact: bool = True
+    max_code_tokens: int = 512
+    abbreviate_identifiers: bool = False
+    max_code_chars: int = 2000
+    stats: Optional[CompactionStats] = field(default=None, compare=False)
+
+DEFAULT_CODE_FORMAT = CodeFormat()
+
+def _format_code(func: FunctionInfo, code_format: CodeFormat) -> Tuple[str, int]:
+    """返回 (放进提示词的代码, 相比原文节省的估计token数)"""
+    code = func.code_snippet or ""
+    if code_format.compact:
+        compacted = compact_code_cached(code, code_format.max_code_tokens, code_format.abbreviate_identifiers)
+        return compacted.code, compacted.saved_tokens
+    truncated = truncate_code(code, max_chars=code_format.max_code_chars)
+    return truncated, estimate_tokens(code) - estimate_tokens(truncated)
+
+def _location(func: FunctionInfo) -> str:
+    return f"{func.subdirectory}/{func.filename}:{func.start_line}-{func.end_line}"
+
+def _target_entry(target: FunctionInfo, code_format: CodeFormat, target_id: Optional[int] = None) -> str:
+    header = "[TARGET]" if target_id is None else f"[TARGET id={target_id}]"
+    code, _ = _format_code(target, code_format)
+    return f"{header} {_location(target)}\n{code}\n"
+
+def _rep_entries(representatives: List[dict], code_format: CodeFormat) -> List[str]:
+    entries = []
     for i, r in enumerate(representatives):
         func = r["function"]
-        rep_list.append({
-            "id": i,
-            "class_id": r["class_id"],
-            "filename": func.filename,
-            "subdirectory": func.subdirectory,
-            "start_line": func.start_line,
-            "end_line": func.end_line,
-            "code": truncate_code(func.code_snippet or "", max_chars=max_code_chars),
-        })
-
-    rep_block = json.dumps(rep_list, indent=2)
+        code, _ = _format_code(func, code_format)
+        entries.append(f"[REP id={i} class={r['class_id']}] {_location(func)}\n{code}\n")
+    return entries
+
+def _rep_block(representatives: List[dict], code_format: CodeFormat) -> str:
+    return "\n".join(_rep_entries(representatives, code_format))
+
+def _record_savings(
+    targets: List[FunctionInfo], representatives: List[dict], code_format: CodeFormat
+) -> int:
+    """计算并记录一次实际发出的提示词中代码格式化节省的token数"""
+    funcs = list(targets) + [r["function"] for r in representatives]
+    saved = sum(_format_code(f, code_format)[1] for f in funcs)
+    if code_format.stats is not None:
+        code_format.stats.record(saved)
+    return saved
+
+def chunk_representatives(
+    representatives: List[dict], max_rep_tokens: int, code_format: CodeFormat = DEFAULT_CODE_FORMAT
+) -> List[List[dict]]:
+    """
+    按估计的 token 数把代表函数列表切成若干块，每块的代表函数块不超过 max_rep_tokens。
+    每块至少包含一个代表函数；未超出预算时原样返回一块。
+
+    :raises ValueError: max_rep_tokens 不为正。此时每个代表函数都会单独成块、各调用一次，
+        调用方应先检查提示词的其余部分是否已超出上限
+    """
+    if max_rep_tokens <= 0:
+        raise ValueError(f"No token budget left for representatives (max_rep_tokens={max_rep_tokens})")
+    costs = [estimate_tokens(e) + 1 for e in _rep_entries(representatives, code_format)]
+    if sum(costs) <= max_rep_tokens:
+        return [representatives]
+
+    chunks: List[List[dict]] = []
+    current: List[dict] = []
+    used = 0
+    for rep, cost in zip(representatives, costs):
+        if current and used + cost > max_rep_tokens:
+            chunks.append(current)
+            current, used = [], 0
+        current.append(rep)
+        used += cost
+    if current:
+        chunks.append(current)
+    return chunks
+
+def merge_chunk_verdicts(verdicts: List[Tuple[dict, List[dict]]]) -> Tuple[dict, List[dict]]:
+    """
+    合并同一目标在各代表函数块上的判定：在判为克隆且编号有效的判定中取置信度最高的一个；
+    都不是克隆时返回第一块的判定。
+
+    Args:
+        verdicts: (判定, 该判定对应的代表函数块) 列表，matched_rep_id 是块内编号
+
+    Returns:
+        (选中的判定, 对应的代表函数块)
+    """
+    best = None
+    for verdict, chunk in verdicts:
+        rep_id = verdict.get("matched_rep_id")
+        if not verdict.get("is_clone") or rep_id is None:
+            continue
+        try:
+            valid = 0 <= int(rep_id) < len(chunk)
+        except (TypeError, ValueError):
+            continue
+        confidence = verdict.get("confidence")
+        confidence = float(confidence) if isinstance(confidence, (int, float)) else 0.0
+        if valid and (best is None or confidence > best[0]):
+            best = (confidence, verdict, chunk)
+    if best is not None:
+        return best[1], best[2]
+    return verdicts[0]
+
+def build_prompt(
+    target: FunctionInfo, representatives: List[dict], code_format: CodeFormat = DEFAULT_CODE_FORMAT
+) -> str:
+    target_block = _target_entry(target, code_format)
+    rep_block = _rep_block(representatives, code_format)
     return PROMPT_TEMPLATE.format(target_block=target_block, rep_block=rep_block)
 
+def build_packed_prompt(
+    targets: List[Tuple[int, FunctionInfo]],
+    representatives: List[dict],
+    code_format: CodeFormat = DEFAULT_CODE_FORMAT,
+) -> str:
+    """多个目标共享同一个代表函数块的提示词，目标以 target_id 区分"""
+    target_block = "\n".join(_target_entry(t, code_format, target_id=idx) for idx, t in targets)
+    rep_block = _rep_block(representatives, code_format)
+    return PACKED_PROMPT_TEMPLATE.format(target_block=target_block, rep_block=rep_block)
+
+def plan_packs(
+    targets: List[Tuple[int, FunctionInfo]],
+    reps_of: Callable[[int], List[dict]],
+    pack_size: int,
+    token_budget: int,
+    code_format: CodeFormat = DEFAULT_CODE_FORMAT,
+) -> List[Tuple[List[Tuple[int, FunctionInfo]], List[dict]]]:
+    """
+    把代表函数列表相同的目标打包，每包不超过 pack_size 个目标，且估计的输入+输出 token 数不超过预算。
+    至少放入一个目标，因此单个超大目标仍会单独成包。代表函数块本身超过预算一半时按一半计，
+    调用时代表函数会被拆块（见 chunk_representatives），目标仍保留一半预算。
+
+    Returns:
+        (目标列表, 共享的代表函数列表) 的列表
+    """
+    groups: Dict[Tuple[int, ...], Tuple[List[dict], List[Tuple[int, FunctionInfo]]]] = {}
+    for idx, target in targets:
+        reps = reps_of(idx)
+        key = tuple(r["class_id"] for r in reps)
+        groups.setdefault(key, (reps, []))[1].append((idx, target))
+
+    packs = []
+    for reps, members in groups.values():
+        base = min(estimate_tokens(build_packed_prompt([], reps, code_format)), token_budget // 2)
+        current: List[Tuple[int, FunctionInfo]] = []
+        used = base
+        for idx, target in members:
+            cost = estimate_tokens(_target_entry(target, code_format, target_id=idx)) + PACKED_RESULT_TOKENS
+            if current and (len(current) >= pack_size or used + cost > token_budget):
+                packs.append((current, reps))
+                current, used = [], base
+            current.append((idx, target))
+            used += cost
+        if current:
+            packs.append((current, reps))
+    return packs
+
 # -----------------------------
 # LLM 调用
 # -----------------------------
-def call_openai_completion(prompt: str, model: str = "gpt-4") -> str:
-    """调用 OpenAI API"""
-    from openai import OpenAI
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
+def call_openai_completion(prompt: str, model: str = "gpt-4", max_tokens: int = 1024) -> str:
+    """调用 OpenAI 兼容接口（经共享的异步客户端，带连接池、限流和重试）"""
+    if not PROVIDERS["openai"].resolve_api_key():
         # 如果没有 API 密钥，返回一个模拟的响应用于测试
         print("WARNING: OPENAI_API_KEY not set, using mock response")
         return '{"is_clone": false, "matched_rep_id": null, "confidence": 0.5, "reason": "Mock response for testing"}'
-    
-    # 使用智谱清言的 API 服务
-    base_url = "https://xiaoai.plus/v1"
-    client = OpenAI(api_key=api_key, base_url=base_url)
-    
+
     # 使用 gpt-4o-mini 模型（智谱清言推荐）
     if model == "gpt-4":
         model = "gpt-4o-mini"
-    
-    resp = client.chat.completions.create(
-        model=model,
-        messages=[{"role": "user", "content": prompt}],
-        max_tokens=1024,
+
+    result = chat_sync(
+        "openai",
+        model,
+        [{"role": "user", "content": prompt}],
+        max_tokens=max_tokens,
         temperature=0.0,
+        # 只缓存能解析出JSON的回复，否则续跑重试出错的目标时会再次命中同一个坏回复
+        validate=validate_and_extract_json,
     )
-    return resp.choices[0].message.content
+    return result.content
 
 def validate_and_extract_json(text: str) -> dict:
     """Try to extract a single JSON object from model output and return as dict.
@@ -199,39 +477,252 @@ def validate_and_extract_json(text: str) -> dict:
         raise ValueError(f"Parsed JSON is not an object/dict (got {type(parsed)}); snippet: {str(parsed)[:300]!r}")
     return parsed
 
-def process_target(idx: int, target: FunctionInfo, representatives: List[dict], model: str) -> dict:
-    prompt = build_prompt(target, representatives)
+def _result_record(idx: int, target: FunctionInfo, parsed: dict, representatives: List[dict]) -> dict:
+    matched_cls_id = None
+    if parsed.get("is_clone") and parsed.get("matched_rep_id") is not None:
+        mi = int(parsed["matched_rep_id"])
+        if 0 <= mi < len(representatives):
+            matched_cls_id = representatives[mi]["class_id"]
+    return {
+        "id": idx,
+        "filename": target.filename,
+        "start_line": target.start_line,
+        "end_line": target.end_line,
+        "matched_clone_class_id": matched_cls_id,
+    }
+
+def _error_record(idx: int, target: FunctionInfo, error: str, raw_text: Optional[str] = None) -> dict:
+    return {
+        "id": idx,
+        "filename": target.filename,
+        "start_line": target.start_line,
+        "end_line": target.end_line,
+        "matched_clone_class_id": None,
+        "error": error,
+        "raw_output": raw_text[:1000] if raw_text else None,
+    }
+
+def _prescreen_record(idx: int, target: FunctionInfo, matched_cls_id: Optional[int], score: float) -> dict:
+    return {
+        "id": idx,
+        "filename": target.filename,
+        "start_line": target.start_line,
+        "end_line": target.end_line,
+        "matched_clone_class_id": matched_cls_id,
+        "prescreen_score": round(score, 4),
+    }
+
+def calibrate_prescreen(
+    targets: List[Tuple[int, FunctionInfo]],
+    reps_of: Callable[[int], List[dict]],
+    labels_jsonl: str,
+    prescreen: PreScreener,
+    max_miss_rate: float = 0.02,
+    min_precision: float = 0.98,
+) -> CalibrationReport:
+    """
+    在已有判定结果（出错的和预筛产生的记录除外）的目标上计算最高相似度并校准阈值。
+    直接判为克隆只有在最相似代表的克隆类与LLM判定的克隆类相同时才算判对。
+    """
+    labeled = {
+        tid: rec for tid, rec in load_journal(labels_jsonl).items()
+        if "error" not in rec and "prescreen_score" not in rec
+    }
+    scores, labels, accept_correct = [], [], []
+    for idx, target in targets:
+        if idx in labeled:
+            reps = reps_of(idx)
+            score, rep_i = prescreen.best_match(target, reps)
+            labeled_cls = labeled[idx].get("matched_clone_class_id")
+            scores.append(score)
+            labels.append(labeled_cls is not None)
+            predicted_cls = reps[rep_i]["class_id"] if rep_i is not None else None
+            accept_correct.append(labeled_cls is not None and predicted_cls == labeled_cls)
+    return calibrate(scores, labels, max_miss_rate=max_miss_rate, min_precision=min_precision,
+                     accept_correct=accept_correct)
+
+def process_target(
+    idx: int,
+    target: FunctionInfo,
+    representatives: List[dict],
+    model: str,
+    max_prompt_tokens: int = DEFAULT_MAX_PROMPT_TOKENS,
+    code_format: CodeFormat = DEFAULT_CODE_FORMAT,
+    prompt_log: Optional[List[dict]] = None,
+) -> dict:
+    """
+    单目标判定。代表函数过多时拆块分别调用，再合并各块的判定。
+    prompt_log非空时，把每次调用实际发送的提示词追加进去。
+    """
+    overhead = estimate_tokens(build_prompt(target, [], code_format)) + SINGLE_RESULT_TOKENS
+    if overhead >= max_prompt_tokens:
+        # 目标和说明本身已超出上限，拆块只会让每个代表函数各调用一次，成本成倍增加却仍然超限
+        return _error_record(
+            idx, target,
+            f"Prompt without representatives needs ~{overhead} tokens, max_prompt_tokens is {max_prompt_tokens}",
+        )
+    chunks = chunk_representatives(representatives, max_prompt_tokens - overhead, code_format)
     raw_text = None
     try:
-        raw_text = call_openai_completion(prompt, model=model)
-        parsed = validate_and_extract_json(raw_text)
-        matched_cls_id = None
-        if parsed.get("is_clone") and parsed.get("matched_rep_id") is not None:
-            mi = int(parsed["matched_rep_id"])
-            if 0 <= mi < len(representatives):
-                matched_cls_id = representatives[mi]["class_id"]
-        return {
-            "id": idx,
-            "filename": target.filename,
-            "start_line": target.start_line,
-            "end_line": target.end_line,
-            "matched_clone_class_id": matched_cls_id,
-        }
+        verdicts = []
+        for chunk in chunks:
+            saved = _record_savings([target], chunk, code_format)
+            prompt = build_prompt(target, chunk, code_format)
+            if prompt_log is not None:
+                prompt_log.append({"id": idx, "prompt": prompt, "tokens_saved": saved})
+            raw_text = call_openai_completion(prompt, model=model)
+            verdicts.append((validate_and_extract_json(raw_text), chunk))
+        parsed, chunk = merge_chunk_verdicts(verdicts)
+        return _result_record(idx, target, parsed, chunk)
+    except BudgetExceededError:
+        raise
     except Exception as e:
         # Return an error-bearing record so the pipeline can continue and user can debug.
-        err_str = str(e)
-        raw_snip = None
-        if raw_text:
-            raw_snip = raw_text[:1000]
-        return {
-            "id": idx,
-            "filename": target.filename,
-            "start_line": target.start_line,
-            "end_line": target.end_line,
-            "matched_clone_class_id": None,
-            "error": err_str,
-            "raw_output": raw_snip,
-        }
+        return _error_record(idx, target, str(e), raw_text)
+
+def process_pack(
+    pack: List[Tuple[int, FunctionInfo]],
+    representatives: List[dict],
+    model: str,
+    max_prompt_tokens: int = DEFAULT_MAX_PROMPT_TOKENS,
+    code_format: CodeFormat = DEFAULT_CODE_FORMAT,
+    prompt_log: Optional[List[dict]] = None,
+) -> List[dict]:
+    """
+    一次调用判定一包目标（代表函数过多时每块一次调用）。整包响应无法解析，或某个目标在某块上
+    缺少合法判定时，该目标退回单目标调用重试。prompt_log 同 process_target。
+    """
+    if len(pack) == 1:
+        idx, target = pack[0]
+        return [process_target(idx, target, representatives, model, max_prompt_tokens, code_format, prompt_log)]
+
+    # 为输出预留的token数同时计入提示词预算和调用的 max_tokens，两者之和不超过 max_prompt_tokens
+    output_tokens = PACKED_RESULT_TOKENS * len(pack)
+    overhead = estimate_tokens(build_packed_prompt(pack, [], code_format)) + output_tokens
+    if overhead >= max_prompt_tokens:
+        # 整包目标已超出上限：逐个单独判定，各目标在 process_target 中再检查自身是否超限
+        return [
+            process_target(idx, target, representatives, model, max_prompt_tokens, code_format, prompt_log)
+            for idx, target in pack
+        ]
+    chunks = chunk_representatives(representatives, max_prompt_tokens - overhead, code_format)
+    per_target: Dict[int, List[Tuple[dict, List[dict]]]] = {idx: [] for idx, _ in pack}
+    for chunk in chunks:
+        verdicts: dict = {}
+        saved = _record_savings([t for _, t in pack], chunk, code_format)
+        prompt = build_packed_prompt(pack, chunk, code_format)
+        if prompt_log is not None:
+            prompt_log.append({"ids": [idx for idx, _ in pack], "prompt": prompt, "tokens_saved": saved})
+        try:
+            raw_text = call_openai_completion(prompt, model=model, max_tokens=output_tokens)
+            parsed = validate_and_extract_json(raw_text)
+            if isinstance(parsed.get("results"), dict):
+                verdicts = parsed["results"]
+        except BudgetExceededError:
+            raise
+        except Exception as e:
+            print(f"Packed call for {len(pack)} targets failed, falling back to single-target calls: {e}")
+        for idx, _ in pack:
+            verdict = verdicts.get(str(idx))
+            if isinstance(verdict, dict) and isinstance(verdict.get("is_clone"), bool):
+                per_target[idx].append((verdict, chunk))
+
+    records = []
+    for idx, target in pack:
+        if len(per_target[idx]) == len(chunks):
+            try:
+                parsed, chunk = merge_chunk_verdicts(per_target[idx])
+                records.append(_result_record(idx, target, parsed, chunk))
+                continue
+            except (TypeError, ValueError):
+                pass
+        records.append(
+            process_target(idx, target, representatives, model, max_prompt_tokens, code_format, prompt_log)
+        )
+    return records
+
+# -----------------------------
+# 目标去重
+# -----------------------------
+def group_duplicate_targets(
+    targets: List[Tuple[int, FunctionInfo]],
+) -> Tuple[List[Tuple[int, FunctionInfo]], Dict[int, List[Tuple[int, FunctionInfo]]]]:
+    """
+    按规范化代码哈希（忽略空白和注释）对目标分组，每组只保留第一个目标去调用LLM。
+
+    :return: (每组的首个目标, 首个目标ID -> 同组其余目标)
+    """
+    leaders: Dict[str, int] = {}
+    unique: List[Tuple[int, FunctionInfo]] = []
+    duplicates: Dict[int, List[Tuple[int, FunctionInfo]]] = {}
+    for idx, target in targets:
+        leader = leaders.setdefault(code_hash(target.code_snippet or ""), idx)
+        if leader == idx:
+            unique.append((idx, target))
+        else:
+            duplicates.setdefault(leader, []).append((idx, target))
+    return unique, duplicates
+
+def fan_out(record: dict, duplicates: Dict[int, List[Tuple[int, FunctionInfo]]]) -> List[dict]:
+    """把首个目标的判定复制给同组的其余目标，各自保留原来的ID和位置，并以 duplicate_of 指向首个目标。"""
+    records = [record]
+    for idx, target in duplicates.get(record["id"], ()):
+        records.append(dict(
+            record,
+            id=idx,
+            filename=target.filename,
+            start_line=target.start_line,
+            end_line=target.end_line,
+            duplicate_of=record["id"],
+        ))
+    return records
+
+# -----------------------------
+# 有界流水线
+# -----------------------------
+def bounded_map(
+    executor: Executor,
+    fn: Callable[[T], R],
+    items: Iterable[T],
+    max_pending: int,
+    ordered: bool = False,
+) -> Iterator[Tuple[T, R]]:
+    """
+    用 executor 对 items 逐个执行 fn，按完成顺序产出 (item, 结果)。
+
+    items被惰性消费，任何时刻最多有 max_pending 个任务在途；ordered为True时经重排缓冲区
+    按输入顺序产出，已完成但尚未轮到输出的结果也计入 max_pending，队头任务很慢时停止提交新任务，
+    缓冲区不会无限增长。fn抛出的异常在产出对应结果时重新抛出。
+    """
+    max_pending = max(1, max_pending)
+    it = enumerate(items)
+    pending: Dict[Future, Tuple[int, T]] = {}
+    buffer: Dict[int, Tuple[T, Future]] = {}
+    next_seq = 0
+    exhausted = False
+
+    while True:
+        while not exhausted and len(pending) + len(buffer) < max_pending:
+            try:
+                seq, item = next(it)
+            except StopIteration:
+                exhausted = True
+                break
+            pending[executor.submit(fn, item)] = (seq, item)
+        if not pending:
+            break
+
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for fut in done:
+            seq, item = pending.pop(fut)
+            if not ordered:
+                yield item, fut.result()
+            else:
+                buffer[seq] = (item, fut)
+        while next_seq in buffer:
+            item, fut = buffer.pop(next_seq)
+            next_seq += 1
+            yield item, fut.result()
 
 # -----------------------------
 # 主生成函数
@@ -246,27 +737,85 @@ def generate_prompts(
     concurrency: int = 1,
     save_prompts: bool = False,
     prompts_out: Optional[str] = None,
+    rep_index_dir: Optional[str] = None,
+    top_k: int = 0,
+    embeddings_path: Optional[str] = None,
+    ivf_lists: int = 0,
+    nprobe: int = 8,
+    resume: bool = False,
+    pack_size: int = 1,
+    pack_token_budget: int = 12000,
+    max_prompt_tokens: int = DEFAULT_MAX_PROMPT_TOKENS,
+    code_format: Optional[CodeFormat] = None,
+    max_pending: Optional[int] = None,
+    ordered: bool = False,
+    rep_catalog: Optional[str] = None,
+    medoids_per_class: int = 1,
+    catalog_sample_size: int = 64,
+    prescreen: Optional[PreScreener] = None,
+    calibration_labels: Optional[str] = None,
+    max_miss_rate: float = 0.02,
+    min_precision: float = 0.98,
+    dedup: bool = True,
+    shard: Optional[Shard] = None,
 ):
+    """
+    为每个目标函数调用LLM判定所属克隆类，结果逐条写入 out_jsonl。
+
+    dedup为True时，规范化代码相同的目标只调用一次LLM，判定复制给同组的每个目标。
+
+    提供shard时只处理属于该分片的目标。目标按去重所用的规范化代码哈希（忽略空白和注释）划分，
+    会被去重合并的目标总在同一分片，分片后去重效果不变；目标ID仍是在完整 functions.pkl 中的下标，各分片的结果可直接合并。
+
+    任务经有界流水线执行：最多 max_pending（默认 2*concurrency）个任务同时在途，
+    完成一个才提交下一个，内存占用与目标总数无关。ordered为True时按目标顺序输出。
+
+    提供prescreen时，本地打分足以判定的目标不调用LLM。提供calibration_labels（此前运行的结果JSONL，
+    视为标注）时只在这些目标上校准预筛阈值并返回 CalibrationReport，不调用LLM。
+    """
+    if code_format is None:
+        code_format = CodeFormat(stats=CompactionStats())
     print(f"Loading functions from {functions_pkl}...")
     functions = read_functions_from_disk(functions_pkl)
     print(f"Loaded {len(functions)} functions.")
 
-    print(f"Loading clone classes from {clone_csv}...")
-    clone_classes = read_clone_classes_from_csv(clone_csv)
-    print(f"Loaded {len(clone_classes)} clone classes.")
-
-    index = build_index(functions)
-
-    # 挑选代表函数
-    representatives = []
-    for i, cc in enumerate(clone_classes):
-        rep = pick_representative_for_clone_class(cc, index)
-        if rep:
-            representatives.append({"class_id": i + 1, "function": rep})
+    # 挑选代表函数（有持久化目录时直接加载）
+    representatives = load_or_build_representatives(
+        functions, functions_pkl, clone_csv, rep_catalog, medoids_per_class, catalog_sample_size
+    )
     if max_reps:
-        representatives = representatives[:max_reps]
+        # max_reps 限制的是克隆类数，medoids_per_class>1 时每个类的代表函数一起保留
+        representatives = first_classes(representatives, max_reps)
     print(f"Using {len(representatives)} representatives.")
 
+    targets = [(idx, target) for idx, target in enumerate(functions) if not (limit and idx >= limit)]
+    if shard is not None:
+        targets = [(idx, t) for idx, t in targets if shard.owns(code_hash(t.code_snippet or ""))]
+        print(f"Shard {shard}: {len(targets)} targets.")
+
+    # 续跑：跳过已有成功结果的目标，只重试出错的和尚未处理的
+    if resume:
+        previous = load_journal(out_jsonl)
+        completed = {tid for tid, rec in previous.items() if "error" not in rec}
+        retried = sum(1 for tid, rec in previous.items() if "error" in rec)
+        targets = [(idx, target) for idx, target in targets if idx not in completed]
+        print(f"Resuming: {len(completed)} targets already done, retrying {retried} errored, {len(targets)} to process.")
+
+    total_targets = len(targets)
+    duplicates: Dict[int, List[Tuple[int, FunctionInfo]]] = {}
+    if dedup:
+        targets, duplicates = group_duplicate_targets(targets)
+    unique_targets = len(targets)
+
+    # 向量检索：每个目标只带上 top-k 个候选克隆类的代表函数，缩短提示词
+    target_reps: Dict[int, List[dict]] = {}
+    if rep_index_dir and top_k > 0:
+        embedding_of = make_embedding_lookup(functions, embeddings_path)
+        rep_index = load_or_build_rep_index(representatives, rep_index_dir, embedding_of, nlist=ivf_lists, nprobe=nprobe)
+        if rep_index is not None:
+            target_reps = select_candidate_representatives(rep_index, targets, representatives, top_k, embedding_of)
+            print(f"Retrieved top-{top_k} candidates for {len(target_reps)} targets.")
+
     # 准备输出
     os.makedirs(os.path.dirname(out_jsonl) or ".", exist_ok=True)
     pf = None
@@ -274,42 +823,80 @@ def generate_prompts(
         if not prompts_out:
             raise ValueError("prompts_out must be provided")
         os.makedirs(os.path.dirname(prompts_out) or ".", exist_ok=True)
-        pf = open(prompts_out, "w", encoding="utf-8")
+        pf = JsonlJournal(prompts_out, resume=resume)
 
-    lock = threading.Lock()
-    written = 0
-    with open(out_jsonl, "w", encoding="utf-8") as outf, ThreadPoolExecutor(max_workers=concurrency) as ex:
-        futures = []
-        for idx, target in enumerate(functions):
-            if limit and idx >= limit:
-                break
-            futures.append(ex.submit(process_target, idx, target, representatives, model))
+    # 打包模式下多个目标共享一次调用；否则每个目标单独成包
+    def reps_of(i: int) -> List[dict]:
+        return target_reps.get(i, representatives)
 
-        for fut in as_completed(futures):
-            try:
-                res = fut.result()
-            except Exception as e:
-                print(f"Error processing target: {e}")
-                # Create a dummy result for failed targets
-                res = {
-                    "id": -1,
-                    "filename": "unknown",
-                    "start_line": -1,
-                    "end_line": -1,
-                    "matched_clone_class_id": None,
-                    "error": str(e)
-                }
-            with lock:
-                outf.write(json.dumps(res, ensure_ascii=False) + "\n")
-                written += 1
-                if pf:
-                    tid = res["id"]
-                    prompt_text = build_prompt(functions[tid], representatives)
-                    pf.write(json.dumps({"id": tid, "prompt": prompt_text}, ensure_ascii=False) + "\n")
+    # 本地预筛：用标注样本校准阈值，或直接判定明显的非克隆/克隆，不调用LLM
+    if calibration_labels:
+        report = calibrate_prescreen(
+            targets, reps_of, calibration_labels, prescreen or PreScreener(), max_miss_rate, min_precision
+        )
+        print(report.format())
+        return report
+
+    prescreened: List[dict] = []
+    if prescreen is not None:
+        remaining = []
+        for idx, target in targets:
+            verdict, score, rep_i = prescreen.decide(target, reps_of(idx))
+            if verdict is None:
+                remaining.append((idx, target))
+            else:
+                reps = reps_of(idx)
+                prescreened.append(_prescreen_record(idx, target, reps[rep_i]["class_id"] if verdict else None, score))
+        print(f"Pre-screen decided {len(prescreened)} of {len(targets)} targets without an LLM call.")
+        targets = remaining
+
+    if pack_size > 1:
+        packs = plan_packs(targets, reps_of, pack_size, pack_token_budget, code_format)
+        print(f"Packed {len(targets)} targets into {len(packs)} calls.")
+    else:
+        # 生成器：任务按需产生，不会一次性为所有目标创建闭包
+        packs = (([(idx, target)], reps_of(idx)) for idx, target in targets)
+
+    def run_pack(pack_and_reps):
+        pack, reps = pack_and_reps
+        prompt_log: Optional[List[dict]] = [] if pf else None
+        try:
+            results = process_pack(pack, reps, model, max_prompt_tokens, code_format, prompt_log)
+        except BudgetExceededError:
+            raise
+        except Exception as e:
+            print(f"Error processing target: {e}")
+            # Create error records for the failed targets
+            results = [_error_record(idx, target, str(e)) for idx, target in pack]
+        return results, prompt_log or []
+
+    written = 0
+    try:
+        with JsonlJournal(out_jsonl, resume=resume) as outf, ThreadPoolExecutor(max_workers=concurrency) as ex:
+            # 预筛判定的记录最先写出（ordered只保证经LLM判定的记录之间的顺序）
+            for res in prescreened:
+                for record in fan_out(res, duplicates):
+                    outf.append(record)
+                    written += 1
+            for _, (results, prompt_log) in bounded_map(ex, run_pack, packs, max_pending or 2 * concurrency, ordered):
+                for res in results:
+                    for record in fan_out(res, duplicates):
+                        outf.append(record)
+                        written += 1
+                for entry in prompt_log:
+                    pf.append(entry)
+    except BudgetExceededError as e:
+        # 已写出的结果保留在日志中，提高预算后用 --resume 继续
+        print(f"Stopping: {e}. Re-run with --resume to continue.")
 
     if pf:
         pf.close()
     print(f"Finished writing {written} results to {out_jsonl}.")
+    if dedup and total_targets:
+        print(f"Dedup: {unique_targets} unique targets for {total_targets} functions, "
+              f"{total_targets - unique_targets} judgements reused (dedup ratio {1 - unique_targets / total_targets:.1%}).")
+    if code_format.stats is not None:
+        print(code_format.stats.summary())
 
 # -----------------------------
 # CLI
@@ -322,18 +909,127 @@ def main(argv: Optional[List[str]] = None):
     parser.add_argument("--limit", type=int, default=None)
     parser.add_argument("--model", type=str, default="gpt-4")
     parser.add_argument("--concurrency", type=int, default=1)
-    parser.add_argument("--max_reps", type=int, default=None)
+    parser.add_argument("--max_reps", type=int, default=None,
+                        help="只使用前N个克隆类的代表函数（每类 --medoids-per-class 个）")
+    parser.add_argument("--max-pending", type=int, default=None, help="同时在途的最大任务数，默认2倍并发数")
+    parser.add_argument("--ordered", action="store_true", help="按目标顺序输出结果（经重排缓冲区）")
     parser.add_argument("--save-prompts", action="store_true")
     parser.add_argument("--prompts-out", type=str, default=None)
+    parser.add_argument("--rep-catalog", type=str, default=None, help="代表函数目录路径，输入未变化时直接加载")
+    parser.add_argument("--medoids-per-class", type=int, default=1, help="每个克隆类的代表函数数")
+    parser.add_argument("--catalog-sample-size", type=int, default=64, help="选择代表函数时每个克隆类最多抽样的成员数")
+    parser.add_argument("--prescreen-low", type=float, default=None, help="本地相似度低于该值直接判为非克隆")
+    parser.add_argument("--prescreen-high", type=float, default=None, help="本地相似度不低于该值直接判为克隆")
+    parser.add_argument("--calibrate-prescreen", type=str, default=None,
+                        help="用此前运行的结果JSONL作为标注校准预筛阈值，只输出报告，不调用LLM")
+    parser.add_argument("--max-miss-rate", type=float, default=0.02, help="校准时允许被跳过的克隆比例")
+    parser.add_argument("--min-precision", type=float, default=0.98, help="校准时直接判为克隆的最低精确率")
+    parser.add_argument("--rep-index", type=str, default=None, help="代表函数向量索引目录，不存在时自动构建")
+    parser.add_argument("--top-k", type=int, default=0, help="每个目标检索的候选克隆类数，0表示不检索")
+    parser.add_argument("--ivf-lists", type=int, default=0, help="构建索引时的IVF分区数，0表示精确检索")
+    parser.add_argument("--nprobe", type=int, default=8)
+    parser.add_argument("--embeddings", type=str, default=None, help="embed_functions.py 输出的 .npy 路径")
+    parser.add_argument("--resume", action="store_true", help="追加到已有输出，跳过已成功的目标，只重试出错的")
+    parser.add_argument("--no-dedup", action="store_true", help="不合并规范化代码相同的目标，每个目标单独调用")
+    parser.add_argument("--shard", type=Shard.parse, default=None,
+                        help="只处理第i个分片（共N个）的目标，格式 i/N；输出、提示词和用量汇总路径自动加上分片后缀，"
+                             "--llm-cache 不加后缀，各分片共用")
+    parser.add_argument("--pack-size", type=int, default=1, help="每次调用最多打包的目标数，1表示不打包")
+    parser.add_argument("--pack-token-budget", type=int, default=12000, help="每个打包提示词（含预留输出）的token预算")
+    parser.add_argument("--max-prompt-tokens", type=int, default=DEFAULT_MAX_PROMPT_TOKENS,
+                        help="单次提示词的token上限，超出时代表函数列表拆块分别判定")
+    parser.add_argument("--no-compact", action="store_true", help="不压缩代码，保留注释和排版，按字符数截断")
+    parser.add_argument("--max-code-tokens", type=int, default=512, help="每段代码压缩后的token上限")
+    parser.add_argument("--abbreviate-identifiers", action="store_true", help="把较长的局部标识符替换为短别名")
+    parser.add_argument("--rpm", type=float, default=None, help="每分钟最多请求数")
+    parser.add_argument("--tpm", type=float, default=None, help="每分钟最多token数")
+    parser.add_argument("--max-in-flight", type=int, default=None, help="同时在途的最大请求数")
+    parser.add_argument("--llm-cache", type=str, default="llm_cache.sqlite",
+                        help="LLM响应缓存路径，各分片共用；SQLite需要文件锁，所在文件系统不支持时每个节点各用一份")
+    parser.add_argument("--no-llm-cache", action="store_true", help="不读写LLM响应缓存")
+    parser.add_argument("--cache-ttl", type=float, default=None, help="缓存有效期（秒）")
+    parser.add_argument("--cache-max-entries", type=int, default=None, help="缓存最多条目数，超出按LRU淘汰")
+    parser.add_argument("--price-table", type=str, default=None, help="价格表JSON（每百万token价格），覆盖内置价格")
+    parser.add_argument("--soft-budget", type=float, default=None, help="花费达到该值时警告并暂停 --soft-budget-pause 秒")
+    parser.add_argument("--soft-budget-pause", type=float, default=0.0)
+    parser.add_argument("--hard-budget", type=float, default=None, help="花费将超过该值时停止发出请求")
+    parser.add_argument("--usage-summary", type=str, default=None, help="本次运行的用量汇总JSON，默认写在输出旁边")
     args = parser.parse_args(argv)
+    if args.shard is not None:
+        # 每个分片写自己的文件，多台机器共享文件系统时互不干扰；结果用 merge_shards.py 合并。
+        # LLM响应缓存按内容寻址，所有分片共用一份，相同的提示词只付费一次
+        args.out = args.shard.path(args.out)
+        if args.prompts_out:
+            args.prompts_out = args.shard.path(args.prompts_out)
+        if args.usage_summary:
+            args.usage_summary = args.shard.path(args.usage_summary)
+
+    limits = {"requests_per_minute": args.rpm, "tokens_per_minute": args.tpm, "max_in_flight": args.max_in_flight}
+    configure_provider("openai", **{k: v for k, v in limits.items() if v is not None})
+    cache = None
+    if not args.no_llm_cache:
+        cache = ResponseCache(args.llm_cache, ttl=args.cache_ttl, max_entries=args.cache_max_entries)
+        set_response_cache(cache)
+    ledger = UsageLedger(
+        load_price_table(args.price_table),
+        soft_budget=args.soft_budget,
+        hard_budget=args.hard_budget,
+        soft_pause=args.soft_budget_pause,
+    )
+    set_usage_ledger(ledger)
+    try:
+        _run(args)
+    finally:
+        close_all_clients()
+        set_usage_ledger(None)
+        print(ledger.format())
+        ledger.write_summary(args.usage_summary or os.path.splitext(args.out)[0] + ".usage.json")
+        if cache is not None:
+            print(cache.summary())
+            set_response_cache(None)
+            cache.close()
+
+def _run(args):
+    prescreen = None
+    if args.prescreen_low is not None or args.prescreen_high is not None:
+        prescreen = PreScreener(
+            low=args.prescreen_low if args.prescreen_low is not None else 0.0,
+            high=args.prescreen_high if args.prescreen_high is not None else 1.01,
+        )
     generate_prompts(
         args.functions, args.clone_csv, args.out,
         limit=args.limit,
         max_reps=args.max_reps,
         model=args.model,
         concurrency=args.concurrency,
+        max_pending=args.max_pending,
+        ordered=args.ordered,
         save_prompts=args.save_prompts,
-        prompts_out=args.prompts_out
+        prompts_out=args.prompts_out,
+        prescreen=prescreen,
+        calibration_labels=args.calibrate_prescreen,
+        max_miss_rate=args.max_miss_rate,
+        min_precision=args.min_precision,
+        rep_catalog=args.rep_catalog,
+        medoids_per_class=args.medoids_per_class,
+        catalog_sample_size=args.catalog_sample_size,
+        rep_index_dir=args.rep_index,
+        top_k=args.top_k,
+        ivf_lists=args.ivf_lists,
+        nprobe=args.nprobe,
+        embeddings_path=args.embeddings,
+        resume=args.resume,
+        dedup=not args.no_dedup,
+        shard=args.shard,
+        pack_size=args.pack_size,
+        pack_token_budget=args.pack_token_budget,
+        max_prompt_tokens=args.max_prompt_tokens,
+        code_format=CodeFormat(
+            compact=not args.no_compact,
+            max_code_tokens=args.max_code_tokens,
+            abbreviate_identifiers=args.abbreviate_identifiers,
+            stats=CompactionStats(),
+        ),
     )
 
 if __name__ == "__main__":
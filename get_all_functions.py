@@ -1,53 +1,147 @@
+import argparse
 import concurrent.futures
+import json
 import os
 
 from tqdm import tqdm
 
-from typing import List
+from typing import List, Optional, Tuple
+from utils.file.corpus_stats import CorpusStats, count_buffer_lines, count_lines
+from utils.file.file_io import write_functions_to_disk
+from utils.file.file_walker import walk_files
+from utils.file.shared_source_store import SharedSourceStore, SourceStoreHandle, init_worker_store, worker_store
+from utils.file.sharding import Shard
 from utils.java_code.function_info import FunctionInfo
 from utils.java_code.java_parser import JavaParser
 
 
-def process_file(java_file: str) -> List[FunctionInfo]:
+def process_file(java_file: str, store: Optional[SharedSourceStore] = None) -> List[FunctionInfo]:
     """
     处理单个Java文件，提取函数并返回函数信息列表。
     
     :param java_file: Java文件路径
+    :param store: 共享源码存储，缺省时取当前工作进程附加的存储（见 init_worker_store），都没有时从磁盘读取
     :return: 提取的函数信息列表
     """
     try:
-        parser = JavaParser(java_file)
+        parser = JavaParser(java_file, store or worker_store())
         return parser.extract_functions()
     except Exception as e:
         print(f"处理文件 '{java_file}' 时发生错误 {e.__class__}: {e}")
         return []
 
 
-def extract_functions_from_directory(path, use_multiprocessing=False, max_workers=1):
+def process_file_with_stats(java_file: str, store: Optional[SharedSourceStore] = None
+                            ) -> Tuple[List[FunctionInfo], Optional[Tuple[int, int]]]:
+    """提取函数的同时统计文件的行数和字节数，供一次遍历同时完成提取和语料统计。"""
+    store = store or worker_store()
+    functions = process_file(java_file, store)
+    if store is not None and store.has_file(java_file):
+        # 按 count_lines 的规则统计，使用共享存储与否得到的行数相同
+        view = store.get_bytes(java_file)
+        try:
+            return functions, count_buffer_lines(view)
+        finally:
+            view.release()
+    try:
+        return functions, count_lines(java_file)
+    except OSError:
+        return functions, None
+
+
+def extract_functions_from_directory(path, use_multiprocessing=False, max_workers=1, shard: Optional[Shard] = None,
+                                     stats: Optional[CorpusStats] = None, manifest_path: Optional[str] = None,
+                                     source_store: Optional[SourceStoreHandle] = None, shared_memory: bool = False):
+    """
+    :param shard: 只处理属于该分片的文件。按相对于 path 的路径哈希划分，
+        不同机器上的挂载点不同也得到相同的划分
+    :param stats: 提供时在提取的同时累计语料统计（行数、字节数、每文件方法数）
+    :param manifest_path: 文件清单路径，见 walk_files
+    :param source_store: 共享源码存储（如 FileCache(shared_memory=True).store.handle），
+        工作进程附加后直接从共享内存读取源码，不再各自读盘
+    :param shared_memory: 未提供 source_store 时，先把待处理的文件读入一个新建的共享源码存储，提取结束后释放
+    """
     files = []
-    for root, dirs, filenames in os.walk(path):
-        for filename in filenames:
-            if filename.endswith('.java'):
-                files.append(os.path.join(root, filename))
-
-    if use_multiprocessing:
-        all_functions = []
-        with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
-            future_to_file = {executor.submit(process_file, file): file for file in files}
-            for future in tqdm(concurrent.futures.as_completed(future_to_file), total=len(files), desc="提取进度"):
-                file = future_to_file[future]
-                try:
-                    functions = future.result()
-                    all_functions.extend(functions)
-                except Exception as exc:
-                    print(f"处理文件 '{file}' 时生成异常: {exc}")
-        return all_functions
-    else:
-        all_functions = []
-        for file in tqdm(files, desc="提取进度"):
+    for entry in walk_files(path, manifest_path=manifest_path):
+        if shard is None or shard.owns(os.path.relpath(entry.path, path).replace(os.sep, "/")):
+            files.append(entry.path)
+
+    worker = process_file if stats is None else process_file_with_stats
+
+    def collect(result):
+        if stats is None:
+            all_functions.extend(result)
+            return
+        functions, counted = result
+        all_functions.extend(functions)
+        if counted is None:
+            stats.errors += 1
+        else:
+            stats.add(counted[0], counted[1], len(functions))
+
+    all_functions = []
+    # shared_memory 时由这里创建共享存储，提取结束后释放
+    own_store = SharedSourceStore.create(files) if shared_memory and source_store is None else None
+    if own_store is not None:
+        source_store = own_store.handle
+    try:
+        if use_multiprocessing:
+            initializer, initargs = (init_worker_store, (source_store,)) if source_store is not None else (None, ())
+            with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers, initializer=initializer,
+                                                        initargs=initargs) as executor:
+                future_to_file = {executor.submit(worker, file): file for file in files}
+                for future in tqdm(concurrent.futures.as_completed(future_to_file), total=len(files), desc="提取进度"):
+                    file = future_to_file[future]
+                    try:
+                        collect(future.result())
+                    except Exception as exc:
+                        print(f"处理文件 '{file}' 时生成异常: {exc}")
+        else:
+            store = own_store
+            if store is None and source_store is not None:
+                store = SharedSourceStore.attach(source_store)
             try:
-                functions = process_file(file)
-                all_functions.extend(functions)
-            except Exception as exc:
-                print(f"处理文件 '{file}' 时生成异常: {exc}")
-        return all_functions
+                for file in tqdm(files, desc="提取进度"):
+                    try:
+                        collect(worker(file, store))
+                    except Exception as exc:
+                        print(f"处理文件 '{file}' 时生成异常: {exc}")
+            finally:
+                if store is not None and store is not own_store:
+                    store.close()
+    finally:
+        if own_store is not None:
+            own_store.close()
+    return all_functions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Extract all Java functions under a directory")
+    parser.add_argument("--path", required=True, help="数据集目录")
+    parser.add_argument("--out", default="functions.pkl", help="输出路径，分片时自动加上分片后缀")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--shard", type=Shard.parse, default=None, help="只处理第i个分片（共N个），格式 i/N")
+    parser.add_argument("--stats", default=None, help="同时统计语料（行数、字节数、每文件方法数）并写入该JSON")
+    parser.add_argument("--manifest", default=None, help="文件清单路径，目录未变化时不再重新扫描；分片时自动加上分片后缀")
+    parser.add_argument("--shared-memory", action="store_true",
+                        help="先把源码读入共享内存，工作进程直接从中读取，不再各自读盘")
+    args = parser.parse_args(argv)
+    manifest = args.shard.path(args.manifest) if args.shard and args.manifest else args.manifest
+
+    stats = CorpusStats() if args.stats else None
+    functions = extract_functions_from_directory(
+        args.path, use_multiprocessing=args.workers > 1, max_workers=args.workers, shard=args.shard, stats=stats,
+        manifest_path=manifest, shared_memory=args.shared_memory,
+    )
+    out = args.shard.path(args.out) if args.shard else args.out
+    write_functions_to_disk(functions, out)
+    print(f"Extracted {len(functions)} functions to {out}")
+    if stats is not None:
+        print(stats.format())
+        stats_path = args.shard.path(args.stats) if args.shard else args.stats
+        with open(stats_path, "w", encoding="utf-8") as f:
+            json.dump(stats.to_dict(), f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+import argparse
+import json
+import os
+from typing import List, Optional, Sequence
+
+from clone.clone_class_parser import CloneClassParser
+from clone.clone_csv import write_clone_pairs_csv
+from utils.file.file_io import read_functions_from_disk, write_functions_to_disk
+from utils.file.jsonl_journal import load_journal
+from utils.file.sharding import shard_paths
+from utils.java_code.function_info import FunctionInfo
+
+
+def _check_inputs(paths: Sequence[str]):
+    missing = [p for p in paths if not os.path.exists(p)]
+    if missing:
+        raise FileNotFoundError(f"Missing shard outputs: {', '.join(missing)}")
+
+
+def merge_function_stores(paths: Sequence[str], out_path: str) -> List[FunctionInfo]:
+    """
+    合并各分片提取的函数：按 (路径, 起始行, 结束行) 去重并排序，使合并结果与分片数和完成顺序无关。
+    """
+    _check_inputs(paths)
+    merged = {}
+    for path in paths:
+        for func in read_functions_from_disk(path):
+            merged.setdefault((func.path, func.start_line, func.end_line), func)
+    functions = [merged[k] for k in sorted(merged)]
+    write_functions_to_disk(functions, out_path)
+    return functions
+
+
+def merge_clone_pair_csvs(paths: Sequence[str], out_path: str) -> int:
+    """
+    合并各分片的克隆对CSV，去掉重复（不计两端顺序）的克隆对。克隆类由 CloneClassParser
+    在合并后的克隆对上重新求连通分量得到，跨分片的克隆类因此会被正确合并。
+
+    :return: 写出的克隆对数
+    """
+    _check_inputs(paths)
+    unique = {}
+    for path in paths:
+        for p in CloneClassParser(path).clone_pairs:
+            key = frozenset([(p.file1, p.start1, p.end1), (p.file2, p.start2, p.end2)])
+            unique.setdefault(key, p)
+    return write_clone_pairs_csv(unique.values(), out_path)
+
+
+def merge_result_journals(paths: Sequence[str], out_path: str, key: str = "id") -> int:
+    """
+    合并各分片 generate_prompts 的结果JSONL：每个ID取最后一条记录（与续跑语义一致），按ID排序写出。
+
+    :return: 写出的记录数
+    """
+    _check_inputs(paths)
+    records = {}
+    for path in paths:
+        records.update(load_journal(path, key))
+    os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+    tmp = out_path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        for k in sorted(records):
+            f.write(json.dumps(records[k], ensure_ascii=False) + "\n")
+    os.replace(tmp, out_path)
+    return len(records)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Merge per-shard outputs of a sharded run")
+    parser.add_argument("kind", choices=["functions", "clones", "results"],
+                        help="functions: functions.pkl；clones: 克隆对CSV；results: generate_prompts 结果JSONL")
+    parser.add_argument("inputs", nargs="+", help="各分片的输出文件；给出 --shards 时为未分片时的路径")
+    parser.add_argument("--out", required=True)
+    parser.add_argument("--shards", type=int, default=0, help="分片数N，按 <stem>.shard-i-of-N<ext> 展开输入路径")
+    args = parser.parse_args(argv)
+
+    paths = [p for path in args.inputs for p in shard_paths(path, args.shards)] if args.shards else args.inputs
+    if args.kind == "functions":
+        count = len(merge_function_stores(paths, args.out))
+    elif args.kind == "clones":
+        count = merge_clone_pair_csvs(paths, args.out)
+    else:
+        count = merge_result_journals(paths, args.out)
+    print(f"Merged {len(paths)} shard outputs into {args.out} ({count} {args.kind}).")
+
+
+if __name__ == "__main__":
+    main()
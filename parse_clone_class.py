@@ -1,27 +1,47 @@
-import time
-import time
+import argparse
+import os
+import pickle
 import random
+import time
 
-from clone.clone_class_parser import CloneClassParser
-from clone.pair_filter_strategy import OnlyAllowJavaFunctionClonePairFilter
-import config
-from utils.file.file_cache import FileCache
 
+def parse_clone_classes(functions, csv_path, show_progress=True):
+    """
+    读取克隆对CSV，只保留两端都是已提取函数的克隆对，再求克隆类。
+
+    :param functions: 提取的 FunctionInfo 列表
+    :return: (克隆类列表, (路径, 起始行, 结束行) -> FunctionInfo)
+    """
+    from clone.clone_class_parser import CloneClassParser
+    from clone.pair_filter_strategy import OnlyAllowJavaFunctionClonePairFilter
+
+    function_index = {(func.path, func.start_line, func.end_line): func for func in functions}
+    parser = CloneClassParser(csv_path)
+    parser.apply_filter_strategy(OnlyAllowJavaFunctionClonePairFilter(function_index), show_progress=show_progress)
+    return parser.parse(), function_index
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Parse clone classes from a clone pair CSV")
+    arg_parser.add_argument("--functions", default="functions.pkl", help="get_all_functions.py 的输出")
+    arg_parser.add_argument("--clone-csv", default="data/msccd_default.csv")
+    arg_parser.add_argument("--out-dir", default="process", help="写出 clone_classes.pkl 和 function_index.pkl")
+    args = arg_parser.parse_args(argv)
+
+    from utils.file.file_io import read_functions_from_disk
 
-if __name__ == "__main__":
     now = time.time()
-    parser = CloneClassParser("data/msccd_default.csv")
-    
-    file_cache = FileCache(config.dataset_path, show_progress=True)
-    
-    # 创建过滤策略时传入FileCache
-    filter_strategy = OnlyAllowJavaFunctionClonePairFilter(file_cache=file_cache)
-    
-    # 解析克隆类
-    clone_classes = parser.parse(filter_strategy=filter_strategy, use_multiprocessing=True)
+    clone_classes, function_index = parse_clone_classes(read_functions_from_disk(args.functions), args.clone_csv)
     print("Total Clone Classes:", len(clone_classes))
     print("Total Clone Pairs:", sum(len(cc.clone_pairs) for cc in clone_classes))
     print("Parsing Time:", time.time() - now)
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    with open(os.path.join(args.out_dir, "clone_classes.pkl"), "wb") as f:
+        pickle.dump(clone_classes, f)
+    with open(os.path.join(args.out_dir, "function_index.pkl"), "wb") as f:
+        pickle.dump(function_index, f)
+
     print("Random Sample Clone Class:")
     if not clone_classes:
         print("No clone classes found.")
@@ -32,4 +52,8 @@ if __name__ == "__main__":
             print(
                 f"Pair {idx}: {pair.file1}:{pair.start1}-{pair.end1} <-> "
                 f"{pair.file2}:{pair.start2}-{pair.end2}"
-            )
\ No newline at end of file
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,39 +1,59 @@
+import argparse
 import os
 import pickle
 import time
 
-from clone.clone_class_parser import CloneClassParser
-from clone.pair_filter_strategy import OnlyAllowJavaFunctionClonePairFilter
-import config
-from get_all_functions import extract_functions_from_directory
-from utils.file.file_io import read_functions_from_disk, write_functions_to_disk
-from utils.llm.clone_class_summary import create_batch_task, generate_jsonl, upload_batch
+from utils.file.sharding import Shard
 
-use_multiprocessing = config.use_multiprocessing
-workers = config.workers
+# 导入本模块不加载 config、javalang 和 clone 包，这些依赖在用到的函数中导入
 
 
-def extract_all_functions(path=None, pkl_path="functions.pkl"):
+def extract_all_functions(path=None, pkl_path="functions.pkl", shard=None, manifest_path="file_manifest.json",
+                          shared_memory=False):
+    import config
+    from get_all_functions import extract_functions_from_directory
+    from utils.file.file_io import read_functions_from_disk, write_functions_to_disk
+
     if path is None:
         path = config.dataset_path
+    if shard is not None:
+        # 各分片可能同时运行，文件清单也按分片分开，否则会互相覆盖
+        pkl_path = shard.path(pkl_path)
+        if manifest_path:
+            manifest_path = shard.path(manifest_path)
 
     if os.path.exists(pkl_path):
         functions = read_functions_from_disk(pkl_path)
 
     else:
-        functions = extract_functions_from_directory(path, use_multiprocessing=use_multiprocessing, max_workers=workers)
+        functions = extract_functions_from_directory(
+            path, use_multiprocessing=config.use_multiprocessing, max_workers=config.workers, shard=shard,
+            manifest_path=manifest_path, shared_memory=shared_memory,
+        )
         write_functions_to_disk(functions, pkl_path)
     return functions
 
 
-if __name__ == "__main__":
+def main(argv=None):
+    from clone.clone_class_parser import CloneClassParser
+    from clone.pair_filter_strategy import OnlyAllowJavaFunctionClonePairFilter
+
+    arg_parser = argparse.ArgumentParser(description="DeepCloneFinder pipeline")
+    arg_parser.add_argument("--shard", type=Shard.parse, default=None,
+                            help="只提取第i个分片（共N个）的函数后退出，格式 i/N；全部分片完成后用 merge_shards.py 合并")
+    arg_parser.add_argument("--shared-memory", action="store_true",
+                            help="提取函数时先把源码读入共享内存，工作进程直接从中读取，不再各自读盘")
+    args = arg_parser.parse_args(argv)
     now = time.time()
 
     print('========== Extracting All Functions ==========')
 
-    functions = extract_all_functions()
+    functions = extract_all_functions(shard=args.shard, shared_memory=args.shared_memory)
 
     print("Functions Extracting Time:", time.time() - now, "s")
+    if args.shard is not None:
+        print(f"Shard {args.shard}: {len(functions)} functions written to {args.shard.path('functions.pkl')}")
+        return
     now = time.time()
 
     print('========== Indexing Functions ==========')
@@ -110,20 +130,8 @@ if __name__ == "__main__":
 
     with open("process/function_index.pkl", 'wb') as f:
         pickle.dump(function_index, f)
-    '''
-    generate_jsonl(clone_classes, function_index, model="glm-4-flash", file_path="process/clone_class_summaries.jsonl")
-
-    batch_file_object = upload_batch("process/clone_class_summaries.jsonl", api_key=config.zhipuai_api_key)
-
-    create_batch_task(batch_file_object, api_key=config.zhipuai_api_key)
-    '''
-    '''
-    print(
-        ask_llm_for_function_summary(
-            system_prompt=generate_prompt("prompts/function_summary.md", {}),
-            user_prompt=get_clone_class_functions(clone_classes[0], function_index)[0].code_snippet,
-            api_key=config.zhipuai_api_key,
-            model="glm-4.5-flash"
-        )
-    )
-    '''
+    # 克隆类摘要见 deepclonefinder.py summarize
+
+
+if __name__ == "__main__":
+    main()
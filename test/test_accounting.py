@@ -0,0 +1,85 @@
+import json
+import os
+import sys
+
+import pytest
+
+# Ensure project root is on sys.path so imports work when running tests from any cwd
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from utils.llm.accounting import BudgetExceededError, ModelPrice, UsageLedger, load_price_table
+
+
+def _ledger(**kwargs):
+    return UsageLedger({"m": ModelPrice(prompt=1.0, completion=2.0)}, **kwargs)
+
+
+def test_cost_uses_price_table_and_prefix_match():
+    ledger = _ledger()
+
+    assert ledger.record("m", 1_000_000, 500_000) == pytest.approx(2.0)
+    assert ledger.record("m-2024-08-06", 1_000_000, 0) == pytest.approx(1.0)
+    assert ledger.record("m", 1_000_000, 0, batch=True) == pytest.approx(0.5)
+    assert ledger.record("unknown", 10, 10) == 0.0
+    assert ledger.record("m", 10, 10, cached=True) == 0.0
+
+    summary = ledger.summary()
+    assert summary["cost"] == pytest.approx(3.5)
+    assert summary["cached"] == 1
+    assert summary["unpriced_models"] == ["unknown"]
+    assert summary["by_model"]["m"]["requests"] == 2
+
+
+def test_latency_percentiles_retries_and_errors():
+    ledger = _ledger()
+    for i in range(1, 101):
+        ledger.record("m", 1, 1, latency=i / 100, attempts=2 if i % 10 == 0 else 1)
+
+    class Throttled(Exception):
+        status_code = 429
+
+    ledger.record_error(Throttled(), attempts=3)
+    ledger.record_error(TimeoutError())
+
+    summary = ledger.summary()
+    assert summary["latency"]["p50"] == pytest.approx(0.505, abs=1e-3)
+    assert summary["latency"]["max"] == 1.0
+    assert summary["retries"] == 10 + 2
+    assert summary["errors"] == {"HTTP 429": 1, "TimeoutError": 1}
+
+
+def test_hard_budget_rejects_requests_that_would_exceed_it():
+    ledger = _ledger(hard_budget=1.0)
+
+    assert ledger.admit("m", 500_000) == 0
+    ledger.record("m", 900_000, 0)
+    with pytest.raises(BudgetExceededError):
+        ledger.admit("m", 200_000)
+    # 预计花费仍在预算内的小请求可以继续
+    assert ledger.admit("m", 50_000) == 0
+
+
+def test_soft_budget_pauses_until_resumed():
+    ledger = _ledger(soft_budget=0.5, soft_pause=60)
+
+    ledger.record("m", 400_000, 0)
+    assert ledger.admit("m") == 0
+    ledger.record("m", 200_000, 0)
+    assert ledger.admit("m") > 50
+    ledger.resume()
+    assert ledger.admit("m") == 0
+
+
+def test_price_table_file_overrides_defaults_and_summary_is_written(tmp_path):
+    table = tmp_path / "prices.json"
+    table.write_text(json.dumps({"gpt-4o-mini": {"prompt": 1.0, "completion": 1.0}}))
+    prices = load_price_table(str(table))
+    assert prices["gpt-4o-mini"] == ModelPrice(1.0, 1.0)
+    assert "gpt-4" in prices
+
+    ledger = UsageLedger(prices)
+    ledger.record("gpt-4o-mini", 1_000_000, 0, latency=0.2)
+    out = tmp_path / "run" / "usage.json"
+    ledger.write_summary(str(out))
+    assert json.loads(out.read_text())["cost"] == 1.0
+    assert "1 requests" in ledger.format()
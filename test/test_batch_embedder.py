@@ -0,0 +1,121 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# Ensure project root is on sys.path so imports work when running tests from any cwd
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from utils.embedding.batch_embedder import embed_to_store, plan_batches
+from utils.embedding.embedding_cache import EmbeddingCache
+from utils.java_code.code_normalizer import code_hash
+
+
+def _token_lengths(texts):
+    return [len(t.split()) for t in texts]
+
+
+def _encode(texts):
+    # 确定性的假编码器：向量由文本长度和首字符决定
+    return np.array([[len(t), ord(t[0]) if t else 0, 1.0] for t in texts], dtype=np.float32)
+
+
+def test_plan_batches_sorts_by_length_and_respects_limits():
+    lengths = [5, 1, 9, 1, 5, 3]
+    batches = plan_batches(lengths, batch_size=2, max_batch_tokens=10)
+
+    flat = [row for batch in batches for row in batch]
+    assert sorted(flat) == list(range(len(lengths)))
+    assert [lengths[r] for r in flat] == sorted(lengths)
+    assert all(len(b) <= 2 for b in batches)
+    assert all(max(lengths[r] for r in b) * len(b) <= 10 or len(b) == 1 for b in batches)
+
+
+def test_embed_to_store_writes_float16_rows_aligned_to_ids(tmp_path):
+    texts = ["a b c", "x", "hello world", "q r"]
+    out = str(tmp_path / "emb.npy")
+
+    matrix = embed_to_store(texts, out, _encode, _token_lengths, batch_size=2, show_progress=False)
+
+    assert matrix.dtype == np.float16
+    assert np.allclose(matrix.astype(np.float32), _encode(texts))
+
+
+def test_embed_to_store_resumes_after_interruption(tmp_path):
+    texts = ["t%d " % i * (i + 1) for i in range(10)]
+    out = str(tmp_path / "emb.npy")
+    calls = []
+
+    def flaky_encode(batch):
+        calls.append(len(batch))
+        if len(calls) == 3:
+            raise KeyboardInterrupt
+        return _encode(batch)
+
+    with pytest.raises(KeyboardInterrupt):
+        embed_to_store(texts, out, flaky_encode, _token_lengths, batch_size=2, show_progress=False)
+
+    resumed = []
+
+    def counting_encode(batch):
+        resumed.append(len(batch))
+        return _encode(batch)
+
+    matrix = embed_to_store(texts, out, counting_encode, _token_lengths, batch_size=2, show_progress=False)
+
+    # 前两批已完成，续跑只编码剩下的三批
+    assert len(resumed) == 3
+    assert np.allclose(matrix.astype(np.float32), _encode(texts))
+
+
+def test_switching_models_recreates_the_store(tmp_path):
+    texts = ["t%d " % i * (i + 1) for i in range(6)]
+    out = str(tmp_path / "emb.npy")
+    embed_to_store(texts, out, _encode, _token_lengths, batch_size=2, tag="model-a", show_progress=False)
+
+    calls = []
+
+    def interrupted_encode(batch):
+        calls.append(len(batch))
+        if len(calls) == 2:
+            raise KeyboardInterrupt
+        return -_encode(batch)
+
+    # 维度相同的另一个模型中途中断：尚未嵌入的行是全零（视为未嵌入），不残留上一个模型的向量
+    with pytest.raises(KeyboardInterrupt):
+        embed_to_store(texts, out, interrupted_encode, _token_lengths, batch_size=2, tag="model-b",
+                       show_progress=False)
+    matrix = np.load(out)
+    assert matrix.shape == (6, 3) and sum(row.any() for row in matrix) == 2
+
+    def wider_encode(batch):
+        return np.hstack([_encode(batch), np.ones((len(batch), 2), dtype=np.float32)])
+
+    # 维度不同的模型：重建文件而不是沿用旧的形状
+    matrix = embed_to_store(texts, out, wider_encode, _token_lengths, batch_size=2, tag="model-c", show_progress=False)
+    assert matrix.shape == (6, 5) and np.allclose(matrix.astype(np.float32), wider_encode(texts))
+
+
+def test_duplicate_snippets_are_embedded_once_and_cached(tmp_path):
+    texts = ["int a ;", "int  a; // same", "int b ;", "int a ;"]
+    keys = [code_hash(t) for t in texts]
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite"))
+    encoded = []
+
+    def counting_encode(batch):
+        encoded.extend(batch)
+        return _encode(batch)
+
+    matrix = embed_to_store(texts, str(tmp_path / "a.npy"), counting_encode, _token_lengths,
+                            show_progress=False, tag="m", keys=keys, cache=cache)
+
+    assert len(encoded) == 2
+    assert (matrix[0] == matrix[1]).all() and (matrix[0] == matrix[3]).all()
+
+    # 新语料只嵌入缓存中没有的代码
+    encoded.clear()
+    embed_to_store(["int b ;", "int c ;"], str(tmp_path / "b.npy"), counting_encode, _token_lengths,
+                   show_progress=False, tag="m", keys=[code_hash("int b ;"), code_hash("int c ;")], cache=cache)
+
+    assert encoded == ["int c ;"]
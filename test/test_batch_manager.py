@@ -0,0 +1,206 @@
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+# Ensure project root is on sys.path so imports work when running tests from any cwd
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from utils.llm.batch_manager import BatchManager, shard_jsonl
+from utils.llm.clone_class_summary import join_batch_results
+from utils.llm.llm_client import ProviderConfig
+
+
+class _FakeBatchServer:
+    """
+    模拟 /files、/batches 接口：任务在第 polls_to_finish 次查询时完成，输出为请求内容的回显。
+    前 flaky_downloads 次下载依次返回503和中途断开的响应；expired_batches 中的任务过期，没有输出和错误文件。
+    """
+
+    def __init__(self, polls_to_finish=2, fail_ids=(), flaky_downloads=0, expired_batches=()):
+        self.polls_to_finish = polls_to_finish
+        self.fail_ids = set(fail_ids)
+        self.flaky_downloads = flaky_downloads
+        self.expired_batches = set(expired_batches)
+        self.downloads = 0
+        self.files = {}
+        self.batches = {}
+        self.uploads = 0
+        self.lock = threading.Lock()
+
+    def handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, payload, status=200, raw=None):
+                data = raw if raw is not None else json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers["Content-Length"]))
+                with server.lock:
+                    if self.path == "/v4/files":
+                        server.uploads += 1
+                        file_id = f"file-{len(server.files)}"
+                        # multipart正文中以 {"custom_id" 开头的行就是上传的请求
+                        server.files[file_id] = [
+                            json.loads(line) for line in body.splitlines() if line.startswith(b'{"custom_id"')
+                        ]
+                        return self._reply({"id": file_id})
+                    request = json.loads(body)
+                    batch_id = f"batch-{len(server.batches)}"
+                    server.batches[batch_id] = {"input": request["input_file_id"], "polls": 0}
+                    return self._reply({"id": batch_id, "status": "validating"})
+
+            def do_GET(self):
+                with server.lock:
+                    parts = self.path.strip("/").split("/")
+                    if parts[1] == "batches":
+                        batch = server.batches[parts[2]]
+                        batch["polls"] += 1
+                        if batch["polls"] < server.polls_to_finish:
+                            return self._reply({"id": parts[2], "status": "in_progress"})
+                        if parts[2] in server.expired_batches:
+                            return self._reply({"id": parts[2], "status": "expired"})
+                        return self._reply({
+                            "id": parts[2], "status": "completed", "output_file_id": f"out-{batch['input']}",
+                        })
+                    server.downloads += 1
+                    if server.downloads <= server.flaky_downloads:
+                        if server.downloads % 2:
+                            return self._reply({"error": "busy"}, status=503)
+                        # 声明的长度比实际发送的长，客户端读到一半连接就断了
+                        self.send_response(200)
+                        self.send_header("Content-Length", "1000")
+                        self.end_headers()
+                        self.wfile.write(b'{"custom_id": "clone')
+                        self.close_connection = True
+                        return
+                    requests = server.files[parts[2][len("out-"):]]
+                    lines = []
+                    for r in requests:
+                        if r["custom_id"] in server.fail_ids:
+                            response = {"status_code": 400, "body": {"error": {"message": "bad"}}}
+                        else:
+                            content = "summary:" + r["body"]["messages"][-1]["content"]
+                            response = {"status_code": 200, "body": {
+                                "choices": [{"message": {"content": content}}], "usage": {"total_tokens": 3},
+                            }}
+                        lines.append(json.dumps({"custom_id": r["custom_id"], "response": response}))
+                    return self._reply(None, raw=("\n".join(lines) + "\n").encode())
+
+        return Handler
+
+
+@pytest.fixture
+def fake_batch_server():
+    servers = []
+
+    def start(**kwargs):
+        fake = _FakeBatchServer(**kwargs)
+        server = ThreadingHTTPServer(("127.0.0.1", 0), fake.handler())
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        config = ProviderConfig("fake", f"http://127.0.0.1:{server.server_address[1]}/v4", api_key="k",
+                                backoff_base=0.01)
+        return config, fake
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def _write_requests(path, count):
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(count):
+            f.write(json.dumps({
+                "custom_id": f"clone_class_{i}",
+                "method": "POST",
+                "url": "/v4/chat/completions",
+                "body": {"model": "m", "messages": [{"role": "user", "content": f"code {i}"}]},
+            }) + "\n")
+
+
+def test_shard_jsonl_respects_line_and_byte_limits(tmp_path):
+    path = str(tmp_path / "requests.jsonl")
+    _write_requests(path, 5)
+    line_size = os.path.getsize(path) // 5
+
+    assert shard_jsonl(path, str(tmp_path / "shards")) == [path]
+    by_lines = shard_jsonl(path, str(tmp_path / "by_lines"), max_lines=2)
+    by_bytes = shard_jsonl(path, str(tmp_path / "by_bytes"), max_bytes=line_size * 3 + 5)
+
+    assert len(by_lines) == 3 and len(by_bytes) == 2
+    for shards in (by_lines, by_bytes):
+        with open(path, "rb") as f:
+            assert b"".join(open(s, "rb").read() for s in shards) == f.read()
+
+
+def test_run_submits_polls_downloads_and_joins(fake_batch_server, tmp_path):
+    config, fake = fake_batch_server(polls_to_finish=2, fail_ids={"clone_class_3"})
+    path = str(tmp_path / "requests.jsonl")
+    _write_requests(path, 5)
+
+    with BatchManager(str(tmp_path / "state.json"), config=config, poll_interval=0.01, max_lines=2) as manager:
+        results = manager.run([path])
+
+    assert fake.uploads == 3
+    summaries, errors = join_batch_results(results, list(range(5)), cached={"clone_class_4": "from cache"})
+    assert summaries == {0: "summary:code 0", 1: "summary:code 1", 2: "summary:code 2", 4: "summary:code 4"}
+    assert set(errors) == {3}
+
+
+def test_restart_reuses_saved_job_state(fake_batch_server, tmp_path):
+    config, fake = fake_batch_server(polls_to_finish=3)
+    path = str(tmp_path / "requests.jsonl")
+    state_path = str(tmp_path / "state.json")
+    _write_requests(path, 3)
+
+    with BatchManager(state_path, config=config, poll_interval=0.01) as manager:
+        manager.submit([path])
+        assert not manager.refresh()
+
+    # 模拟进程重启：同一状态文件，不重复上传和创建任务
+    with BatchManager(state_path, config=config, poll_interval=0.01) as manager:
+        results = manager.run([path])
+
+    assert fake.uploads == 1 and len(fake.batches) == 1
+    assert results["clone_class_2"]["content"] == "summary:code 2"
+
+
+def test_transient_download_errors_are_retried(fake_batch_server, tmp_path):
+    config, fake = fake_batch_server(polls_to_finish=1, flaky_downloads=2)
+    path = str(tmp_path / "requests.jsonl")
+    _write_requests(path, 3)
+
+    with BatchManager(str(tmp_path / "state.json"), config=config, poll_interval=0.01) as manager:
+        results = manager.run([path])
+
+    assert fake.downloads == 3
+    assert [results[f"clone_class_{i}"]["content"] for i in range(3)] == [f"summary:code {i}" for i in range(3)]
+
+
+def test_requests_of_an_expired_batch_are_reported_as_errors(fake_batch_server, tmp_path):
+    config, fake = fake_batch_server(polls_to_finish=1, expired_batches={"batch-1"})
+    path = str(tmp_path / "requests.jsonl")
+    _write_requests(path, 4)
+
+    with BatchManager(str(tmp_path / "state.json"), config=config, poll_interval=0.01, max_lines=2) as manager:
+        results = manager.run([path])
+
+    # 第二个分片过期且没有错误文件，它的请求仍出现在结果中，以便重新提交
+    assert sorted(results) == [f"clone_class_{i}" for i in range(4)]
+    assert "content" in results["clone_class_0"] and "content" in results["clone_class_1"]
+    assert "expired" in results["clone_class_2"]["error"] and "expired" in results["clone_class_3"]["error"]
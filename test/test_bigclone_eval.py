@@ -0,0 +1,107 @@
+import os
+import sys
+
+import pytest
+
+# Ensure project root is on sys.path so imports work when running tests from any cwd
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from clone.bigclone_eval import (
+    GroundTruthIndex,
+    evaluate,
+    export_bigcloneeval,
+    file_key,
+    main,
+    results_to_clone_pairs,
+)
+from clone.clone_class import CloneClass
+from clone.clone_csv import write_clone_pairs_csv
+from clone.clone_pair import ClonePair
+from clone.clone_type import CloneType
+from utils.java_code.function_info import FunctionInfo
+
+
+def _pair(f1, s1, e1, f2, s2, e2, clone_type=CloneType.UNKNOWN):
+    return ClonePair(file1=f1, start1=s1, end1=e1, file2=f2, start2=s2, end2=e2, clone_type=clone_type)
+
+
+TRUTH = [
+    _pair("selected/A.java", 10, 19, "selected/B.java", 100, 119, CloneType.TYPE_1),
+    _pair("selected/A.java", 30, 39, "default/C.java", 5, 14, CloneType.TYPE_3),
+    _pair("default/C.java", 50, 59, "default/D.java", 1, 10, CloneType.TYPE_3),
+]
+
+
+def test_file_key_ignores_dataset_root():
+    assert file_key("/data/bcb/selected/A.java") == ("selected", "A.java")
+    assert file_key("selected/A.java") == ("selected", "A.java")
+
+
+def test_coverage_matching_is_order_insensitive_and_tolerant():
+    truth = GroundTruthIndex(TRUTH)
+
+    # 绝对路径、交换顺序、略宽的边界都能匹配
+    assert truth.match(_pair("/x/selected/B.java", 99, 120, "/y/selected/A.java", 10, 19)) == [0]
+    # 覆盖 7/10 行达到 70%
+    assert truth.match(_pair("selected/A.java", 33, 45, "default/C.java", 5, 14)) == [1]
+    # 只覆盖 6/10 行，或片段属于不同的参考克隆对
+    assert truth.match(_pair("selected/A.java", 34, 45, "default/C.java", 5, 14)) == []
+    assert truth.match(_pair("selected/A.java", 10, 19, "default/C.java", 5, 14)) == []
+
+
+def test_recall_by_type_and_precision_sample():
+    truth = GroundTruthIndex(TRUTH)
+    false_positives = GroundTruthIndex([_pair("selected/A.java", 10, 19, "default/D.java", 1, 10)])
+    detected = [
+        _pair("selected/A.java", 10, 19, "selected/B.java", 100, 119),
+        _pair("selected/A.java", 10, 19, "selected/B.java", 101, 119),  # 同一参考克隆对
+        _pair("default/C.java", 50, 59, "default/D.java", 1, 10),
+        _pair("selected/A.java", 10, 19, "default/D.java", 1, 10),  # 已知误报
+        _pair("default/E.java", 1, 10, "default/F.java", 1, 10),  # 未判定
+    ]
+
+    report = evaluate(detected, truth, precision_sample=10, false_positives=false_positives)
+
+    assert report.detected == 5
+    assert report.recall_by_type == {CloneType.TYPE_1: (1, 1), CloneType.TYPE_3: (1, 2)}
+    assert report.recall == pytest.approx(2 / 3)
+    assert (report.sample_true, report.sample_false, len(report.unjudged_sample)) == (3, 1, 1)
+    assert report.precision == pytest.approx(0.75)
+    assert "Type-3: 1/2" in report.format()
+
+    # 没有误报集合时，不匹配参考克隆对的都计为误报
+    assert evaluate(detected, truth, precision_sample=10).precision == pytest.approx(0.6)
+
+
+def test_results_are_expanded_and_exported(tmp_path):
+    functions = [
+        FunctionInfo(10, 19, "", "selected", "A.java", "/data/selected/A.java"),
+        FunctionInfo(1, 10, "", "default", "D.java", "/data/default/D.java"),
+    ]
+    clone_classes = [CloneClass(clone_pairs=[TRUTH[0]]), CloneClass(clone_pairs=[TRUTH[2]])]
+    results = [
+        {"id": 0, "matched_clone_class_id": 1},
+        {"id": 1, "matched_clone_class_id": 2},
+        {"id": 1, "matched_clone_class_id": None},
+    ]
+
+    pairs = list(results_to_clone_pairs(results, functions, clone_classes))
+
+    # 目标自身是克隆类成员时不与自己配对
+    assert [(p.file2, p.start2) for p in pairs] == [("selected/B.java", 100), ("default/C.java", 50)]
+    out = tmp_path / "bce.txt"
+    assert export_bigcloneeval(pairs, str(out)) == 2
+    assert out.read_text().splitlines()[0] == "selected,A.java,10,19,selected,B.java,100,119"
+
+
+def test_cli_reports_recall(tmp_path, capsys):
+    truth_csv = tmp_path / "truth.csv"
+    detected_csv = tmp_path / "detected.csv"
+    write_clone_pairs_csv(TRUTH, str(truth_csv))
+    write_clone_pairs_csv(TRUTH[:2], str(detected_csv))
+
+    main(["--truth", str(truth_csv), "--detected", str(detected_csv), "--export", str(tmp_path / "out.txt")])
+
+    out = capsys.readouterr().out
+    assert "Recall: 66.67%" in out
+    assert "Exported 2 clone pairs" in out
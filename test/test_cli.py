@@ -0,0 +1,49 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+# Ensure project root is on sys.path so imports work when running tests from any cwd
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+import deepclonefinder
+
+HEAVY = ["javalang", "numpy", "httpx", "zai", "tqdm", "config", "clone"]
+
+
+def _loaded_after_import(modules, cwd):
+    """在新的解释器中导入 modules，返回随之加载的重依赖。"""
+    code = (
+        f"import json, sys; sys.path.insert(0, {ROOT!r}); "
+        + "".join(f"import {m}; " for m in modules)
+        + f"print(json.dumps(sorted(set({HEAVY!r}) & set(sys.modules))))"
+    )
+    out = subprocess.run([sys.executable, "-c", code], cwd=cwd, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout)
+
+
+def test_entry_points_import_without_side_effects(tmp_path):
+    assert _loaded_after_import(["deepclonefinder", "pipeline", "parse_clone_class", "utils.logger.logger"], tmp_path) == []
+    assert "javalang" not in _loaded_after_import(["clone.clone_class_parser"], tmp_path)
+    assert "zai" not in _loaded_after_import(["utils.llm.clone_class_summary"], tmp_path)
+    # 日志文件只在第一次使用 logger 时创建
+    assert os.listdir(tmp_path) == []
+
+
+def test_help_lists_every_command(capsys):
+    with pytest.raises(SystemExit) as exc:
+        deepclonefinder.main(["--help"])
+    assert exc.value.code == 0
+    out = capsys.readouterr().out
+    assert all(name in out for name in deepclonefinder.COMMANDS)
+
+
+def test_dispatches_to_subcommand(tmp_path, capsys):
+    (tmp_path / "A.java").write_text("class A {\n}\n")
+
+    deepclonefinder.main(["stats", "--path", str(tmp_path), "--workers", "1"])
+
+    assert "Files: 1  Lines: 2" in capsys.readouterr().out
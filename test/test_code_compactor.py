@@ -0,0 +1,78 @@
+import os
+import sys
+
+# Ensure project root is on sys.path so imports work when running tests from any cwd
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from utils.java_code.code_compactor import TRUNCATION_MARKER, CompactionStats, compact_code
+
+
+SOURCE = """
+/**
+ * Sums the values.
+ */
+public int sumValues(int[] numberOfValues) {
+    // running total
+    int runningTotal = 0;
+    for (int i = 0; i < numberOfValues.length; i++) {
+        runningTotal += numberOfValues[i];
+    }
+    return runningTotal;
+}
+"""
+
+
+def test_comments_and_layout_are_dropped():
+    compacted = compact_code(SOURCE)
+
+    assert "Sums" not in compacted.code and "running total" not in compacted.code
+    assert compacted.code.splitlines()[0] == "public int sumValues(int[]numberOfValues){"
+    assert "for(int i=0;i<numberOfValues.length;i++){" in compacted.code
+    assert compacted.saved_tokens > 0 and not compacted.truncated
+
+
+def test_adjacent_operators_keep_a_space():
+    assert compact_code("a = b - -c; x = y / *p;").code == "a=b- -c;\nx=y/ *p;"
+
+
+def test_long_identifiers_are_abbreviated_but_methods_are_kept():
+    code = compact_code(SOURCE, abbreviate_identifiers=True, min_identifier_length=13).code
+
+    assert "runningTotal" in code  # 短于13个字符，保持不变
+    assert "numberOfValues" not in code
+    assert "sumValues(" in code
+
+
+def test_aliases_skip_member_access_and_existing_names():
+    code = compact_code(
+        "void f(){ int counter = 0; this.counter = counter; int v0 = 1; return v0 + counter; }",
+        abbreviate_identifiers=True,
+        min_identifier_length=4,
+    ).code
+
+    # 字段访问不被替换，别名不与片段中已有的 v0 重名
+    assert "this.counter=v1;" in code
+    assert "return v0+v1;" in code
+
+
+def test_truncation_respects_token_budget_at_statement_boundary():
+    compacted = compact_code(SOURCE, max_tokens=20)
+
+    assert compacted.truncated
+    assert compacted.tokens <= 25
+    assert compacted.code.endswith("int runningTotal=0;\n" + TRUNCATION_MARKER)
+
+
+def test_unlexable_snippet_falls_back_to_regex():
+    compacted = compact_code('String s = "open  // c\n\n  x')
+
+    assert compacted.code == 'String s = "open\nx'
+
+
+def test_stats_summary():
+    stats = CompactionStats()
+    stats.record(10)
+    stats.record(20)
+
+    assert (stats.prompts, stats.saved_tokens) == (2, 30)
+    assert "~15 per prompt" in stats.summary()
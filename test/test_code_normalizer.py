@@ -0,0 +1,28 @@
+import os
+import sys
+
+# Ensure project root is on sys.path so imports work when running tests from any cwd
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from utils.java_code.code_normalizer import code_hash, normalize_code
+
+
+def test_whitespace_and_comments_do_not_change_hash():
+    a = "public int getX() { return x; }"
+    b = """
+    /** Returns x. */
+    public int getX() {
+        // plain getter
+        return x;
+    }
+    """
+    assert normalize_code(b) == "public int getX ( ) { return x ; }"
+    assert code_hash(a) == code_hash(b)
+
+
+def test_different_identifiers_change_hash():
+    assert code_hash("int getX() { return x; }") != code_hash("int getY() { return y; }")
+
+
+def test_unlexable_snippet_falls_back_to_whitespace_split():
+    assert normalize_code('String s = "open  /* c */ ') == 'String s = "open'
@@ -0,0 +1,55 @@
+import os
+import shutil
+import sys
+
+import pytest
+
+# Ensure project root is on sys.path so imports work when running tests from any cwd
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from get_all_functions import extract_functions_from_directory
+from utils.file import corpus_stats
+from utils.file.corpus_stats import CorpusStats, collect_stats, count_lines, methods_by_file
+from utils.file.file_walker import walk_files
+from utils.file.line_counter import count_lines_in_directory
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+TEST_JAVA_FILE = os.path.join(current_dir, "function_extract.java")
+
+
+@pytest.mark.parametrize(
+    "content", [b"", b"a", b"a\n", b"a\r\nb\r\n", b"\n\n", b"x\ny" * 3, b"a\rb\rc", b"a\r", b"\r\r\n\n\r"]
+)
+def test_count_lines_matches_readlines(tmp_path, content):
+    path = tmp_path / "f.java"
+    path.write_bytes(content)
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        expected = len(f.readlines())
+    assert count_lines(str(path)) == (expected, len(content))
+
+
+def test_count_lines_spans_chunks(tmp_path, monkeypatch):
+    monkeypatch.setattr(corpus_stats, "_CHUNK", 7)
+    path = tmp_path / "f.java"
+    path.write_bytes(b"line\n" * 100 + b"tail")
+    assert count_lines(str(path)) == (101, 504)
+    # 块大小为7时 \r 是第一块的最后一个字节，\n 落在第二块
+    path.write_bytes(b"abcdef\r\nx\r")
+    assert count_lines(str(path)) == (2, 10)
+
+
+def test_extraction_collects_stats_in_the_same_pass(tmp_path):
+    for n in range(3):
+        shutil.copy(TEST_JAVA_FILE, tmp_path / f"F{n}.java")
+    (tmp_path / "empty.java").write_text("")
+    (tmp_path / "notes.txt").write_text("ignored\n")
+
+    stats = CorpusStats()
+    functions = extract_functions_from_directory(str(tmp_path), stats=stats)
+
+    standalone = collect_stats(walk_files(str(tmp_path)), methods_by_file(functions), show_progress=False)
+    assert stats.to_dict() == standalone.to_dict()
+    assert stats.files == 4 and stats.methods == len(functions)
+    assert stats.lines_histogram[0] == 1
+    assert count_lines_in_directory(str(tmp_path)) == stats.lines
+    assert "Methods per file" in stats.format()
@@ -0,0 +1,74 @@
+import os
+import shutil
+import sys
+
+# Ensure project root is on sys.path so imports work when running tests from any cwd
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from utils.file.file_cache import FileCache
+from utils.file.file_walker import WalkStats, walk_files
+
+
+def _make_tree(root):
+    for sub in ("a", "a/deep", "b"):
+        os.makedirs(root / sub)
+    for rel in ("Top.java", "a/A.java", "a/deep/D.java", "b/B.java", "b/readme.txt"):
+        (root / rel).write_text(f"// {rel}\n")
+
+
+def _walk_paths(root, extensions=(".java",)):
+    return sorted(
+        os.path.join(dirpath, name)
+        for dirpath, _, names in os.walk(root)
+        for name in names
+        if extensions is None or name.endswith(extensions)
+    )
+
+
+def test_walk_matches_os_walk(tmp_path):
+    _make_tree(tmp_path)
+
+    entries = walk_files(str(tmp_path))
+
+    assert [e.path for e in entries] == _walk_paths(str(tmp_path))
+    assert [e.path for e in walk_files(str(tmp_path), extensions=None)] == _walk_paths(str(tmp_path), None)
+    assert all(e.size == os.path.getsize(e.path) for e in entries)
+
+
+def test_manifest_rescans_only_changed_directories(tmp_path):
+    root = tmp_path / "data"
+    os.makedirs(root)
+    _make_tree(root)
+    manifest = str(tmp_path / "manifest.json")
+
+    first = WalkStats()
+    walk_files(str(root), manifest_path=manifest, stats=first)
+    assert (first.scanned_dirs, first.reused_dirs) == (4, 0)
+
+    second = WalkStats()
+    assert [e.path for e in walk_files(str(root), manifest_path=manifest, stats=second)] == _walk_paths(str(root))
+    assert (second.scanned_dirs, second.reused_dirs) == (0, 4)
+
+    (root / "a" / "deep" / "New.java").write_text("class New {}\n")
+    shutil.rmtree(root / "b")
+    third = WalkStats()
+    paths = [e.path for e in walk_files(str(root), manifest_path=manifest, stats=third)]
+    assert paths == _walk_paths(str(root))
+    # 根目录（删除了b）和 a/deep（新增文件）重新扫描，a 沿用清单
+    assert (third.scanned_dirs, third.reused_dirs) == (2, 1)
+
+    # 扩展名不同的遍历不复用这份清单
+    other = WalkStats()
+    walk_files(str(root), extensions=None, manifest_path=manifest, stats=other)
+    assert other.reused_dirs == 0
+
+
+def test_file_cache_uses_the_walker(tmp_path):
+    root = tmp_path / "data"
+    os.makedirs(root)
+    _make_tree(root)
+
+    cache = FileCache(str(root), show_progress=False, manifest_path=str(tmp_path / "manifest.json"))
+
+    assert sorted(cache.get_all_files()) == [os.path.abspath(p) for p in _walk_paths(str(root), None)]
+    assert cache.get_file(os.path.abspath(root / "b" / "readme.txt")) == "// b/readme.txt\n"
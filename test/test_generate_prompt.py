@@ -0,0 +1,51 @@
+import logging
+import os
+import sys
+
+# Ensure project root is on sys.path so imports work when running tests from any cwd
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from utils.llm.generate_prompt import PromptTemplate, TemplateRegistry, generate_prompt
+
+
+def test_render_fills_placeholders_in_one_pass():
+    template = PromptTemplate("Hello {{name}}, {{name}} has {{count}} items.")
+
+    assert template.placeholders == {"name", "count"}
+    # 值中出现的 {{...}} 不会被再次替换
+    assert template.render({"name": "{{count}}", "count": 3}) == "Hello {{count}}, {{count}} has 3 items."
+
+
+def test_missing_and_unknown_placeholders_are_reported_once(caplog):
+    template = PromptTemplate("A {{x}} B {{y}}", name="t.md")
+
+    with caplog.at_level(logging.WARNING, logger="DeepCloneFinder"):
+        first = template.render({"x": "1", "z": "2"})
+        template.render({"x": "1", "z": "2"})
+
+    assert first == "A 1 B {{y}}"
+    messages = [r.getMessage() for r in caplog.records]
+    assert len(messages) == 2
+    assert any("{{y}}" in m for m in messages) and any("'z'" in m for m in messages)
+
+
+def test_registry_reloads_only_when_file_changes(tmp_path):
+    path = tmp_path / "p.md"
+    path.write_text("v1 {{k}}", encoding="utf-8")
+    registry = TemplateRegistry()
+
+    first = registry.get(str(path))
+    assert registry.get(str(path)) is first
+    assert registry.render(str(path), {"k": "a"}) == "v1 a"
+
+    mtime = os.stat(path).st_mtime_ns
+    path.write_text("version 2 {{k}}", encoding="utf-8")
+    os.utime(path, ns=(mtime, mtime + 1_000_000))
+    assert registry.render(str(path), {"k": "b"}) == "version 2 b"
+
+
+def test_generate_prompt_keeps_old_behaviour(tmp_path):
+    path = tmp_path / "q.md"
+    path.write_text("Summarize {{code}}", encoding="utf-8")
+
+    assert generate_prompt(str(path), {"code": "x"}) == "Summarize x"
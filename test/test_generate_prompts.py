@@ -0,0 +1,366 @@
+import dataclasses
+import json
+import os
+import re
+import sys
+
+import numpy as np
+import pytest
+
+# Ensure project root is on sys.path so imports work when running tests from any cwd
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import generate_prompts
+from utils.file.file_io import write_functions_to_disk
+from utils.java_code.function_info import FunctionInfo
+from utils.java_code.java_parser import JavaParser
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+TEST_JAVA_FILE = os.path.join(current_dir, "function_extract.java")
+TEST_CLONE_CSV = os.path.join(current_dir, "test_parsed.csv")
+
+NOT_CLONE = '{"is_clone": false, "matched_rep_id": null, "confidence": 0.9, "reason": "different"}'
+
+
+@pytest.fixture
+def functions_pkl(tmp_path):
+    path = str(tmp_path / "functions.pkl")
+    write_functions_to_disk(JavaParser(TEST_JAVA_FILE).extract_functions(), path)
+    return path
+
+
+def _read_results(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_resume_skips_completed_and_retries_errors(functions_pkl, tmp_path, monkeypatch):
+    out = str(tmp_path / "results.jsonl")
+    calls = []
+
+    def flaky_completion(prompt, model="gpt-4"):
+        calls.append(prompt)
+        if len(calls) % 3 == 0:
+            raise RuntimeError("boom")
+        return NOT_CLONE
+
+    monkeypatch.setattr(generate_prompts, "call_openai_completion", flaky_completion)
+    generate_prompts.generate_prompts(functions_pkl, TEST_CLONE_CSV, out)
+    first = _read_results(out)
+    errored = {r["id"] for r in first if "error" in r}
+    assert len(first) == 8 and errored
+
+    monkeypatch.setattr(generate_prompts, "call_openai_completion", lambda prompt, model="gpt-4": NOT_CLONE)
+    generate_prompts.generate_prompts(functions_pkl, TEST_CLONE_CSV, out, resume=True)
+
+    second = _read_results(out)
+    assert len(second) == 8 + len(errored)
+    assert {r["id"] for r in second[8:]} == errored
+    assert all("error" not in r for r in second[8:])
+
+
+def _packed_response(prompt, verdict_for):
+    ids = [int(i) for i in re.findall(r"\[TARGET id=(\d+)\]", prompt)]
+    return json.dumps({"results": {str(i): verdict_for(i) for i in ids}})
+
+
+def test_packed_mode_answers_several_targets_per_call(functions_pkl, tmp_path, monkeypatch):
+    out = str(tmp_path / "results.jsonl")
+    prompts = []
+
+    def packed_completion(prompt, model="gpt-4", max_tokens=1024):
+        prompts.append(prompt)
+        return _packed_response(prompt, lambda i: {"is_clone": i == 7, "matched_rep_id": 0, "confidence": 1.0})
+
+    monkeypatch.setattr(generate_prompts, "call_openai_completion", packed_completion)
+    generate_prompts.generate_prompts(functions_pkl, TEST_CLONE_CSV, out, pack_size=4)
+
+    results = {r["id"]: r for r in _read_results(out)}
+    assert len(prompts) == 2
+    assert sorted(results) == list(range(8))
+    assert results[7]["matched_clone_class_id"] == 1
+    assert all(results[i]["matched_clone_class_id"] is None for i in range(7))
+
+
+def test_malformed_packed_response_falls_back_to_single_targets(functions_pkl, tmp_path, monkeypatch):
+    out = str(tmp_path / "results.jsonl")
+    single_calls = []
+
+    def completion(prompt, model="gpt-4", max_tokens=1024):
+        if "[TARGET id=" in prompt:
+            # 只给出了部分目标的判定，其中一个还缺字段
+            return _packed_response(prompt, lambda i: {"is_clone": False} if i % 2 == 0 else {"oops": 1})
+        single_calls.append(prompt)
+        return NOT_CLONE
+
+    monkeypatch.setattr(generate_prompts, "call_openai_completion", completion)
+    generate_prompts.generate_prompts(functions_pkl, TEST_CLONE_CSV, out, pack_size=8)
+
+    results = _read_results(out)
+    assert sorted(r["id"] for r in results) == list(range(8))
+    assert all("error" not in r for r in results)
+    assert len(single_calls) == 4
+
+
+def test_packed_calls_stay_within_prompt_limit(functions_pkl, monkeypatch):
+    functions = generate_prompts.read_functions_from_disk(functions_pkl)
+    reps = [{"class_id": 100 + i, "function": f} for i, f in enumerate(functions)]
+    pack = list(enumerate(functions[:2]))
+    sent = []
+
+    def completion(prompt, model="gpt-4", max_tokens=1024):
+        sent.append(generate_prompts.estimate_tokens(prompt) + max_tokens)
+        return _packed_response(prompt, lambda i: {"is_clone": False})
+
+    monkeypatch.setattr(generate_prompts, "call_openai_completion", completion)
+    limit = generate_prompts.estimate_tokens(generate_prompts.build_packed_prompt(pack, [])) + 600
+    generate_prompts.process_pack(pack, reps, "m", max_prompt_tokens=limit)
+
+    # 提示词加上请求的输出token数不超过上限
+    assert len(sent) > 1 and max(sent) <= limit
+
+
+def test_plan_packs_respects_token_budget(functions_pkl):
+    functions = generate_prompts.read_functions_from_disk(functions_pkl)
+    targets = list(enumerate(functions))
+    reps = [{"class_id": 1, "function": functions[0]}]
+
+    base = generate_prompts.estimate_tokens(generate_prompts.build_packed_prompt([], reps))
+    packs = generate_prompts.plan_packs(targets, lambda i: reps, pack_size=8, token_budget=base + 400)
+
+    assert sorted(idx for pack, _ in packs for idx, _ in pack) == list(range(8))
+    assert len(packs) > 1
+
+
+def test_prompts_with_same_representatives_share_prefix(functions_pkl):
+    functions = generate_prompts.read_functions_from_disk(functions_pkl)
+    reps = [{"class_id": 1, "function": functions[0]}]
+
+    a = generate_prompts.build_prompt(functions[1], reps)
+    b = generate_prompts.build_prompt(functions[2], reps)
+    prefix = os.path.commonprefix([a, b])
+
+    assert prefix.index("REPRESENTATIVE FUNCTIONS") < len(prefix)
+    assert a.index("REPRESENTATIVE FUNCTIONS") < a.index("TARGET FUNCTION")
+    assert len(prefix) > len(generate_prompts.PROMPT_PREFIX_TEMPLATE.format(rep_block=""))
+
+
+def test_oversized_representative_list_is_chunked_and_merged(functions_pkl, monkeypatch):
+    functions = generate_prompts.read_functions_from_disk(functions_pkl)
+    reps = [{"class_id": 100 + i, "function": f} for i, f in enumerate(functions)]
+    seen_chunks = []
+
+    def completion(prompt, model="gpt-4", max_tokens=1024):
+        class_ids = [int(c) for c in re.findall(r"\[REP id=\d+ class=(\d+)\]", prompt)]
+        seen_chunks.append(class_ids)
+        if 105 in class_ids:
+            rep_id = class_ids.index(105)
+            return json.dumps({"is_clone": True, "matched_rep_id": rep_id, "confidence": 0.8})
+        if 101 in class_ids:
+            return json.dumps({"is_clone": True, "matched_rep_id": class_ids.index(101), "confidence": 0.3})
+        return NOT_CLONE
+
+    monkeypatch.setattr(generate_prompts, "call_openai_completion", completion)
+    overhead = generate_prompts.estimate_tokens(generate_prompts.build_prompt(functions[0], []))
+    record = generate_prompts.process_target(
+        0, functions[0], reps, "m", max_prompt_tokens=overhead + generate_prompts.SINGLE_RESULT_TOKENS + 300
+    )
+
+    assert len(seen_chunks) > 1
+    assert sorted(c for chunk in seen_chunks for c in chunk) == [r["class_id"] for r in reps]
+    assert record["matched_clone_class_id"] == 105
+
+
+def test_prompts_use_compacted_code_and_record_savings(functions_pkl):
+    functions = generate_prompts.read_functions_from_disk(functions_pkl)
+    commented = next(f for f in functions if "//" in (f.code_snippet or "") or "/*" in (f.code_snippet or ""))
+    reps = [{"class_id": 1, "function": functions[0]}]
+    code_format = generate_prompts.CodeFormat(stats=generate_prompts.CompactionStats())
+
+    compact = generate_prompts.build_prompt(commented, reps, code_format)
+    verbatim = generate_prompts.build_prompt(commented, reps, generate_prompts.CodeFormat(compact=False))
+    generate_prompts.process_target(0, commented, reps, "gpt-4", code_format=code_format)
+
+    assert generate_prompts.estimate_tokens(compact) < generate_prompts.estimate_tokens(verbatim)
+    assert code_format.stats.prompts == 1 and code_format.stats.saved_tokens > 0
+
+
+def test_bounded_map_limits_pending_and_reorders():
+    import threading
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+
+    lock = threading.Lock()
+    state = {"live": 0, "peak": 0}
+
+    def work(i):
+        with lock:
+            state["live"] += 1
+            state["peak"] = max(state["peak"], state["live"])
+        time.sleep(0.02 if i % 3 == 0 else 0.001)
+        with lock:
+            state["live"] -= 1
+        return i * i
+
+    consumed = []
+
+    def items():
+        for i in range(20):
+            consumed.append(i)
+            yield i
+
+    with ThreadPoolExecutor(max_workers=4) as ex:
+        results = []
+        for item, value in generate_prompts.bounded_map(ex, work, items(), max_pending=3, ordered=True):
+            # 产出第n个结果时，最多已从输入取走 n+3 个
+            assert len(consumed) <= len(results) + 1 + 3
+            results.append((item, value))
+
+    assert results == [(i, i * i) for i in range(20)]
+    assert state["peak"] <= 3
+
+
+def test_saved_prompts_are_the_prompts_sent(functions_pkl, tmp_path, monkeypatch):
+    out = str(tmp_path / "results.jsonl")
+    prompts_out = str(tmp_path / "prompts.jsonl")
+    sent = []
+
+    def completion(prompt, model="gpt-4"):
+        sent.append(prompt)
+        return NOT_CLONE
+
+    monkeypatch.setattr(generate_prompts, "call_openai_completion", completion)
+    generate_prompts.generate_prompts(
+        functions_pkl, TEST_CLONE_CSV, out, concurrency=2, save_prompts=True, prompts_out=prompts_out, ordered=True
+    )
+
+    saved = _read_results(prompts_out)
+    assert [r["id"] for r in _read_results(out)] == list(range(8))
+    assert sorted(r["prompt"] for r in saved) == sorted(sent)
+    assert all(r["tokens_saved"] >= 0 for r in saved)
+
+
+def test_saved_representative_catalog_skips_clone_class_parsing(functions_pkl, tmp_path, monkeypatch):
+    catalog = str(tmp_path / "catalog.json")
+    monkeypatch.setattr(generate_prompts, "call_openai_completion", lambda prompt, model="gpt-4": NOT_CLONE)
+    generate_prompts.generate_prompts(functions_pkl, TEST_CLONE_CSV, str(tmp_path / "a.jsonl"), rep_catalog=catalog)
+
+    def fail(path):
+        raise AssertionError("clone classes should come from the catalog")
+
+    monkeypatch.setattr(generate_prompts, "read_clone_classes_from_csv", fail)
+    generate_prompts.generate_prompts(functions_pkl, TEST_CLONE_CSV, str(tmp_path / "b.jsonl"), rep_catalog=catalog)
+
+    first, second = (sorted(_read_results(str(tmp_path / n)), key=lambda r: r["id"]) for n in ("a.jsonl", "b.jsonl"))
+    assert first == second
+
+
+def test_max_reps_limits_classes_not_representatives(functions_pkl, tmp_path, monkeypatch, capsys):
+    reps = [{"class_id": c, "function": None} for c in (1, 1, 2, 2, 3)]
+    assert [r["class_id"] for r in generate_prompts.first_classes(reps, 2)] == [1, 1, 2, 2]
+
+    monkeypatch.setattr(generate_prompts, "call_openai_completion", lambda prompt, model="gpt-4": NOT_CLONE)
+    generate_prompts.generate_prompts(
+        functions_pkl, TEST_CLONE_CSV, str(tmp_path / "out.jsonl"), max_reps=1, medoids_per_class=2
+    )
+    # 测试数据只有一个克隆类，它的两个medoid都保留
+    assert "Using 2 representatives." in capsys.readouterr().out
+
+
+def test_prescreen_skips_llm_for_obvious_non_clones(functions_pkl, tmp_path, monkeypatch):
+    out = str(tmp_path / "results.jsonl")
+    calls = []
+
+    def completion(prompt, model="gpt-4"):
+        calls.append(prompt)
+        return NOT_CLONE
+
+    monkeypatch.setattr(generate_prompts, "call_openai_completion", completion)
+    generate_prompts.generate_prompts(functions_pkl, TEST_CLONE_CSV, out)
+    report = generate_prompts.generate_prompts(
+        functions_pkl, TEST_CLONE_CSV, out, calibration_labels=out, max_miss_rate=0.0,
+    )
+    assert report.samples == 8 and report.positives == 0
+
+    calls.clear()
+    generate_prompts.generate_prompts(
+        functions_pkl, TEST_CLONE_CSV, out, prescreen=generate_prompts.PreScreener(low=0.6),
+    )
+    results = _read_results(out)
+    prescreened = [r for r in results if "prescreen_score" in r]
+    assert sorted(r["id"] for r in results) == list(range(8))
+    assert prescreened and len(calls) == 8 - len(prescreened)
+    assert all(r["prescreen_score"] < 0.6 and r["matched_clone_class_id"] is None for r in prescreened)
+
+
+def test_duplicate_targets_share_one_call(tmp_path, monkeypatch):
+    functions = JavaParser(TEST_JAVA_FILE).extract_functions()
+    original = functions[0]
+    # 仅排版和注释不同的副本
+    copy = dataclasses.replace(
+        original,
+        start_line=original.start_line + 1000,
+        end_line=original.end_line + 1000,
+        code_snippet="// copy\n" + "\n\n".join(original.code_snippet.split("\n")),
+    )
+    path = str(tmp_path / "functions.pkl")
+    write_functions_to_disk(functions + [copy], path)
+    out = str(tmp_path / "results.jsonl")
+    calls = []
+
+    def completion(prompt, model="gpt-4"):
+        calls.append(prompt)
+        return NOT_CLONE
+
+    monkeypatch.setattr(generate_prompts, "call_openai_completion", completion)
+    generate_prompts.generate_prompts(path, TEST_CLONE_CSV, out)
+
+    results = {r["id"]: r for r in _read_results(out)}
+    assert len(calls) == len(functions)
+    assert sorted(results) == list(range(len(functions) + 1))
+    duplicate = results[len(functions)]
+    assert duplicate["duplicate_of"] == 0
+    assert duplicate["start_line"] == copy.start_line
+    assert duplicate["matched_clone_class_id"] == results[0]["matched_clone_class_id"]
+
+    calls.clear()
+    generate_prompts.generate_prompts(path, TEST_CLONE_CSV, str(tmp_path / "all.jsonl"), dedup=False)
+    assert len(calls) == len(functions) + 1
+
+
+def test_stale_representative_index_is_rebuilt(tmp_path):
+    functions = [FunctionInfo(i, i + 1, f"void f{i}() {{}}", "dir", f"F{i}.java", f"F{i}.java") for i in range(3)]
+    vectors = {f.start_line: np.eye(3, dtype=np.float32)[f.start_line] for f in functions}
+
+    def embedding_of(f):
+        return vectors[f.start_line]
+
+    index_dir = str(tmp_path / "rep_index")
+
+    old = [{"class_id": 1, "function": functions[0]}, {"class_id": 2, "function": functions[1]}]
+    generate_prompts.load_or_build_rep_index(old, index_dir, embedding_of)
+    assert generate_prompts.load_or_build_rep_index(old, index_dir, embedding_of).top_classes([vectors[1]], 1) == [[2]]
+
+    # 代表目录变化（如 max_reps 或 medoid 数不同）后，同一目录中的旧索引不能再被使用
+    new = [{"class_id": 7, "function": functions[1]}, {"class_id": 9, "function": functions[2]}]
+    rep_index = generate_prompts.load_or_build_rep_index(new, index_dir, embedding_of)
+    assert rep_index.top_classes([vectors[1]], 1) == [[7]]
+    assert len(rep_index) == 2
+
+
+def test_target_larger_than_prompt_limit_is_not_chunked(functions_pkl, monkeypatch):
+    functions = generate_prompts.read_functions_from_disk(functions_pkl)
+    reps = [{"class_id": 100 + i, "function": f} for i, f in enumerate(functions)]
+    calls = []
+    monkeypatch.setattr(generate_prompts, "call_openai_completion",
+                        lambda prompt, model="gpt-4", max_tokens=1024: calls.append(prompt) or NOT_CLONE)
+    overhead = generate_prompts.estimate_tokens(generate_prompts.build_prompt(functions[0], []))
+
+    record = generate_prompts.process_target(0, functions[0], reps, "m", max_prompt_tokens=overhead)
+    records = generate_prompts.process_pack(list(enumerate(functions[:2])), reps, "m", max_prompt_tokens=10)
+
+    assert calls == []
+    assert "max_prompt_tokens" in record["error"]
+    assert [r["id"] for r in records] == [0, 1] and all("error" in r for r in records)
+    with pytest.raises(ValueError):
+        generate_prompts.chunk_representatives(reps, -5)
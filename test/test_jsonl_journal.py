@@ -0,0 +1,46 @@
+import os
+import sys
+
+# Ensure project root is on sys.path so imports work when running tests from any cwd
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from utils.file.jsonl_journal import JsonlJournal, load_journal
+
+
+def test_partial_trailing_line_is_ignored_and_repaired(tmp_path):
+    path = str(tmp_path / "out.jsonl")
+    with JsonlJournal(path) as journal:
+        journal.append({"id": 0, "ok": True})
+        journal.append({"id": 1, "ok": True})
+    # 模拟写入中途崩溃
+    with open(path, "ab") as f:
+        f.write(b'{"id": 2, "ok"')
+
+    assert set(load_journal(path)) == {0, 1}
+
+    with JsonlJournal(path, resume=True) as journal:
+        journal.append({"id": 2, "ok": True})
+
+    with open(path, "rb") as f:
+        lines = f.read().splitlines()
+    assert len(lines) == 3
+    assert set(load_journal(path)) == {0, 1, 2}
+
+
+def test_later_records_override_earlier_ones(tmp_path):
+    path = str(tmp_path / "out.jsonl")
+    with JsonlJournal(path) as journal:
+        journal.append({"id": 5, "error": "timeout"})
+        journal.append({"id": 5, "matched_clone_class_id": 3})
+
+    assert load_journal(path)[5] == {"id": 5, "matched_clone_class_id": 3}
+
+
+def test_without_resume_file_is_truncated(tmp_path):
+    path = str(tmp_path / "out.jsonl")
+    with JsonlJournal(path) as journal:
+        journal.append({"id": 0})
+    with JsonlJournal(path) as journal:
+        journal.append({"id": 1})
+
+    assert set(load_journal(path)) == {1}
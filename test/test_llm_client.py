@@ -0,0 +1,354 @@
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+# Ensure project root is on sys.path so imports work when running tests from any cwd
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import generate_prompts
+from utils.file.file_io import write_functions_to_disk
+from utils.java_code.java_parser import JavaParser
+from utils.llm import llm_client
+from utils.llm.function_summary import ask_llm_for_function_summary
+from utils.llm.accounting import BudgetExceededError, ModelPrice, UsageLedger
+from utils.llm.llm_client import AsyncLLMClient, LLMRequestError, ProviderConfig, TokenBucket
+from utils.llm.response_cache import ResponseCache
+
+
+class _StubState:
+    def __init__(self, failures=0, fail_status=429, delay=0.0, reply=None, retry_after="0", malformed=0):
+        self.failures = failures
+        self.reply = reply
+        self.retry_after = retry_after
+        self.malformed = malformed
+        self.fail_status = fail_status
+        self.delay = delay
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+
+def _make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            with state.lock:
+                state.requests.append((self.path, self.headers.get("Authorization"), body))
+                state.in_flight += 1
+                state.max_in_flight = max(state.max_in_flight, state.in_flight)
+                fail = state.failures > 0
+                if fail:
+                    state.failures -= 1
+                malformed = not fail and state.malformed > 0
+                if malformed:
+                    state.malformed -= 1
+            time.sleep(state.delay)
+            with state.lock:
+                state.in_flight -= 1
+
+            if fail:
+                payload = json.dumps({"error": "slow down"}).encode()
+                self.send_response(state.fail_status)
+                self.send_header("Retry-After", state.retry_after)
+            elif malformed:
+                payload = b"<html>bad gateway</html>"
+                self.send_response(200)
+            else:
+                content = state.reply(body) if state.reply else "echo:" + body["messages"][-1]["content"]
+                payload = json.dumps({
+                    "choices": [{"message": {"role": "assistant", "content": content}}],
+                    "usage": {"prompt_tokens": 3, "completion_tokens": 2, "total_tokens": 5},
+                }).encode()
+                self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+    return Handler
+
+
+@pytest.fixture
+def stub_server():
+    servers = []
+
+    def start(**kwargs):
+        state = _StubState(**kwargs)
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _make_handler(state))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_address[1]}/v1", state
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def _config(base_url, **overrides):
+    params = dict(api_key="sk-test", backoff_base=0.01, requests_per_minute=0, tokens_per_minute=0)
+    params.update(overrides)
+    return ProviderConfig("stub", base_url, **params)
+
+
+async def _chat_many(config, count):
+    client = AsyncLLMClient(config)
+    try:
+        return await asyncio.gather(*[
+            client.chat("m", [{"role": "user", "content": str(i)}]) for i in range(count)
+        ])
+    finally:
+        await client.aclose()
+
+
+def test_chat_retries_rate_limited_requests(stub_server):
+    base_url, state = stub_server(failures=2)
+
+    [result] = asyncio.run(_chat_many(_config(base_url), 1))
+
+    assert result.content == "echo:0"
+    assert result.attempts == 3
+    assert result.usage["total_tokens"] == 5
+    assert state.requests[0][0] == "/v1/chat/completions"
+    assert state.requests[0][1] == "Bearer sk-test"
+
+
+def test_chat_gives_up_after_max_retries(stub_server):
+    base_url, _ = stub_server(failures=10, fail_status=503)
+
+    with pytest.raises(LLMRequestError) as exc:
+        asyncio.run(_chat_many(_config(base_url, max_retries=1), 1))
+    assert exc.value.status_code == 503
+
+
+def test_client_error_is_not_retried(stub_server):
+    base_url, state = stub_server(failures=1, fail_status=400)
+
+    with pytest.raises(LLMRequestError):
+        asyncio.run(_chat_many(_config(base_url), 1))
+    assert len(state.requests) == 1
+
+
+def test_in_flight_requests_are_bounded(stub_server):
+    base_url, state = stub_server(delay=0.05)
+
+    results = asyncio.run(_chat_many(_config(base_url, max_in_flight=3), 12))
+
+    assert sorted(r.content for r in results) == sorted(f"echo:{i}" for i in range(12))
+    assert state.max_in_flight <= 3
+
+
+def test_token_bucket_limits_rate():
+    async def run():
+        bucket = TokenBucket(capacity=5, rate=50)
+        started = time.monotonic()
+        for _ in range(15):
+            await bucket.acquire(1)
+        return time.monotonic() - started
+
+    # 前5个来自初始容量，其余10个以每秒50个的速度补充
+    assert asyncio.run(run()) >= 0.18
+
+
+def test_chat_sync_shares_one_client_per_provider(stub_server):
+    base_url, state = stub_server()
+    llm_client.configure_provider("stub-sync", base_url=base_url, api_key="k", requests_per_minute=0)
+    try:
+        first = llm_client.chat_sync("stub-sync", "m", [{"role": "user", "content": "a"}])
+        second = llm_client.chat_sync("stub-sync", "m", [{"role": "user", "content": "b"}])
+        assert (first.content, second.content) == ("echo:a", "echo:b")
+        assert llm_client.get_llm_client("stub-sync") is llm_client.get_llm_client("stub-sync")
+    finally:
+        llm_client.close_all_clients()
+        llm_client.PROVIDERS.pop("stub-sync", None)
+
+
+def test_cached_responses_skip_the_server(stub_server, tmp_path):
+    base_url, state = stub_server()
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"))
+
+    async def run():
+        client = AsyncLLMClient(_config(base_url), cache=cache)
+        try:
+            first = await client.chat("m", [{"role": "user", "content": "x"}], temperature=0)
+            second = await client.chat("m", [{"role": "user", "content": "x"}], temperature=0)
+            return first, second
+        finally:
+            await client.aclose()
+
+    first, second = asyncio.run(run())
+
+    assert not first.cached and second.cached
+    assert second.content == first.content
+    assert len(state.requests) == 1
+    assert cache.saved_prompt_tokens == 3
+
+
+def test_ledger_records_usage_and_enforces_hard_budget(stub_server):
+    base_url, state = stub_server(failures=1)
+    # 每次成功请求 3 prompt + 2 completion tokens，花费 7 单位
+    ledger = UsageLedger({"m": ModelPrice(prompt=1_000_000, completion=2_000_000)}, hard_budget=14)
+
+    async def run():
+        client = AsyncLLMClient(_config(base_url), ledger=ledger)
+        try:
+            for i in range(3):
+                await client.chat("m", [{"role": "user", "content": str(i)}])
+        finally:
+            await client.aclose()
+
+    with pytest.raises(BudgetExceededError):
+        asyncio.run(run())
+
+    summary = ledger.summary()
+    assert summary["requests"] == 2
+    assert summary["retries"] == 1
+    assert (summary["prompt_tokens"], summary["completion_tokens"]) == (6, 4)
+    assert summary["cost"] == 14
+    assert len(state.requests) == 3
+
+
+def test_invalid_replies_are_not_cached(stub_server, tmp_path):
+    base_url, state = stub_server()
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"))
+
+    async def run():
+        client = AsyncLLMClient(_config(base_url), cache=cache)
+        try:
+            for _ in range(2):
+                with pytest.raises(ValueError):
+                    await client.chat("m", [{"role": "user", "content": "x"}], validate=json.loads)
+        finally:
+            await client.aclose()
+
+    asyncio.run(run())
+
+    assert len(state.requests) == 2
+    assert len(cache) == 0
+
+
+def test_function_summary_does_not_cache_unparseable_replies(stub_server, tmp_path, monkeypatch):
+    replies = iter(["not json"])
+    base_url, state = stub_server(reply=lambda body: next(replies, '{"summary": "ok"}'))
+    monkeypatch.setitem(llm_client.PROVIDERS, "zhipu", _config(base_url))
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"))
+    llm_client.set_response_cache(cache)
+    try:
+        with pytest.raises(ValueError):
+            ask_llm_for_function_summary("system", "user", api_key=None)
+        assert ask_llm_for_function_summary("system", "user", api_key=None) == {"summary": "ok"}
+    finally:
+        llm_client.close_all_clients()
+        llm_client.set_response_cache(None)
+        cache.close()
+
+    assert len(state.requests) == 2
+
+
+def test_resume_after_parse_error_sends_a_fresh_request(stub_server, tmp_path, monkeypatch):
+    verdict = '{"is_clone": false, "matched_rep_id": null, "confidence": 0.9, "reason": "different"}'
+    replies = iter(["not json"])
+    base_url, state = stub_server(reply=lambda body: next(replies, verdict))
+    monkeypatch.setitem(llm_client.PROVIDERS, "openai", _config(base_url))
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"))
+    llm_client.set_response_cache(cache)
+    test_dir = os.path.dirname(os.path.abspath(__file__))
+    functions = str(tmp_path / "functions.pkl")
+    out = str(tmp_path / "results.jsonl")
+    try:
+        write_functions_to_disk(JavaParser(os.path.join(test_dir, "function_extract.java")).extract_functions(),
+                                functions)
+        generate_prompts.generate_prompts(functions, os.path.join(test_dir, "test_parsed.csv"), out, limit=1)
+        generate_prompts.generate_prompts(functions, os.path.join(test_dir, "test_parsed.csv"), out, limit=1,
+                                          resume=True)
+    finally:
+        llm_client.close_all_clients()
+        llm_client.set_response_cache(None)
+        cache.close()
+
+    with open(out, "r", encoding="utf-8") as f:
+        records = [json.loads(line) for line in f]
+    assert "error" in records[0] and "error" not in records[-1]
+    assert len(state.requests) == 2
+
+
+def test_concurrent_requests_never_exceed_hard_budget(stub_server):
+    base_url, state = stub_server(delay=0.05)
+    # 每次请求实际花费 3*1 + 2*2 = 7；估计 7 prompt + 2 completion tokens = 11，预算够预占5个在途请求
+    ledger = UsageLedger({"m": ModelPrice(prompt=1_000_000, completion=2_000_000)}, hard_budget=60)
+
+    async def run():
+        client = AsyncLLMClient(_config(base_url, max_in_flight=16), ledger=ledger)
+
+        async def one(i):
+            try:
+                await client.chat("m", [{"role": "user", "content": f"{i:02d}"}], max_tokens=2)
+                return True
+            except BudgetExceededError:
+                return False
+
+        try:
+            return await asyncio.gather(*[one(i) for i in range(16)])
+        finally:
+            await client.aclose()
+
+    outcomes = asyncio.run(run())
+
+    assert ledger.cost <= 60
+    assert sum(outcomes) == len(state.requests) == 5
+    assert ledger.reserved == 0
+
+
+def test_backoff_does_not_hold_the_in_flight_slot(stub_server):
+    base_url, state = stub_server(failures=1, retry_after="0.3")
+    finished = []
+
+    async def run():
+        client = AsyncLLMClient(_config(base_url, max_in_flight=1), ledger=None)
+
+        async def one(i):
+            result = await client.chat("m", [{"role": "user", "content": str(i)}])
+            finished.append(result.content)
+
+        try:
+            await asyncio.gather(*[one(i) for i in range(3)])
+        finally:
+            await client.aclose()
+
+    asyncio.run(run())
+
+    # 被限流的请求退避期间，其余请求占用唯一的在途名额先完成
+    rate_limited = state.requests[0][2]["messages"][0]["content"]
+    assert finished[-1] == "echo:" + rate_limited
+
+
+def test_malformed_success_body_is_retried_and_recorded(stub_server):
+    base_url, state = stub_server(malformed=5)
+    ledger = UsageLedger({"m": ModelPrice(prompt=1, completion=1)})
+
+    async def run(config):
+        client = AsyncLLMClient(config, ledger=ledger)
+        try:
+            return await client.chat("m", [{"role": "user", "content": "x"}])
+        finally:
+            await client.aclose()
+
+    with pytest.raises(LLMRequestError) as exc:
+        asyncio.run(run(_config(base_url, max_retries=1)))
+    assert exc.value.status_code == 200 and "Malformed" in str(exc.value)
+    assert ledger.summary()["errors"] == {"HTTP 200": 1}
+
+    state.malformed = 1
+    assert asyncio.run(run(_config(base_url))).content == "echo:x"
@@ -0,0 +1,65 @@
+import os
+import sys
+
+# Ensure project root is on sys.path so imports work when running tests from any cwd
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from clone.prescreen import PreScreener, ast_node_histogram, calibrate, extract_features, similarity
+from utils.java_code.function_info import FunctionInfo
+
+ADD = "int add(int a, int b) { return a + b; }"
+PLUS = "int plus(int x, int y) { return x + y; }"
+LOOP = "void log(String[] items) { for (String s : items) { System.out.println(s); } }"
+
+
+def _func(code, i=0):
+    return FunctionInfo(i, i + 1, code, "dir", f"F{i}.java", f"F{i}.java")
+
+
+def test_ast_histogram_ignores_wrapper_and_survives_bad_input():
+    histogram = ast_node_histogram(ADD)
+
+    assert histogram["MethodDeclaration"] == 1 and "ClassDeclaration" not in histogram
+    assert sum(ast_node_histogram('int x = "open').values()) > 0
+
+
+def test_similar_code_scores_higher():
+    add, plus, loop = (extract_features(c) for c in (ADD, PLUS, LOOP))
+
+    assert similarity(add, add) == 1.0
+    assert similarity(add, plus) > 0.7 > similarity(add, loop)
+
+
+def test_decide_uses_both_thresholds():
+    reps = [{"class_id": 1, "function": _func(PLUS, 1)}]
+    screener = PreScreener(low=0.5, high=0.95)
+
+    assert screener.decide(_func(LOOP), reps)[0] is False
+    assert screener.decide(_func(ADD), reps)[0] is None
+    assert screener.decide(_func(PLUS), reps)[:3:2] == (True, 0)
+
+
+def test_calibrate_reports_calls_saved_and_accuracy_lost():
+    scores = [0.1, 0.2, 0.3, 0.5, 0.6, 0.9, 0.95]
+    labels = [False, False, True, True, False, True, True]
+
+    strict = calibrate(scores, labels, max_miss_rate=0.0, min_precision=1.0)
+    loose = calibrate(scores, labels, max_miss_rate=0.25, min_precision=1.0)
+
+    assert (strict.low, strict.high) == (0.3, 0.9)
+    assert strict.calls_saved == 4 and strict.accuracy_lost == 0.0
+    assert loose.low == 0.5 and loose.missed_clones == 1
+    assert "accuracy lost: 14.29%" in loose.format()
+
+
+def test_accepting_a_clone_into_the_wrong_class_counts_as_an_error():
+    scores = [0.1, 0.2, 0.9, 0.95]
+    labels = [False, False, True, True]
+
+    by_clone_only = calibrate(scores, labels, max_miss_rate=0.0, min_precision=1.0)
+    by_class = calibrate(scores, labels, max_miss_rate=0.0, min_precision=0.5,
+                         accept_correct=[False, False, False, True])
+
+    assert by_clone_only.high == 0.9 and by_clone_only.accuracy_lost == 0.0
+    # 0.9 的样本是克隆但最相似代表属于另一个克隆类：直接接受就判错了
+    assert by_class.high == 0.9 and by_class.false_clones == 1 and by_class.accuracy_lost == 0.25
@@ -0,0 +1,59 @@
+import os
+import sys
+
+# Ensure project root is on sys.path so imports work when running tests from any cwd
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from clone.clone_class import CloneClass
+from clone.clone_pair import ClonePair
+from clone.representative_catalog import (
+    build_catalog, input_fingerprint, load_catalog, save_catalog, select_medoids, token_set,
+)
+from utils.java_code.function_info import FunctionInfo
+
+SNIPPETS = [
+    "int add(int a, int b) { return a + b; }",
+    "int sum(int a, int b) { int s = a + b; return s; }",
+    "int plus(int x, int y) { return x + y; }",
+    "void f() {}",
+]
+
+
+def _functions():
+    return [FunctionInfo(i * 10, i * 10 + 5, code, "dir", f"F{i}.java", f"/abs/dir/F{i}.java")
+            for i, code in enumerate(SNIPPETS)]
+
+
+def test_medoid_is_the_most_central_member_not_the_shortest():
+    sets = [token_set(c) for c in SNIPPETS]
+
+    [medoid] = select_medoids(sets, k=1)
+    assert SNIPPETS[medoid] != "void f() {}"
+    assert medoid in (0, 2)
+    assert len(set(select_medoids(sets, k=3))) == 3
+
+
+def test_build_catalog_resolves_pairs_and_samples_large_classes():
+    functions = _functions()
+    pairs = [ClonePair(f"/data/dir/F{i}.java", i * 10, i * 10 + 5, f"/data/dir/F{j}.java", j * 10, j * 10 + 5)
+             for i in range(4) for j in range(i + 1, 4)]
+    classes = [CloneClass(pairs), CloneClass([ClonePair("X.java", 1, 2, "Y.java", 3, 4)])]
+
+    catalog = build_catalog(classes, functions, medoids_per_class=2)
+    sampled = build_catalog(classes, functions, sample_size=2, seed=1)
+
+    assert list(catalog) == [1] and len(catalog[1]) == 2
+    assert len(sampled[1]) == 1 and sampled == build_catalog(classes, functions, sample_size=2, seed=1)
+
+
+def test_catalog_is_invalidated_when_inputs_change(tmp_path):
+    data = tmp_path / "functions.pkl"
+    data.write_bytes(b"v1")
+    path = str(tmp_path / "catalog.json")
+    fingerprint = input_fingerprint([str(data)], medoids_per_class=1)
+    save_catalog(path, {1: [0], 2: [3]}, fingerprint)
+
+    assert load_catalog(path, fingerprint) == {1: [0], 2: [3]}
+    assert load_catalog(path, input_fingerprint([str(data)], medoids_per_class=2)) is None
+    data.write_bytes(b"version 2")
+    assert load_catalog(path, input_fingerprint([str(data)], medoids_per_class=1)) is None
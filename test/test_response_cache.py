@@ -0,0 +1,54 @@
+import os
+import sys
+import time
+
+# Ensure project root is on sys.path so imports work when running tests from any cwd
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from utils.llm.response_cache import ResponseCache
+
+MESSAGES = [{"role": "user", "content": "is this a clone?"}]
+
+
+def test_key_depends_on_model_messages_and_params():
+    key = ResponseCache.make_key("m", MESSAGES, {"temperature": 0.0, "max_tokens": 10})
+
+    assert key == ResponseCache.make_key("m", MESSAGES, {"max_tokens": 10, "temperature": 0.0})
+    assert key != ResponseCache.make_key("other", MESSAGES, {"temperature": 0.0, "max_tokens": 10})
+    assert key != ResponseCache.make_key("m", MESSAGES, {"temperature": 0.5, "max_tokens": 10})
+
+
+def test_hits_misses_and_saved_tokens(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"))
+    key = ResponseCache.make_key("m", MESSAGES)
+
+    assert cache.get(key) is None
+    cache.put(key, "no", {"prompt_tokens": 100, "completion_tokens": 7})
+    assert cache.get(key) == {"content": "no", "usage": {"prompt_tokens": 100, "completion_tokens": 7}}
+
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert (cache.saved_prompt_tokens, cache.saved_completion_tokens) == (100, 7)
+    assert "1 hits, 1 misses" in cache.summary()
+
+
+def test_expired_entries_are_misses(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"), ttl=0.05)
+    cache.put("k", "v")
+    time.sleep(0.1)
+
+    assert cache.get("k") is None
+    assert len(cache) == 0
+
+
+def test_size_cap_evicts_least_recently_used(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"), max_entries=2)
+    cache.put("a", "1")
+    time.sleep(0.01)
+    cache.put("b", "2")
+    time.sleep(0.01)
+    cache.get("a")
+    time.sleep(0.01)
+    cache.put("c", "3")
+
+    assert "a" in cache and "c" in cache
+    assert "b" not in cache
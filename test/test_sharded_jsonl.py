@@ -0,0 +1,115 @@
+import json
+import os
+import sys
+
+# Ensure project root is on sys.path so imports work when running tests from any cwd
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from clone.clone_class import CloneClass
+from clone.clone_pair import ClonePair
+from utils.file.sharded_jsonl import ShardedJsonlWriter, load_manifest, open_jsonl
+from utils.java_code.function_info import FunctionInfo
+from utils.llm import clone_class_summary
+from utils.llm.response_cache import ResponseCache
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def _read_all(paths):
+    records = []
+    for path in paths:
+        with open_jsonl(path) as f:
+            records.extend(json.loads(line) for line in f)
+    return records
+
+
+def test_writer_rotates_on_line_and_byte_limits(tmp_path):
+    with ShardedJsonlWriter(str(tmp_path / "a.jsonl"), max_lines=3) as writer:
+        for i in range(7):
+            writer.write({"i": i})
+    assert [os.path.basename(p) for p in writer.paths] == [
+        "a.part0000.jsonl", "a.part0001.jsonl", "a.part0002.jsonl",
+    ]
+
+    line = len(json.dumps({"i": 0}, ensure_ascii=False)) + 1
+    with ShardedJsonlWriter(str(tmp_path / "b.jsonl"), max_bytes=line * 2) as writer:
+        for i in range(5):
+            writer.write({"i": i})
+    assert len(writer.paths) == 3
+    assert [r["i"] for r in _read_all(writer.paths)] == list(range(5))
+
+
+def test_writer_compresses_and_writes_manifest(tmp_path):
+    manifest_path = str(tmp_path / "manifest.jsonl")
+    with ShardedJsonlWriter(str(tmp_path / "c.jsonl"), max_lines=2, compress=True,
+                            manifest_path=manifest_path) as writer:
+        for i in range(3):
+            writer.write({"custom_id": f"id{i}"}, key=f"id{i}", clone_class=10 + i)
+
+    assert all(p.endswith(".jsonl.gz") for p in writer.paths)
+    assert [r["custom_id"] for r in _read_all(writer.paths)] == ["id0", "id1", "id2"]
+    assert load_manifest(manifest_path)["id2"] == {"shard": 1, "clone_class": 12}
+
+
+def test_generate_jsonl_streams_requests_with_manifest(tmp_path, monkeypatch):
+    monkeypatch.chdir(PROJECT_ROOT)
+    functions = [FunctionInfo(i, i + 5, f"void f{i}() {{}}", "dir", f"F{i}.java", f"F{i}.java") for i in range(4)]
+    index = {(f.path, f.start_line, f.end_line): f for f in functions}
+    classes = [
+        CloneClass([ClonePair("F0.java", 0, 5, "F1.java", 1, 6)]),
+        CloneClass([ClonePair("F2.java", 2, 7, "F3.java", 3, 8)]),
+        CloneClass([ClonePair("X.java", 0, 1, "Y.java", 0, 1)]),  # 不在索引中，跳过
+    ]
+    manifest_path = str(tmp_path / "manifest.jsonl")
+
+    cached, paths = clone_class_summary.generate_jsonl(
+        classes, index, "glm", str(tmp_path / "req.jsonl"), max_lines=1, manifest_path=manifest_path,
+    )
+
+    records = _read_all(paths)
+    assert cached == {} and len(paths) == 2
+    assert [r["custom_id"] for r in records] == ["clone_class_0", "clone_class_1"]
+    assert records[0]["body"]["messages"][0]["content"] == records[1]["body"]["messages"][0]["content"]
+    assert records[1]["body"]["messages"][1]["content"] in ("void f2() {}", "void f3() {}")
+    assert load_manifest(manifest_path)["clone_class_1"]["clone_class"] == 1
+
+
+def test_generate_jsonl_requests_are_stable_and_hit_the_sync_cache(tmp_path, monkeypatch):
+    monkeypatch.chdir(PROJECT_ROOT)
+    functions = [FunctionInfo(i, i + 5, f"void f{i}() {{}}", "dir", f"F{i}.java", f"F{i}.java") for i in range(6)]
+    index = {(f.path, f.start_line, f.end_line): f for f in functions}
+    classes = [CloneClass([ClonePair(f"F{i}.java", i, i + 5, f"F{i + 1}.java", i + 1, i + 6)
+                           for i in range(0, 5)])]
+
+    runs = [clone_class_summary.generate_jsonl(classes, index, "glm", str(tmp_path / f"req{n}.jsonl"))[1]
+            for n in range(3)]
+    bodies = [_read_all(paths)[0]["body"] for paths in runs]
+    assert bodies[0] == bodies[1] == bodies[2]
+
+    # 同步调用以相同的消息和参数写入缓存后，批处理路径直接命中
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"))
+    cache.put(ResponseCache.make_key("glm", bodies[0]["messages"], clone_class_summary.SUMMARY_PARAMS), "{}")
+    cached, _ = clone_class_summary.generate_jsonl(classes, index, "glm", str(tmp_path / "req.jsonl"), cache=cache)
+    cache.close()
+    assert cached == {"clone_class_0": "{}"}
+
+
+def test_all_cached_batch_submits_nothing(tmp_path, monkeypatch):
+    monkeypatch.chdir(PROJECT_ROOT)
+    functions = [FunctionInfo(i, i + 5, f"void f{i}() {{}}", "dir", f"F{i}.java", f"F{i}.java") for i in range(2)]
+    index = {(f.path, f.start_line, f.end_line): f for f in functions}
+    classes = [CloneClass([ClonePair("F0.java", 0, 5, "F1.java", 1, 6)])]
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"))
+    [request] = _read_all(clone_class_summary.generate_jsonl(classes, index, "glm", str(tmp_path / "req.jsonl"))[1])
+    cache.put(clone_class_summary._request_key(request["body"]), '{"summary": "s"}')
+
+    def no_batch(*args, **kwargs):
+        raise AssertionError("batch job submitted although every request was cached")
+
+    monkeypatch.setattr(clone_class_summary, "BatchManager", no_batch)
+    summaries, errors = clone_class_summary.summarize_clone_classes_batch(
+        classes, index, "glm", str(tmp_path / "work"), cache=cache,
+    )
+    cache.close()
+
+    assert summaries == {0: '{"summary": "s"}'} and errors == {}
@@ -0,0 +1,125 @@
+import dataclasses
+import json
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+# Ensure project root is on sys.path so imports work when running tests from any cwd
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+import generate_prompts
+import merge_shards
+from clone.clone_csv import write_clone_pairs_csv
+from clone.clone_pair import ClonePair
+from get_all_functions import extract_functions_from_directory
+from utils.file.file_io import read_functions_from_disk, write_functions_to_disk
+from utils.file.sharding import Shard, shard_paths
+from utils.java_code.java_parser import JavaParser
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+TEST_JAVA_FILE = os.path.join(current_dir, "function_extract.java")
+TEST_CLONE_CSV = os.path.join(current_dir, "test_parsed.csv")
+NOT_CLONE = '{"is_clone": false, "matched_rep_id": null, "confidence": 0.9, "reason": "different"}'
+
+
+def _read_results(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_shard_parsing_and_paths():
+    shard = Shard.parse("1/4")
+    assert (shard.index, shard.count) == (1, 4)
+    assert shard.path("out/functions.pkl") == os.path.join("out", "functions.shard-1-of-4.pkl")
+    assert shard_paths("r.jsonl", 2) == ["r.shard-0-of-2.jsonl", "r.shard-1-of-2.jsonl"]
+    # 每个键恰好属于一个分片
+    assert all(sum(Shard(i, 3).owns(f"k{n}") for i in range(3)) == 1 for n in range(50))
+    with pytest.raises(Exception):
+        Shard.parse("4/4")
+
+
+def test_shard_processes_run_concurrently_and_merge(tmp_path):
+    dataset = tmp_path / "dataset"
+    for sub in ("a", "b"):
+        os.makedirs(dataset / sub)
+        for n in range(4):
+            shutil.copy(TEST_JAVA_FILE, dataset / sub / f"F{n}.java")
+    out = str(tmp_path / "functions.pkl")
+    manifest = str(tmp_path / "manifest.json")
+
+    processes = [
+        subprocess.Popen(
+            [sys.executable, "get_all_functions.py", "--path", str(dataset), "--out", out, "--shard", f"{i}/3",
+             "--manifest", manifest],
+            cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+        )
+        for i in range(3)
+    ]
+    for p in processes:
+        output, _ = p.communicate(timeout=120)
+        assert p.returncode == 0, output.decode()
+    # 同时运行的分片各写自己的文件清单
+    assert all(os.path.exists(p) for p in shard_paths(manifest, 3)) and not os.path.exists(manifest)
+
+    merged = str(tmp_path / "merged.pkl")
+    merge_shards.main(["functions", out, "--shards", "3", "--out", merged])
+
+    expected = extract_functions_from_directory(str(dataset))
+    key = lambda f: (f.path, f.start_line, f.end_line)
+    shards = [read_functions_from_disk(p) for p in shard_paths(out, 3)]
+    assert sum(len(s) for s in shards) == len(expected)
+    assert [key(f) for f in read_functions_from_disk(merged)] == sorted(key(f) for f in expected)
+
+
+def test_sharded_generate_prompts_merge_to_full_results(tmp_path, monkeypatch):
+    functions_pkl = str(tmp_path / "functions.pkl")
+    write_functions_to_disk(JavaParser(TEST_JAVA_FILE).extract_functions(), functions_pkl)
+    monkeypatch.setattr(generate_prompts, "call_openai_completion", lambda prompt, model="gpt-4": NOT_CLONE)
+
+    out = str(tmp_path / "results.jsonl")
+    for i in range(2):
+        generate_prompts.generate_prompts(functions_pkl, TEST_CLONE_CSV, Shard(i, 2).path(out), shard=Shard(i, 2))
+    merged = str(tmp_path / "merged.jsonl")
+    count = merge_shards.merge_result_journals(shard_paths(out, 2), merged)
+
+    assert count == 8
+    assert [r["id"] for r in _read_results(merged)] == list(range(8))
+
+
+def test_targets_differing_only_in_comments_share_a_shard(tmp_path, monkeypatch):
+    functions = JavaParser(TEST_JAVA_FILE).extract_functions()
+    commented = [
+        dataclasses.replace(f, code_snippet="// copy\n" + f.code_snippet, start_line=f.start_line + 1000)
+        for f in functions
+    ]
+    functions_pkl = str(tmp_path / "functions.pkl")
+    write_functions_to_disk(functions + commented, functions_pkl)
+    calls = []
+    monkeypatch.setattr(generate_prompts, "call_openai_completion",
+                        lambda prompt, model="gpt-4": calls.append(prompt) or NOT_CLONE)
+
+    out = str(tmp_path / "results.jsonl")
+    for i in range(4):
+        generate_prompts.generate_prompts(functions_pkl, TEST_CLONE_CSV, Shard(i, 4).path(out), shard=Shard(i, 4))
+    sharded_calls = len(calls)
+    calls.clear()
+    generate_prompts.generate_prompts(functions_pkl, TEST_CLONE_CSV, str(tmp_path / "full.jsonl"))
+
+    assert sharded_calls == len(calls)
+
+
+def test_clone_csvs_merge_without_duplicates(tmp_path):
+    a = ClonePair("x/A.java", 1, 5, "x/B.java", 1, 5)
+    b = ClonePair("x/B.java", 1, 5, "x/A.java", 1, 5)
+    c = ClonePair("x/B.java", 1, 5, "x/C.java", 3, 9)
+    write_clone_pairs_csv([a], str(tmp_path / "0.csv"))
+    write_clone_pairs_csv([b, c], str(tmp_path / "1.csv"))
+
+    out = str(tmp_path / "merged.csv")
+    assert merge_shards.merge_clone_pair_csvs([str(tmp_path / "0.csv"), str(tmp_path / "1.csv")], out) == 2
+    with pytest.raises(FileNotFoundError):
+        merge_shards.merge_clone_pair_csvs([str(tmp_path / "missing.csv")], out)
@@ -0,0 +1,124 @@
+import concurrent.futures
+import os
+import shutil
+import sys
+
+# Ensure project root is on sys.path so imports work when running tests from any cwd
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from clone.clone_pair import ClonePair
+from get_all_functions import extract_functions_from_directory, main, process_file_with_stats
+from utils.file.corpus_stats import count_lines
+from utils.file.file_cache import FileCache
+from utils.file.file_io import read_functions_from_disk
+from utils.file.shared_source_store import SharedSourceStore, init_worker_store, worker_store
+
+FILES = {
+    "A.java": "class A {\n    void a() {}\n}\n",
+    "B.java": "class B {\n  int b() {\n    return 1;\n  }\n}",  # 最后一行没有换行符
+    "Empty.java": "",
+    "Cn.java": "class Cn {\n    // 中文注释\n}\n",
+    # 单独的 \r、\r\n 以及 str.splitlines 认作换行的其他字符
+    "Cr.java": "class Cr {\r  int c;\r\n  int d;\x0c  int e;\u2028  int f;\x85}\r",
+}
+
+
+def _write(root):
+    for name, text in FILES.items():
+        (root / name).write_text(text, encoding="utf-8")
+    return [str(root / name) for name in FILES]
+
+
+def _read(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def _expected(path, start, end):
+    lines = _read(path).splitlines(keepends=True)
+    return "".join(lines[max(0, start - 1):min(len(lines), end)])
+
+
+def _snippet_in_worker(path):
+    return worker_store().snippet_text(path, 2, 3)
+
+
+def test_store_matches_files_on_disk(tmp_path):
+    paths = _write(tmp_path)
+
+    with SharedSourceStore.create(paths) as store:
+        assert len(store) == len(FILES)
+        for path in paths:
+            # 与从磁盘按文本模式读取的结果相同（\r\n 和 \r 转换为 \n）
+            assert store.get_file(path) == _read(path)
+            assert store.line_count(path) == len(FILES[os.path.basename(path)].splitlines())
+            # 语料统计的行数不受是否使用共享存储影响
+            assert process_file_with_stats(path, store)[1] == count_lines(path)
+            for start, end in [(1, 1), (2, 3), (0, 100), (3, 2), (50, 60)]:
+                assert store.snippet_text(path, start, end) == _expected(path, start, end)
+        # 片段是共享内存上的视图，不是拷贝
+        view = store.snippet(paths[0], 2, 2)
+        assert isinstance(view, memoryview) and bytes(view) == b"    void a() {}\n"
+        view.release()
+        assert store.get_file(str(tmp_path / "Missing.java")) is None
+
+
+def test_workers_attach_and_slice(tmp_path):
+    paths = _write(tmp_path)
+
+    with SharedSourceStore.create(paths) as store:
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=2, initializer=init_worker_store, initargs=(store.handle,)
+        ) as executor:
+            results = list(executor.map(_snippet_in_worker, paths))
+
+    assert results == [_expected(p, 2, 3) for p in paths]
+
+
+def test_file_cache_shared_memory(tmp_path):
+    root = tmp_path / "data"
+    os.makedirs(root)
+    paths = _write(root)
+    shutil.copy(paths[0], root / "A2.java")
+
+    cache = FileCache(str(root), shared_memory=True)
+    try:
+        assert cache.has_file(paths[1])
+        assert sorted(cache.get_all_files()) == sorted(paths + [str(root / "A2.java")])
+        pair = ClonePair(paths[0], 1, 2, str(root / "A2.java"), 2, 3)
+        assert pair.get_code_snippets(cache) == (_expected(paths[0], 1, 2), _expected(paths[0], 2, 3))
+        # 与不用共享内存的 FileCache 取到的片段相同
+        plain = FileCache(str(root), show_progress=False)
+        for path in paths:
+            for start, end in [(1, 2), (2, 4), (1, 100)]:
+                pair = ClonePair(path, start, end, path, start, end)
+                assert pair.get_code_snippets(cache) == pair.get_code_snippets(plain)
+        # 空文件得到空片段，而不是 FileNotFoundError
+        assert ClonePair(paths[2], 1, 5, paths[2], 1, 5).get_code_snippets(cache) == ("", "")
+
+        functions = extract_functions_from_directory(
+            str(root), use_multiprocessing=True, max_workers=2, source_store=cache.store.handle
+        )
+    finally:
+        cache.close()
+
+    assert functions
+    assert sorted((os.path.basename(f.path), f.start_line, f.end_line) for f in functions) == sorted(
+        (os.path.basename(f.path), f.start_line, f.end_line) for f in extract_functions_from_directory(str(root))
+    )
+
+
+def test_extraction_cli_uses_shared_memory(tmp_path):
+    root = tmp_path / "data"
+    os.makedirs(root)
+    _write(root)
+    # 单独的 \r 在两条路径上都转换为换行，函数行号相同
+    (root / "D.java").write_bytes(b"class D {\r  void d() {\r  }\r  int e() { return 1; }\r}\r")
+    out = str(tmp_path / "functions.pkl")
+
+    main(["--path", str(root), "--out", out, "--workers", "2", "--shared-memory"])
+
+    key = lambda f: (f.path, f.start_line, f.end_line, f.code_snippet)
+    assert sorted(map(key, read_functions_from_disk(out))) == sorted(
+        map(key, extract_functions_from_directory(str(root)))
+    )
@@ -0,0 +1,68 @@
+import os
+import random
+import sys
+from collections import Counter
+
+# Ensure project root is on sys.path so imports work when running tests from any cwd
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from clone.clone_class_parser import CloneClassParser
+from clone.clone_csv import write_clone_pairs_csv
+from clone.clone_type import CloneType
+from clone.sourcerer_index import block_tokens, find_near_miss_clones, to_clone_pairs
+from utils.java_code.function_info import FunctionInfo
+
+WORDS = ["alpha", "beta", "gamma", "delta", "count", "index", "value", "result", "buffer", "reader",
+         "writer", "stream", "total", "limit", "offset", "name", "key", "map", "list", "item"]
+
+
+def _random_functions(n, seed=0):
+    rng = random.Random(seed)
+    functions = []
+    for i in range(n):
+        body = " ".join(f"{rng.choice(WORDS)}{rng.randint(0, 30)}();" for _ in range(rng.randint(8, 20)))
+        functions.append(FunctionInfo(1, 9, f"void m{i}() {{ {body} }}", "dir", f"F{i}.java", f"/d/F{i}.java"))
+    # 几个近似克隆：复制后改掉一两个语句
+    for src in (0, 5, 9):
+        statements = functions[src].code_snippet.split(";")
+        statements[1] = " changed1()"
+        functions.append(FunctionInfo(1, 9, ";".join(statements), "dir", f"C{src}.java", f"/d/C{src}.java"))
+    return functions
+
+
+def _brute_force(functions, threshold, min_tokens):
+    bags = {i: Counter(block_tokens(f.code_snippet)) for i, f in enumerate(functions)}
+    bags = {i: b for i, b in bags.items() if sum(b.values()) >= min_tokens}
+    found = set()
+    ids = sorted(bags)
+    for x, a in enumerate(ids):
+        for b in ids[x + 1:]:
+            common = sum((bags[a] & bags[b]).values())
+            if common >= threshold * max(sum(bags[a].values()), sum(bags[b].values())):
+                found.add((a, b))
+    return found
+
+
+def test_matches_brute_force_and_is_partition_independent():
+    functions = _random_functions(60)
+
+    single = find_near_miss_clones(functions, threshold=0.7, min_tokens=5)
+    partitioned = find_near_miss_clones(functions, threshold=0.7, min_tokens=5, partitions=4)
+
+    assert {(a, b) for a, b, _ in single} == _brute_force(functions, 0.7, 5)
+    assert single == partitioned
+    assert {(0, 60), (5, 61), (9, 62)} <= {(a, b) for a, b, _ in single}
+    assert all(0.7 <= score <= 1.0 for _, _, score in single)
+
+
+def test_multiprocess_run_and_csv_output(tmp_path):
+    functions = _random_functions(30, seed=3)
+    matches = find_near_miss_clones(functions, threshold=0.7, min_tokens=5, workers=2)
+    path = str(tmp_path / "type3.csv")
+
+    write_clone_pairs_csv(to_clone_pairs(functions, matches), path, scores=[m[2] for m in matches])
+    parser = CloneClassParser(path)
+
+    assert matches == find_near_miss_clones(functions, threshold=0.7, min_tokens=5)
+    assert len(parser.clone_pairs) == len(matches) > 0
+    assert all(p.clone_type == CloneType.TYPE_3 for p in parser.clone_pairs)
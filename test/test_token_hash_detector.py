@@ -0,0 +1,59 @@
+import os
+import sys
+
+# Ensure project root is on sys.path so imports work when running tests from any cwd
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from clone.clone_class_parser import CloneClassParser
+from clone.clone_csv import write_clone_pairs_csv
+from clone.clone_type import CloneType
+from clone.token_hash_detector import detect_exact_clones, token_hashes
+from utils.java_code.function_info import FunctionInfo
+
+BASE = "int total(int[] values) { int sum = 0; for (int v : values) { sum += v; } return sum; }"
+REFORMATTED = """
+int total(int[] values) {
+    // add everything up
+    int sum = 0;
+    for (int v : values) { sum += v; }
+    return sum;
+}
+"""
+RENAMED = "int add(int[] xs) { int acc = 1; for (int x : xs) { acc += x; } return acc; }"
+DIFFERENT = "void log(String message) { System.out.println(message); System.out.flush(); }"
+
+
+def _functions(*codes):
+    return [FunctionInfo(1, 5, code, "dir", f"F{i}.java", f"/data/dir/F{i}.java") for i, code in enumerate(codes)]
+
+
+def test_hashes_distinguish_type1_and_type2():
+    base, reformatted, renamed = (token_hashes(c) for c in (BASE, REFORMATTED, RENAMED))
+
+    assert base[0] == reformatted[0]
+    assert base[0] != renamed[0] and base[1] == renamed[1]
+
+
+def test_detect_assigns_clone_types():
+    functions = _functions(BASE, RENAMED, REFORMATTED, DIFFERENT, DIFFERENT.replace("flush", "close"))
+
+    classes = detect_exact_clones(functions, min_tokens=5)
+
+    assert len(classes) == 2
+    mixed = next(cc for cc in classes if len(cc.clone_pairs) == 2)
+    assert mixed.clone_type == CloneType.TYPE_2
+    assert sorted(p.clone_type.value for p in mixed.clone_pairs) == ["Type-1", "Type-2"]
+    # 方法调用名也是标识符，flush/close 只差标识符，属于Type-2
+    assert next(cc for cc in classes if cc is not mixed).clone_type == CloneType.TYPE_2
+
+
+def test_small_functions_are_ignored_and_csv_round_trips(tmp_path):
+    functions = _functions(BASE, REFORMATTED, "int x() { return 1; }", "int y() { return 2; }")
+    classes = detect_exact_clones(functions, min_tokens=10)
+    path = str(tmp_path / "type12.csv")
+
+    write_clone_pairs_csv((p for cc in classes for p in cc.clone_pairs), path)
+    parsed = CloneClassParser(path).parse()
+
+    assert len(classes) == 1 and classes[0].clone_type == CloneType.TYPE_1
+    assert len(parsed) == 1 and parsed[0].clone_pairs[0].clone_type == CloneType.TYPE_1
@@ -0,0 +1,67 @@
+import os
+import sys
+
+import numpy as np
+
+# Ensure project root is on sys.path so imports work when running tests from any cwd
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from utils.embedding.vector_index import VectorIndex
+
+
+def _random_vectors(n, dim=32, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.standard_normal((n, dim)).astype(np.float32)
+
+
+def _brute_force(vectors, queries, k):
+    v = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    q = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+    return np.argsort(-(q @ v.T), axis=1)[:, :k]
+
+
+def test_flat_search_matches_brute_force():
+    vectors = _random_vectors(500)
+    queries = _random_vectors(37, seed=1)
+    index = VectorIndex.build(vectors, labels=np.arange(500))
+
+    scores, labels = index.search(queries, k=5, batch_size=8)
+
+    assert (labels == _brute_force(vectors, queries, 5)).all()
+    assert (np.diff(scores, axis=1) <= 0).all()
+
+
+def test_ivf_with_full_probe_is_exact():
+    vectors = _random_vectors(400)
+    queries = _random_vectors(20, seed=2)
+    index = VectorIndex.build(vectors, labels=np.arange(400), nlist=8, nprobe=8)
+
+    _, labels = index.search(queries, k=3)
+
+    assert index.is_ivf
+    assert (labels == _brute_force(vectors, queries, 3)).all()
+
+
+def test_top_classes_deduplicates_labels():
+    base = _random_vectors(3)
+    # 每个克隆类有两个几乎相同的代表向量
+    vectors = np.concatenate([base, base + 1e-3])
+    index = VectorIndex.build(vectors, labels=[10, 20, 30, 10, 20, 30])
+
+    result = index.top_classes(base[:1], k=2)
+
+    assert result[0][0] == 10
+    assert len(result[0]) == 2 and len(set(result[0])) == 2
+
+
+def test_save_and_load_memory_mapped(tmp_path):
+    vectors = _random_vectors(200)
+    queries = _random_vectors(5, seed=3)
+    index = VectorIndex.build(vectors, labels=np.arange(200) + 1, nlist=4, nprobe=2)
+    index.save(str(tmp_path))
+
+    loaded = VectorIndex.load(str(tmp_path))
+
+    assert isinstance(loaded.vectors, np.memmap)
+    assert loaded.is_ivf and loaded.nprobe == 2
+    assert (loaded.search(queries, k=4)[1] == index.search(queries, k=4)[1]).all()
@@ -0,0 +1,215 @@
+import hashlib
+import json
+import os
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+from tqdm import tqdm
+
+from utils.embedding.embedding_cache import EmbeddingCache
+
+
+def plan_batches(lengths: Sequence[int], batch_size: int, max_batch_tokens: Optional[int] = None) -> List[List[int]]:
+    """
+    按token长度排序后切分批次，使同一批次内的序列长度相近，动态padding时浪费最少。
+
+    排序键为(长度, 行号)，因此同样的输入总是得到同样的批次划分，中断后可以据此续跑。
+
+    Args:
+        lengths: 每行的token长度
+        batch_size: 每批最多的序列数
+        max_batch_tokens: 每批padding后最多的token数（批内最长长度 × 序列数），None表示不限制
+
+    Returns:
+        批次列表，每个批次是行号列表
+    """
+    order = sorted(range(len(lengths)), key=lambda i: (lengths[i], i))
+    batches: List[List[int]] = []
+    current: List[int] = []
+    for row in order:
+        longest = max(lengths[row], 1)
+        too_many_tokens = max_batch_tokens is not None and current and longest * (len(current) + 1) > max_batch_tokens
+        if len(current) >= batch_size or too_many_tokens:
+            batches.append(current)
+            current = []
+        current.append(row)
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _plan_fingerprint(lengths: Sequence[int], batches: List[List[int]], tag: str) -> str:
+    h = hashlib.sha1(tag.encode("utf-8"))
+    h.update(np.asarray(lengths, dtype=np.int64).tobytes())
+    h.update(np.asarray([len(b) for b in batches], dtype=np.int64).tobytes())
+    return h.hexdigest()
+
+
+class EmbeddingStore:
+    """
+    与函数ID对齐的float16嵌入矩阵（.npy内存映射），第i行即functions.pkl中第i个函数的向量。
+
+    旁路的 `<path>.progress.json` 记录已完成的批次数，写入顺序为：先刷新向量数据，
+    再原子替换进度文件，因此进程在任何时刻中断都不会记录未落盘的批次。
+    进度指纹包含模型标识，换模型或换批次计划后旧文件不能续跑，需 discard 后重建。
+    """
+
+    def __init__(self, path: str, num_rows: int, dim: int):
+        self.path = path
+        self.progress_path = path + ".progress.json"
+        if os.path.exists(path):
+            self.matrix = np.load(path, mmap_mode="r+")
+            if self.matrix.shape != (num_rows, dim):
+                raise ValueError(f"Existing embedding file {path} has shape {self.matrix.shape}, expected {(num_rows, dim)}")
+        else:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self.matrix = np.lib.format.open_memmap(path, mode="w+", dtype=np.float16, shape=(num_rows, dim))
+
+    def read_progress(self, fingerprint: str) -> Optional[int]:
+        """返回已完成的批次数；进度文件缺失或属于另一份批次计划（含另一个模型）时返回None。"""
+        if not os.path.exists(self.progress_path):
+            return None
+        with open(self.progress_path, "r", encoding="utf-8") as f:
+            progress = json.load(f)
+        if progress.get("fingerprint") != fingerprint:
+            return None
+        return int(progress.get("completed_batches", 0))
+
+    def discard(self):
+        """删除矩阵文件和进度文件，之后不能再使用本对象。"""
+        del self.matrix
+        os.remove(self.path)
+        if os.path.exists(self.progress_path):
+            os.remove(self.progress_path)
+
+    def write_rows(self, rows: List[int], vectors: np.ndarray):
+        self.matrix[rows] = np.asarray(vectors, dtype=np.float16)
+
+    def commit(self, fingerprint: str, completed_batches: int):
+        self.matrix.flush()
+        tmp = self.progress_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"fingerprint": fingerprint, "completed_batches": completed_batches}, f)
+        os.replace(tmp, self.progress_path)
+
+
+def load_embeddings(path: str) -> np.ndarray:
+    """以只读内存映射方式加载嵌入矩阵。"""
+    return np.load(path, mmap_mode="r")
+
+
+class TransformersEncoder:
+    """
+    HuggingFace嵌入模型（如codet5p-110m-embedding）的批量编码器，默认在CPU上运行。
+    """
+
+    def __init__(self, checkpoint: str, device: str = "cpu", threads: Optional[int] = None, max_length: int = 512):
+        import torch
+        from transformers import AutoModel, AutoTokenizer
+
+        if threads:
+            torch.set_num_threads(threads)
+        self._torch = torch
+        self.checkpoint = checkpoint
+        self.device = device
+        self.max_length = max_length
+        self.tokenizer = AutoTokenizer.from_pretrained(checkpoint, trust_remote_code=True)
+        self.model = AutoModel.from_pretrained(checkpoint, trust_remote_code=True).to(device).eval()
+
+    def token_lengths(self, texts: List[str]) -> List[int]:
+        encoded = self.tokenizer(texts, truncation=True, max_length=self.max_length)
+        return [len(ids) for ids in encoded["input_ids"]]
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        # padding="longest" 只补齐到本批次最长序列，配合按长度排序的批次即为动态padding
+        inputs = self.tokenizer(
+            texts, padding="longest", truncation=True, max_length=self.max_length, return_tensors="pt"
+        ).to(self.device)
+        with self._torch.inference_mode():
+            embeddings = self.model(inputs["input_ids"], attention_mask=inputs["attention_mask"])
+        return embeddings.float().cpu().numpy()
+
+
+def embed_to_store(
+    texts: List[str],
+    out_path: str,
+    encode: Callable[[List[str]], np.ndarray],
+    token_lengths: Callable[[List[str]], List[int]],
+    batch_size: int = 32,
+    max_batch_tokens: Optional[int] = None,
+    tag: str = "",
+    show_progress: bool = True,
+    keys: Optional[List[str]] = None,
+    cache: Optional[EmbeddingCache] = None,
+) -> np.ndarray:
+    """
+    批量嵌入texts并写入与行号对齐的float16内存映射文件，支持从最后完成的批次续跑。
+
+    Args:
+        texts: 待嵌入文本，第i个对应输出矩阵第i行
+        out_path: 输出.npy路径
+        encode: 把一批文本编码为(B, d)矩阵的函数
+        token_lengths: 计算每个文本token长度的函数，用于排序和分批
+        batch_size: 每批最多序列数
+        max_batch_tokens: 每批最多token数
+        tag: 模型标识（如检查点名），参与进度指纹计算，同时是嵌入缓存键的一部分
+        show_progress: 是否显示进度条
+        keys: 每行的内容哈希（如code_hash），相同哈希的行只嵌入一次
+        cache: 按(tag, 内容哈希)持久化的嵌入缓存，需要同时提供keys
+
+    Returns:
+        输出的内存映射矩阵
+    """
+    groups: Dict[str, List[int]] = {}
+    for row, key in enumerate(keys if keys is not None else map(str, range(len(texts)))):
+        groups.setdefault(key, []).append(row)
+
+    cached = cache.get_many(tag, groups) if cache is not None and keys is not None else {}
+    pending = [key for key in groups if key not in cached]
+    pending_texts = [texts[groups[key][0]] for key in pending]
+    if show_progress:
+        print(f"{len(texts)} snippets, {len(groups)} unique, {len(cached)} cached, {len(pending)} to embed")
+
+    lengths = token_lengths(pending_texts) if pending_texts else []
+    batches = plan_batches(lengths, batch_size, max_batch_tokens)
+    fingerprint = _plan_fingerprint(lengths, batches, tag)
+
+    store = None
+    start_batch = 0
+    if os.path.exists(out_path):
+        num_rows, dim = np.load(out_path, mmap_mode="r").shape
+        store = EmbeddingStore(out_path, num_rows, dim)
+        progress = store.read_progress(fingerprint) if num_rows == len(texts) else None
+        cached_dim = len(next(iter(cached.values()))) if cached else dim
+        if progress is None or cached_dim != dim:
+            # 语料行数、模型或批次计划变了，旧文件中的向量不能与新向量混在一起，重建
+            store.discard()
+            store = None
+        else:
+            start_batch = progress
+
+    if cached:
+        if store is None:
+            store = EmbeddingStore(out_path, len(texts), len(next(iter(cached.values()))))
+        for key, vector in cached.items():
+            store.write_rows(groups[key], np.broadcast_to(vector, (len(groups[key]), len(vector))))
+        store.commit(fingerprint, start_batch)
+
+    for b in tqdm(range(start_batch, len(batches)), desc="Embedding batches", disable=not show_progress,
+                  initial=start_batch, total=len(batches)):
+        batch_keys = [pending[i] for i in batches[b]]
+        vectors = encode([pending_texts[i] for i in batches[b]])
+        if store is None:
+            # 向量维度在第一批编码后才确定
+            store = EmbeddingStore(out_path, len(texts), vectors.shape[1])
+        elif vectors.shape[1] != store.matrix.shape[1]:
+            raise ValueError(
+                f"Encoder returned {vectors.shape[1]}-dim vectors, {out_path} stores {store.matrix.shape[1]}"
+            )
+        for key, vector in zip(batch_keys, vectors):
+            store.write_rows(groups[key], np.broadcast_to(vector, (len(groups[key]), len(vector))))
+        store.commit(fingerprint, b + 1)
+        if cache is not None and keys is not None:
+            cache.put_many(tag, list(zip(batch_keys, vectors)))
+
+    return load_embeddings(out_path) if store is not None else np.zeros((0, 0), dtype=np.float16)
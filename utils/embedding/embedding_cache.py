@@ -0,0 +1,63 @@
+import os
+import sqlite3
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+
+
+class EmbeddingCache:
+    """
+    以(模型检查点, 内容哈希)为键的持久化嵌入缓存，存储在单个SQLite文件中。
+
+    向量以float16字节串保存。不同语料、不同次运行之间共享同一个缓存文件，
+    只有从未嵌入过的代码才需要重新计算。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL, hash TEXT NOT NULL, dim INTEGER NOT NULL, vector BLOB NOT NULL,"
+            " PRIMARY KEY (model, hash))"
+        )
+        self._conn.commit()
+
+    def get_many(self, model: str, hashes: Iterable[str], chunk_size: int = 500) -> Dict[str, np.ndarray]:
+        """
+        批量查询缓存。
+
+        :param model: 模型检查点标识
+        :param hashes: 内容哈希列表
+        :param chunk_size: 每条SQL语句查询的哈希数，避免超过SQLite变量个数上限
+        :return: 命中的 哈希 -> float16向量
+        """
+        hashes = list(hashes)
+        found: Dict[str, np.ndarray] = {}
+        for begin in range(0, len(hashes), chunk_size):
+            chunk = hashes[begin : begin + chunk_size]
+            placeholders = ",".join("?" * len(chunk))
+            rows = self._conn.execute(
+                f"SELECT hash, dim, vector FROM embeddings WHERE model = ? AND hash IN ({placeholders})",
+                [model, *chunk],
+            )
+            for h, dim, blob in rows:
+                found[h] = np.frombuffer(blob, dtype=np.float16, count=dim)
+        return found
+
+    def put_many(self, model: str, items: List[Tuple[str, np.ndarray]]):
+        """写入一批 (哈希, 向量)，在一个事务中提交。"""
+        rows = []
+        for h, vector in items:
+            vec = np.asarray(vector, dtype=np.float16).reshape(-1)
+            rows.append((model, h, len(vec), vec.tobytes()))
+        with self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)", rows)
+
+    def __len__(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def close(self):
+        self._conn.close()
@@ -0,0 +1,264 @@
+import json
+import os
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+_META_FILE = "meta.json"
+_VECTORS_FILE = "vectors.npy"
+_LABELS_FILE = "labels.npy"
+_CENTROIDS_FILE = "centroids.npy"
+_OFFSETS_FILE = "list_offsets.npy"
+
+
+def as_vector(embedding) -> Optional[np.ndarray]:
+    """
+    把FunctionInfo.embedding（torch张量、列表或numpy数组）转换为一维float32向量。
+
+    :param embedding: 任意形式的嵌入表示
+    :return: 一维向量；输入为None时返回None
+    """
+    if embedding is None:
+        return None
+    if hasattr(embedding, "detach"):
+        embedding = embedding.detach().cpu().float().numpy()
+    return np.asarray(embedding, dtype=np.float32).reshape(-1)
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _merge_topk(best_scores, best_ids, new_scores, new_ids, k):
+    """把新一批候选合并进每个查询当前的top-k（均为二维数组，按行对应查询）。"""
+    scores = np.concatenate([best_scores, new_scores], axis=1)
+    ids = np.concatenate([best_ids, new_ids], axis=1)
+    if scores.shape[1] > k:
+        part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        scores = np.take_along_axis(scores, part, axis=1)
+        ids = np.take_along_axis(ids, part, axis=1)
+    return scores, ids
+
+
+def _kmeans(vectors: np.ndarray, nlist: int, iterations: int, seed: int) -> np.ndarray:
+    """球面k-means（余弦相似度），只用于训练IVF的粗聚类中心。"""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), size=nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assign = np.argmax(vectors @ centroids.T, axis=1)
+        for c in range(nlist):
+            members = vectors[assign == c]
+            if len(members):
+                centroids[c] = members.sum(axis=0)
+            else:
+                # 空簇：重新随机挑一个点作为中心，避免中心退化
+                centroids[c] = vectors[rng.integers(len(vectors))]
+        centroids = _normalize_rows(centroids)
+    return centroids
+
+
+class VectorIndex:
+    """
+    代表函数嵌入向量索引。
+
+    向量在建索引时做L2归一化，检索分数为余弦相似度。
+    - 精确模式：查询按块与全部向量做一次矩阵乘法，再用argpartition取top-k。
+    - IVF模式：先用k-means把向量划分到nlist个分区，查询时只扫描最相近的nprobe个分区。
+    索引以若干.npy文件保存在一个目录中，加载时使用内存映射，多个进程可以共享页缓存。
+    """
+
+    def __init__(
+        self,
+        vectors: np.ndarray,
+        labels: np.ndarray,
+        centroids: Optional[np.ndarray] = None,
+        list_offsets: Optional[np.ndarray] = None,
+        nprobe: int = 8,
+    ):
+        self.vectors = vectors
+        self.labels = labels
+        self.centroids = centroids
+        self.list_offsets = list_offsets
+        self.nprobe = nprobe
+
+    @property
+    def is_ivf(self) -> bool:
+        return self.centroids is not None
+
+    @property
+    def dim(self) -> int:
+        return int(self.vectors.shape[1])
+
+    def __len__(self) -> int:
+        return int(self.vectors.shape[0])
+
+    @classmethod
+    def build(
+        cls,
+        vectors,
+        labels: Sequence[int],
+        nlist: int = 0,
+        nprobe: int = 8,
+        kmeans_iterations: int = 10,
+        train_size: int = 65536,
+        seed: int = 0,
+    ) -> "VectorIndex":
+        """
+        构建索引。
+
+        Args:
+            vectors: 形状为(N, d)的嵌入矩阵
+            labels: 每个向量对应的克隆类ID
+            nlist: IVF分区数，0表示使用精确暴力检索
+            nprobe: IVF查询时扫描的分区数
+            kmeans_iterations: k-means迭代次数
+            train_size: 训练聚类中心时最多采样的向量数
+            seed: 随机种子，保证构建结果可复现
+        """
+        matrix = _normalize_rows(vectors)
+        label_array = np.asarray(labels, dtype=np.int64)
+        if matrix.ndim != 2 or len(matrix) != len(label_array):
+            raise ValueError("vectors must be 2-D and aligned with labels")
+
+        if nlist <= 0 or nlist >= len(matrix):
+            return cls(matrix, label_array, nprobe=nprobe)
+
+        rng = np.random.default_rng(seed)
+        train = matrix
+        if len(matrix) > train_size:
+            train = matrix[rng.choice(len(matrix), size=train_size, replace=False)]
+        centroids = _kmeans(train, nlist, kmeans_iterations, seed)
+
+        # 按分区重排向量，使每个分区在磁盘上连续存放，查询时只需切片
+        assign = np.argmax(matrix @ centroids.T, axis=1)
+        order = np.argsort(assign, kind="stable")
+        counts = np.bincount(assign, minlength=nlist)
+        offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        return cls(matrix[order], label_array[order], centroids, offsets, nprobe=nprobe)
+
+    def search(self, queries, k: int = 10, batch_size: int = 1024) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        批量检索。
+
+        Args:
+            queries: 形状为(Q, d)或(d,)的查询向量
+            k: 每个查询返回的结果数
+            batch_size: 每次矩阵乘法处理的查询数，用于限制中间矩阵的内存
+
+        Returns:
+            (scores, labels)：形状均为(Q, k)，按相似度降序；不足k个时分数为-inf、标签为-1
+        """
+        q = _normalize_rows(np.atleast_2d(queries))
+        k = max(1, min(k, len(self)))
+        all_scores = np.full((len(q), k), -np.inf, dtype=np.float32)
+        all_rows = np.full((len(q), k), -1, dtype=np.int64)
+
+        for begin in range(0, len(q), batch_size):
+            block = q[begin : begin + batch_size]
+            if self.is_ivf:
+                scores, rows = self._search_ivf(block, k)
+            else:
+                scores, rows = self._search_flat(block, k)
+            all_scores[begin : begin + len(block)] = scores
+            all_rows[begin : begin + len(block)] = rows
+
+        order = np.argsort(-all_scores, axis=1, kind="stable")
+        all_scores = np.take_along_axis(all_scores, order, axis=1)
+        all_rows = np.take_along_axis(all_rows, order, axis=1)
+        labels = np.where(all_rows >= 0, np.asarray(self.labels)[np.maximum(all_rows, 0)], -1)
+        return all_scores, labels
+
+    def _search_flat(self, block: np.ndarray, k: int):
+        sims = block @ np.asarray(self.vectors).T
+        if k < sims.shape[1]:
+            rows = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+        else:
+            rows = np.tile(np.arange(sims.shape[1]), (len(block), 1))
+        return np.take_along_axis(sims, rows, axis=1), rows.astype(np.int64)
+
+    def _search_ivf(self, block: np.ndarray, k: int):
+        nprobe = max(1, min(self.nprobe, len(self.centroids)))
+        coarse = block @ np.asarray(self.centroids).T
+        probes = np.argpartition(-coarse, nprobe - 1, axis=1)[:, :nprobe]
+
+        best_scores = np.full((len(block), k), -np.inf, dtype=np.float32)
+        best_rows = np.full((len(block), k), -1, dtype=np.int64)
+        # 按分区聚合查询：同一分区的所有查询用一次矩阵乘法完成
+        for lst in np.unique(probes):
+            start, end = int(self.list_offsets[lst]), int(self.list_offsets[lst + 1])
+            if start == end:
+                continue
+            qidx = np.nonzero((probes == lst).any(axis=1))[0]
+            sims = block[qidx] @ np.asarray(self.vectors[start:end]).T
+            rows = np.broadcast_to(np.arange(start, end, dtype=np.int64), sims.shape)
+            merged_scores, merged_rows = _merge_topk(best_scores[qidx], best_rows[qidx], sims, rows, k)
+            best_scores[qidx] = merged_scores
+            best_rows[qidx] = merged_rows
+        return best_scores, best_rows
+
+    def top_classes(self, queries, k: int = 10, oversample: int = 4) -> List[List[int]]:
+        """
+        为每个查询返回最相似的k个不同克隆类ID（一个克隆类可能有多个代表向量）。
+        """
+        _, labels = self.search(queries, k=k * oversample)
+        result = []
+        for row in labels:
+            seen: Dict[int, None] = {}
+            for label in row:
+                if label < 0 or label in seen:
+                    continue
+                seen[int(label)] = None
+                if len(seen) == k:
+                    break
+            result.append(list(seen))
+        return result
+
+    def save(self, directory: str, fingerprint: Optional[str] = None):
+        """
+        把索引保存到目录中。
+
+        :param fingerprint: 构建索引所用输入的指纹，记录在meta.json中，供 stored_fingerprint 比较
+        """
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, _VECTORS_FILE), np.ascontiguousarray(self.vectors, dtype=np.float32))
+        np.save(os.path.join(directory, _LABELS_FILE), np.asarray(self.labels, dtype=np.int64))
+        if self.is_ivf:
+            np.save(os.path.join(directory, _CENTROIDS_FILE), np.asarray(self.centroids, dtype=np.float32))
+            np.save(os.path.join(directory, _OFFSETS_FILE), np.asarray(self.list_offsets, dtype=np.int64))
+        meta = {"size": len(self), "dim": self.dim, "ivf": self.is_ivf, "nprobe": self.nprobe}
+        if fingerprint is not None:
+            meta["fingerprint"] = fingerprint
+        with open(os.path.join(directory, _META_FILE), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+
+    @staticmethod
+    def stored_fingerprint(directory: str) -> Optional[str]:
+        """save()时记录的指纹；目录中没有索引或没有记录指纹时返回None。"""
+        try:
+            with open(os.path.join(directory, _META_FILE), "r", encoding="utf-8") as f:
+                return json.load(f).get("fingerprint")
+        except (OSError, ValueError):
+            return None
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True, nprobe: Optional[int] = None) -> "VectorIndex":
+        """
+        从目录加载索引。
+
+        :param directory: save()写出的目录
+        :param mmap: 是否以只读内存映射方式加载向量
+        :param nprobe: 覆盖保存时的nprobe
+        """
+        with open(os.path.join(directory, _META_FILE), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        mode = "r" if mmap else None
+        vectors = np.load(os.path.join(directory, _VECTORS_FILE), mmap_mode=mode)
+        labels = np.load(os.path.join(directory, _LABELS_FILE))
+        centroids = offsets = None
+        if meta.get("ivf"):
+            centroids = np.load(os.path.join(directory, _CENTROIDS_FILE))
+            offsets = np.load(os.path.join(directory, _OFFSETS_FILE))
+        return cls(vectors, labels, centroids, offsets, nprobe=nprobe or meta.get("nprobe", 8))
@@ -0,0 +1,188 @@
+import argparse
+import json
+import mmap
+import os
+from collections import Counter
+from dataclasses import dataclass, field
+from multiprocessing import Pool
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from tqdm import tqdm
+
+from utils.file.file_walker import FileEntry, walk_files
+
+# mmap按块计数换行符，块大小只影响单次拷贝的内存占用
+_CHUNK = 1 << 20
+
+
+def count_buffer_lines(buf) -> Tuple[int, int]:
+    """
+    统计一段字节（bytes、memoryview或mmap）的行数和字节数。\n、\r\n 和单独的 \r 都算作换行，
+    最后一行没有换行符时也计为一行，与按通用换行模式读取时 len(f.readlines()) 一致。
+
+    :return: (行数, 字节数)
+    """
+    size = len(buf)
+    lines = 0
+    previous = b""
+    for start in range(0, size, _CHUNK):
+        chunk = bytes(buf[start:start + _CHUNK])
+        # \r\n 只算一次；跨块的 \r\n 由上一块的最后一个字节判断
+        lines += chunk.count(b"\n") + chunk.count(b"\r") - chunk.count(b"\r\n")
+        if previous == b"\r" and chunk[:1] == b"\n":
+            lines -= 1
+        previous = chunk[-1:]
+    if previous not in (b"", b"\n", b"\r"):
+        lines += 1
+    return lines, size
+
+
+def count_lines(path: str) -> Tuple[int, int]:
+    """
+    统计文件的行数和字节数。文件映射到内存后直接数换行字节，不解码、不构造行列表，计数规则见 count_buffer_lines。
+
+    :return: (行数, 字节数)
+    """
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            # 长度为0的文件无法映射
+            return 0, 0
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return count_buffer_lines(mm)
+
+
+def _bucket(n: int) -> int:
+    """2的幂分桶：0、1、2-3、4-7、8-15……，返回桶的下界。"""
+    return 0 if n <= 0 else 1 << (n.bit_length() - 1)
+
+
+def _bucket_label(low: int) -> str:
+    return str(low) if low <= 1 else f"{low}-{2 * low - 1}"
+
+
+@dataclass
+class CorpusStats:
+    """语料统计：文件数、行数、字节数、方法数，以及每文件行数和每文件方法数的分布。"""
+
+    files: int = 0
+    lines: int = 0
+    bytes: int = 0
+    methods: int = 0
+    errors: int = 0
+    lines_histogram: Counter = field(default_factory=Counter)
+    methods_histogram: Counter = field(default_factory=Counter)
+
+    def add(self, lines: int, size: int, methods: Optional[int] = None):
+        self.files += 1
+        self.lines += lines
+        self.bytes += size
+        self.lines_histogram[_bucket(lines)] += 1
+        if methods is not None:
+            self.methods += methods
+            self.methods_histogram[_bucket(methods)] += 1
+
+    def to_dict(self) -> dict:
+        return {
+            "files": self.files,
+            "lines": self.lines,
+            "bytes": self.bytes,
+            "methods": self.methods,
+            "errors": self.errors,
+            "methods_per_file": self.methods / self.files if self.files else 0.0,
+            "lines_histogram": {_bucket_label(k): v for k, v in sorted(self.lines_histogram.items())},
+            "methods_histogram": {_bucket_label(k): v for k, v in sorted(self.methods_histogram.items())},
+        }
+
+    def format(self) -> str:
+        lines = [
+            f"Files: {self.files}  Lines: {self.lines}  Bytes: {self.bytes}"
+            + (f"  Errors: {self.errors}" if self.errors else ""),
+        ]
+        histograms = [("Lines per file", self.lines_histogram)]
+        if self.methods_histogram:
+            lines.append(f"Methods: {self.methods} ({self.methods / self.files:.2f} per file)")
+            histograms.append(("Methods per file", self.methods_histogram))
+        for title, histogram in histograms:
+            lines.append(f"{title}:")
+            peak = max(histogram.values(), default=0)
+            for low, count in sorted(histogram.items()):
+                bar = "#" * max(1, round(40 * count / peak))
+                lines.append(f"  {_bucket_label(low):>12} {count:>9} {bar}")
+        return "\n".join(lines)
+
+
+def _count_entry(path: str) -> Tuple[str, Optional[Tuple[int, int]]]:
+    try:
+        return path, count_lines(path)
+    except OSError as e:
+        print(f"Error reading file {path}: {e}")
+        return path, None
+
+
+def collect_stats(
+    entries: Iterable[FileEntry],
+    methods_per_file: Optional[Dict[str, int]] = None,
+    workers: int = 1,
+    show_progress: bool = True,
+) -> CorpusStats:
+    """
+    统计文件清单中的所有文件。
+
+    :param methods_per_file: 路径 -> 方法数（如由 functions.pkl 得到），缺省时不统计方法
+    :param workers: 进程数
+    """
+    paths = [e.path for e in entries]
+    stats = CorpusStats()
+    if workers > 1:
+        with Pool(processes=workers) as pool:
+            results = pool.imap_unordered(_count_entry, paths, chunksize=64)
+            results = list(tqdm(results, total=len(paths), desc="Counting lines", disable=not show_progress))
+    else:
+        results = [_count_entry(p) for p in tqdm(paths, desc="Counting lines", disable=not show_progress)]
+    for path, counted in results:
+        if counted is None:
+            stats.errors += 1
+            continue
+        methods = None
+        if methods_per_file is not None:
+            methods = methods_per_file.get(os.path.abspath(path), 0)
+        stats.add(counted[0], counted[1], methods)
+    return stats
+
+
+def methods_by_file(functions) -> Dict[str, int]:
+    """由 FunctionInfo 列表得到 绝对路径 -> 方法数。"""
+    return dict(Counter(os.path.abspath(f.path) for f in functions))
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Corpus statistics: files, lines, bytes and methods per file")
+    parser.add_argument("--path", default=None, help="数据集目录，默认取 config.dataset_path")
+    parser.add_argument("--functions", default=None, help="functions.pkl 路径，提供时统计每文件方法数")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--json", default=None, help="把统计结果另存为JSON")
+    parser.add_argument("--manifest", default=None, help="文件清单路径（与 get_all_functions.py --manifest 共用）")
+    args = parser.parse_args(argv)
+
+    path = args.path
+    if path is None:
+        import config
+        path = config.dataset_path
+    if not os.path.isdir(path):
+        parser.error(f"Dataset path not found: {path}")
+
+    methods = None
+    if args.functions:
+        from utils.file.file_io import read_functions_from_disk
+        methods = methods_by_file(read_functions_from_disk(args.functions))
+
+    stats = collect_stats(walk_files(path, manifest_path=args.manifest), methods, workers=args.workers)
+    print(stats.format())
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(stats.to_dict(), f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
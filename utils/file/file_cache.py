@@ -2,6 +2,9 @@ import os
 import multiprocessing
 from tqdm import tqdm
 
+from utils.file.file_walker import walk_files
+from utils.file.shared_source_store import SharedSourceStore
+
 
 def _process_file(file_info, encoding='utf-8'):
     """
@@ -26,21 +29,35 @@ def _process_file(file_info, encoding='utf-8'):
 
 
 class FileCache:
-    def __init__(self, directory_path, show_progress=True, use_multiprocessing=False, workers=1):
+    def __init__(self, directory_path, show_progress=True, use_multiprocessing=False, workers=1, manifest_path=None,
+                 shared_memory=False):
+        """
+        :param manifest_path: 文件清单路径，目录未变化时不再重新扫描，见 walk_files
+        :param shared_memory: 把文件内容放入共享内存（SharedSourceStore），不再逐个pickle回主进程；
+            之后的进程池通过 self.store.handle 附加，按行号取片段不拷贝
+        """
         self.directory_path = directory_path
+        self.manifest_path = manifest_path
         self.cache = {}
-        
-        self._init_from_directory(show_progress, use_multiprocessing, workers)
+        self.store = None
+
+        if shared_memory:
+            if not os.path.exists(self.directory_path):
+                raise FileNotFoundError(f"Directory not found: {self.directory_path}")
+            entries = walk_files(self.directory_path, extensions=None, manifest_path=self.manifest_path)
+            self.store = SharedSourceStore.create(entry.path for entry in entries)
+        else:
+            self._init_from_directory(show_progress, use_multiprocessing, workers)
 
     def _init_from_directory(self, show_progress: bool, use_multiprocessing: bool, workers: int):
         if not os.path.exists(self.directory_path):
             raise FileNotFoundError(f"Directory not found: {self.directory_path}")
         
         # 首先收集所有文件路径
-        all_files = []
-        for root, dirs, files in os.walk(self.directory_path):
-            for file_name in files:
-                all_files.append((root, file_name))
+        all_files = [
+            os.path.split(entry.path)
+            for entry in walk_files(self.directory_path, extensions=None, manifest_path=self.manifest_path)
+        ]
         
         if use_multiprocessing:
             # 创建进程池
@@ -75,13 +92,30 @@ class FileCache:
         :param file_path: 文件路径（相对于缓存目录）
         :return: 文件内容，如果文件不存在则返回None
         """
+        if self.store is not None:
+            return self.store.get_file(file_path)
         return self.cache.get(file_path)
+
+    def get_snippet(self, file_path, start_line, end_line):
+        """
+        获取文件第 start_line 到 end_line 行（从1开始，含两端），文件不存在时返回None。
+        共享内存模式下直接在共享内存上切片，不需要先取出整个文件。
+        """
+        if self.store is not None:
+            return self.store.snippet_text(file_path, start_line, end_line)
+        content = self.cache.get(file_path)
+        if content is None:
+            return None
+        lines = content.splitlines(keepends=True)
+        return ''.join(lines[max(0, start_line - 1):min(len(lines), end_line)])
     
     def get_all_files(self):
         """
         获取所有缓存的文件路径
         :return: 文件路径列表
         """
+        if self.store is not None:
+            return self.store.get_all_files()
         return list(self.cache.keys())
     
     def has_file(self, file_path):
@@ -90,5 +124,14 @@ class FileCache:
         :param file_path: 文件路径（相对于缓存目录）
         :return: 存在返回True，否则返回False
         """
+        if self.store is not None:
+            return self.store.has_file(file_path)
         return file_path in self.cache
+
+    def close(self):
+        """释放共享内存（仅共享内存模式）。"""
+        if self.store is not None:
+            self.store.close()
+            self.store = None
+
     
\ No newline at end of file
@@ -0,0 +1,121 @@
+import json
+import os
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+# 清单格式变化时递增，旧清单随之失效
+MANIFEST_VERSION = 1
+
+
+@dataclass(frozen=True)
+class FileEntry:
+    """文件清单中的一项。"""
+
+    path: str
+    size: int
+    mtime_ns: int
+
+
+@dataclass
+class WalkStats:
+    """一次遍历中复用清单的目录数和重新扫描的目录数。"""
+
+    reused_dirs: int = 0
+    scanned_dirs: int = 0
+
+
+def _scan_dir(path: str, extensions: Optional[Tuple[str, ...]]) -> Tuple[Dict[str, List[int]], List[str]]:
+    """scandir一个目录：扩展名在stat之前过滤，不匹配的文件不产生额外的系统调用。"""
+    files: Dict[str, List[int]] = {}
+    subdirs: List[str] = []
+    with os.scandir(path) as it:
+        for entry in it:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.name)
+                elif (extensions is None or entry.name.endswith(extensions)) and entry.is_file():
+                    st = entry.stat()
+                    files[entry.name] = [st.st_size, st.st_mtime_ns]
+            except OSError:
+                continue
+    return files, subdirs
+
+
+def _load_manifest(path: Optional[str], root: str, extensions) -> Dict[str, dict]:
+    if not path or not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if (data.get("version"), data.get("root"), data.get("extensions")) != (
+        MANIFEST_VERSION, os.path.abspath(root), list(extensions) if extensions is not None else None
+    ):
+        return {}
+    return data["dirs"]
+
+
+def _save_manifest(path: str, root: str, extensions, dirs: Dict[str, dict]):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    # 临时文件名带进程号，多个分片进程同时更新同一份清单时互不覆盖
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({
+            "version": MANIFEST_VERSION,
+            "root": os.path.abspath(root),
+            "extensions": list(extensions) if extensions is not None else None,
+            "dirs": dirs,
+        }, f)
+    os.replace(tmp, path)
+
+
+def walk_files(
+    root: str,
+    extensions: Optional[Tuple[str, ...]] = (".java",),
+    manifest_path: Optional[str] = None,
+    stats: Optional[WalkStats] = None,
+) -> List[FileEntry]:
+    """
+    列出目录下所有（扩展名匹配的）文件及其大小和修改时间，按路径排序。
+    提取函数、语料统计和FileCache共用这一份清单。
+
+    提供 manifest_path 时把每个目录的修改时间、文件和子目录持久化。之后的遍历每个目录只stat一次，
+    修改时间未变的目录直接沿用清单，不再scandir和stat其中的文件。目录的修改时间只在增删、重命名
+    条目时变化，原地修改的文件在清单中的大小和修改时间可能过期；需要时删除清单强制重新扫描。
+
+    :param extensions: 保留的扩展名，None表示全部文件
+    :param stats: 提供时记录复用和重新扫描的目录数
+    """
+    cached = _load_manifest(manifest_path, root, extensions)
+    dirs: Dict[str, dict] = {}
+    entries: List[FileEntry] = []
+    stack = ["."]
+    while stack:
+        rel = stack.pop()
+        path = root if rel == "." else os.path.join(root, rel)
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError:
+            continue
+        record = cached.get(rel)
+        if record is not None and record["mtime_ns"] == mtime_ns:
+            if stats is not None:
+                stats.reused_dirs += 1
+        else:
+            try:
+                files, subdirs = _scan_dir(path, extensions)
+            except OSError:
+                continue
+            record = {"mtime_ns": mtime_ns, "files": files, "subdirs": subdirs}
+            if stats is not None:
+                stats.scanned_dirs += 1
+        dirs[rel] = record
+        for name, (size, file_mtime) in record["files"].items():
+            entries.append(FileEntry(os.path.join(path, name), size, file_mtime))
+        stack.extend(name if rel == "." else os.path.join(rel, name) for name in record["subdirs"])
+
+    if manifest_path and dirs != cached:
+        _save_manifest(manifest_path, root, extensions, dirs)
+    entries.sort(key=lambda e: e.path)
+    return entries
@@ -0,0 +1,107 @@
+import json
+import os
+from typing import Dict, Iterator
+
+
+def _repair_tail(path: str) -> int:
+    """
+    截掉文件末尾没有换行符的半行（上次运行在写入中途崩溃留下的），返回截掉的字节数。
+    """
+    size = os.path.getsize(path)
+    if size == 0:
+        return 0
+    with open(path, "rb+") as f:
+        block = 1 << 16
+        pos = size
+        while pos > 0:
+            start = max(0, pos - block)
+            f.seek(start)
+            chunk = f.read(pos - start)
+            nl = chunk.rfind(b"\n")
+            if nl != -1:
+                keep = start + nl + 1
+                break
+            pos = start
+        else:
+            keep = 0
+        if keep != size:
+            f.truncate(keep)
+        return size - keep
+
+
+def iter_jsonl_records(path: str) -> Iterator[dict]:
+    """逐行读取JSONL，跳过空行、损坏行和末尾不完整的半行。"""
+    with open(path, "rb") as f:
+        for line in f:
+            if not line.endswith(b"\n") or not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(record, dict):
+                yield record
+
+
+def load_journal(path: str, key: str = "id") -> Dict[object, dict]:
+    """
+    读取结果日志，返回 key -> 最后一条记录。同一个key被重试过时，后写入的记录覆盖先写入的。
+    """
+    records: Dict[object, dict] = {}
+    if not os.path.exists(path):
+        return records
+    for record in iter_jsonl_records(path):
+        if key in record:
+            records[record[key]] = record
+    return records
+
+
+class JsonlJournal:
+    """
+    追加写入的JSONL结果日志。
+
+    每条记录编码为完整的一行后用一次write系统调用写入O_APPEND文件描述符，不经过用户态缓冲；
+    进程被杀死时最多留下末尾一条不完整的半行，读取时会被忽略，续跑打开时会被截掉。
+    因此从读者角度看，一行要么完整存在，要么不存在。
+    """
+
+    def __init__(self, path: str, resume: bool = False, fsync_every: int = 0):
+        """
+        :param path: 日志文件路径
+        :param resume: True时保留已有内容并在末尾追加，否则清空文件
+        :param fsync_every: 每写入多少行调用一次fsync，0表示只在关闭时fsync
+        """
+        self.path = path
+        self.fsync_every = fsync_every
+        self._pending_sync = 0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        if resume and os.path.exists(path):
+            _repair_tail(path)
+            flags = os.O_WRONLY | os.O_APPEND
+        else:
+            flags = os.O_WRONLY | os.O_APPEND | os.O_CREAT | os.O_TRUNC
+        self._fd = os.open(path, flags, 0o644)
+
+    def append(self, record: dict):
+        data = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        view = memoryview(data)
+        while view:
+            written = os.write(self._fd, view)
+            view = view[written:]
+        self._pending_sync += 1
+        if self.fsync_every and self._pending_sync >= self.fsync_every:
+            os.fsync(self._fd)
+            self._pending_sync = 0
+
+    def close(self):
+        if self._fd is None:
+            return
+        os.fsync(self._fd)
+        os.close(self._fd)
+        self._fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -1,45 +1,33 @@
+"""
+统计数据集中 .java 文件的代码行数。
+
+已由 utils.file.corpus_stats 取代，这里保留原有的函数接口：
+    python -m utils.file.line_counter [--path DIR]
+"""
 import os
-import sys
+from typing import List, Optional
 
-# Add the project root to the Python path
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.file.corpus_stats import collect_stats, count_lines, main as corpus_stats_main
+from utils.file.file_walker import walk_files
 
-from config import dataset_path
-from tqdm import tqdm
-from multiprocessing import Pool, cpu_count
 
 def count_lines_in_file(file_path):
     """Counts the number of lines in a single file."""
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            return len(f.readlines())
-    except Exception as e:
+        return count_lines(file_path)[0]
+    except OSError as e:
         print(f"Error reading file {file_path}: {e}")
         return 0
 
-def count_lines_in_directory(directory):
-    """Counts the total number of lines in all files within a directory."""
-    java_files = []
-    for root, _, files in os.walk(directory):
-        for file in files:
-            # We only count lines for .java files, as this is a java dataset.
-            if file.endswith(".java"):
-                java_files.append(os.path.join(root, file))
 
-    with Pool(processes=cpu_count()) as pool:
-        results = list(tqdm(pool.imap_unordered(count_lines_in_file, java_files), total=len(java_files), desc="Counting lines"))
+def count_lines_in_directory(directory, manifest_path=None):
+    """Counts the total number of lines in all .java files within a directory."""
+    return collect_stats(walk_files(directory, manifest_path=manifest_path), workers=os.cpu_count() or 1).lines
+
+
+def main(argv: Optional[List[str]] = None):
+    corpus_stats_main(argv)
 
-    total_lines = sum(results)
-    return total_lines
 
 if __name__ == "__main__":
-    # The dataset_path in config.py is relative to the project root.
-    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    absolute_dataset_path = os.path.abspath(os.path.join(project_root, dataset_path))
-
-    if not os.path.exists(absolute_dataset_path):
-        print(f"Error: Dataset path not found at {absolute_dataset_path}")
-    else:
-        print(f"Counting lines of code in: {absolute_dataset_path}")
-        total_line_count = count_lines_in_directory(absolute_dataset_path)
-        print(f"Total lines of code in .java files: {total_line_count}")
+    main()
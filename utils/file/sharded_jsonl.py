@@ -0,0 +1,121 @@
+import gzip
+import json
+import os
+from typing import Dict, List, Optional
+
+
+class ShardedJsonlWriter:
+    """
+    流式写入JSONL，按行数和字节数上限自动切换到下一个分片，可选gzip压缩。
+
+    每条记录写入后立即落到当前分片，不在内存中累积。提供key时同时把 key -> 分片序号及附加字段
+    流式写入清单文件（JSONL），之后可以用 load_manifest 读回。
+
+    不设上限时只写一个文件，路径就是 path（压缩时追加 .gz）；
+    设了上限时分片命名为 <stem>.part0000.jsonl、<stem>.part0001.jsonl ……
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_lines: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        compress: bool = False,
+        manifest_path: Optional[str] = None,
+    ):
+        """
+        :param path: 输出路径（或分片命名的基准路径）
+        :param max_lines: 每个分片最多行数
+        :param max_bytes: 每个分片最多字节数（按未压缩的字节计）
+        :param compress: 是否gzip压缩分片
+        :param manifest_path: 清单文件路径，None表示不写清单
+        """
+        self.path = path
+        self.max_lines = max_lines
+        self.max_bytes = max_bytes
+        self.compress = compress
+        self.paths: List[str] = []
+        self.records = 0
+        self._file = None
+        self._lines = 0
+        self._bytes = 0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._manifest = open(manifest_path, "w", encoding="utf-8") if manifest_path else None
+
+    def _shard_path(self, index: int) -> str:
+        if self.max_lines is None and self.max_bytes is None:
+            path = self.path
+        else:
+            stem, ext = os.path.splitext(self.path)
+            path = f"{stem}.part{index:04d}{ext or '.jsonl'}"
+        return path + ".gz" if self.compress else path
+
+    def _rotate(self):
+        if self._file is not None:
+            self._file.close()
+        path = self._shard_path(len(self.paths))
+        self._file = gzip.open(path, "wb") if self.compress else open(path, "wb")
+        self.paths.append(path)
+        self._lines = 0
+        self._bytes = 0
+
+    def write(self, record: dict, key: Optional[str] = None, **manifest_fields):
+        """
+        写入一条记录。
+
+        :param record: 要写入的JSON对象
+        :param key: 清单中的键（如 custom_id），None表示不记入清单
+        :param manifest_fields: 清单中随键一起保存的附加字段
+        """
+        data = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        if self.max_bytes is not None and len(data) > self.max_bytes:
+            raise ValueError(f"Record {key or self.records} is larger than the {self.max_bytes}-byte shard limit")
+        if (
+            self._file is None
+            or (self.max_lines is not None and self._lines >= self.max_lines)
+            or (self.max_bytes is not None and self._bytes + len(data) > self.max_bytes)
+        ):
+            self._rotate()
+        self._file.write(data)
+        self._lines += 1
+        self._bytes += len(data)
+        self.records += 1
+        if self._manifest is not None and key is not None:
+            entry = {"key": key, "shard": len(self.paths) - 1, **manifest_fields}
+            self._manifest.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def close(self) -> List[str]:
+        """关闭所有文件，返回分片路径列表。一条记录都没写时也会创建一个空文件。"""
+        if self._file is None and not self.paths:
+            self._rotate()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._manifest is not None:
+            self._manifest.close()
+            self._manifest = None
+        return self.paths
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def load_manifest(path: str) -> Dict[str, dict]:
+    """读取 ShardedJsonlWriter 写出的清单，返回 key -> {"shard": ..., 附加字段}。"""
+    manifest: Dict[str, dict] = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                manifest[entry.pop("key")] = entry
+    return manifest
+
+
+def open_jsonl(path: str, mode: str = "rt"):
+    """按扩展名打开普通或gzip压缩的JSONL文件。"""
+    if path.endswith(".gz"):
+        return gzip.open(path, mode, encoding="utf-8") if "t" in mode else gzip.open(path, mode)
+    return open(path, mode, encoding="utf-8") if "t" in mode else open(path, mode)
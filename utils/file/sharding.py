@@ -0,0 +1,51 @@
+import argparse
+import hashlib
+import os
+from dataclasses import dataclass
+from typing import List
+
+
+def shard_of(key: str, count: int) -> int:
+    """
+    稳定的分片号：blake2b哈希对分片数取模。不使用内置hash()，
+    它在不同进程间带随机盐，多台机器上会得到不同的划分。
+    """
+    digest = hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % count
+
+
+@dataclass(frozen=True)
+class Shard:
+    """N个分片中的第index个（从0开始）。"""
+
+    index: int
+    count: int
+
+    def __post_init__(self):
+        if self.count < 1 or not 0 <= self.index < self.count:
+            raise ValueError(f"Invalid shard {self.index}/{self.count}")
+
+    @classmethod
+    def parse(cls, text: str) -> "Shard":
+        """解析 "i/N" 形式的分片描述，供 argparse 的 type 使用。"""
+        try:
+            index, count = (int(part) for part in text.split("/"))
+            return cls(index, count)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"expected i/N with 0 <= i < N, got {text!r}")
+
+    def __str__(self) -> str:
+        return f"{self.index}/{self.count}"
+
+    def owns(self, key: str) -> bool:
+        return shard_of(key, self.count) == self.index
+
+    def path(self, path: str) -> str:
+        """该分片的输出路径：functions.pkl -> functions.shard-0-of-4.pkl"""
+        stem, ext = os.path.splitext(path)
+        return f"{stem}.shard-{self.index}-of-{self.count}{ext}"
+
+
+def shard_paths(path: str, count: int) -> List[str]:
+    """N个分片各自的输出路径。"""
+    return [Shard(i, count).path(path) for i in range(count)]
@@ -0,0 +1,232 @@
+import os
+import re
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+_NEWLINE = ord("\n")
+# str.splitlines 认作换行的字符在UTF-8下的字节序列，\r\n 算一次换行
+_LINE_BREAK = re.compile(rb"\r\n|[\n\r\x0b\x0c\x1c\x1d\x1e]|\xc2\x85|\xe2\x80[\xa8\xa9]")
+# 出现这些字节时才需要逐个匹配 _LINE_BREAK，否则只有 \n 是换行
+_OTHER_BREAK_BYTES = np.zeros(256, dtype=bool)
+_OTHER_BREAK_BYTES[[0x0b, 0x0c, 0x0d, 0x1c, 0x1d, 0x1e, 0x85, 0xa8, 0xa9]] = True
+
+
+@dataclass(frozen=True)
+class SourceStoreHandle:
+    """共享源码存储的可pickle描述，传给工作进程后由 SharedSourceStore.attach 附加。"""
+
+    data_name: str
+    table_name: str
+    paths: Tuple[str, ...]
+    total_bytes: int
+    total_lines: int
+
+
+def _attach_shm(name: str) -> shared_memory.SharedMemory:
+    # 进程池的工作进程与创建者共用同一个resource_tracker，附加时的重复登记不影响创建者的unlink，
+    # 因此这里不能unregister，否则创建者unlink时tracker会报KeyError
+    return shared_memory.SharedMemory(name=name)
+
+
+def decode_source(data) -> str:
+    """
+    按与 open(path, "r", encoding="utf-8").read() 相同的规则解码：严格的UTF-8解码，\r\n 和单独的 \r 转换为 \n。
+    共享存储与从磁盘读取因此得到相同的文本和行号。
+    """
+    text = str(data, "utf-8")
+    return text.replace("\r\n", "\n").replace("\r", "\n") if "\r" in text else text
+
+
+def _line_starts(buf, offset: int, length: int) -> np.ndarray:
+    """
+    buf[offset:offset+length] 中每一行的起始字节偏移（相对于整个buf），行的划分与解码后 str.splitlines 一致。
+    """
+    chunk = np.frombuffer(buf, dtype=np.uint8, count=length, offset=offset)
+    if _OTHER_BREAK_BYTES[chunk].any():
+        starts = np.fromiter((m.end() for m in _LINE_BREAK.finditer(buf[offset:offset + length])), dtype=np.int64)
+    else:
+        starts = np.flatnonzero(chunk == _NEWLINE) + 1
+    if starts.size and starts[-1] == length:
+        starts = starts[:-1]
+    return np.concatenate(([0], starts)).astype(np.int64) + offset
+
+
+class SharedSourceStore:
+    """
+    放在 multiprocessing.shared_memory 中的只读源码存储。
+
+    所有文件的原始字节依次写入一块连续的共享内存，另一块共享内存存放int64偏移表：
+    每个文件的起始字节偏移、每个文件第一行在行表中的位置、以及所有行的起始字节偏移。
+    主进程创建一次，工作进程通过 handle 附加，按路径取文件或按行号切片都只返回共享内存上的
+    memoryview，不拷贝、不经过pickle。行的划分与 str.splitlines 一致（\\r、\\r\\n 等也算换行），
+    取出的文本按 decode_source 解码，与从磁盘读取和 FileCache.get_snippet 的结果相同。
+
+    提供与 FileCache 相同的 get_file/has_file/get_all_files 接口，可直接传给 JavaParser 和 ClonePair。
+    close() 之前需释放取得的所有 memoryview。
+    """
+
+    def __init__(
+        self,
+        handle: SourceStoreHandle,
+        data: shared_memory.SharedMemory,
+        table: shared_memory.SharedMemory,
+        owner: bool,
+    ):
+        self.handle = handle
+        self._data = data
+        self._table = table
+        self._owner = owner
+        n = len(handle.paths)
+        self._buf = data.buf[:handle.total_bytes]
+        self._ints = table.buf[:8 * (2 * (n + 1) + handle.total_lines)].cast("q")
+        self._file_offsets = self._ints[:n + 1]
+        self._line_index = self._ints[n + 1:2 * (n + 1)]
+        self._line_starts = self._ints[2 * (n + 1):]
+        self._index = {p: i for i, p in enumerate(handle.paths)}
+
+    @classmethod
+    def create(cls, paths: Iterable[str]) -> "SharedSourceStore":
+        """
+        读取文件写入共享内存。文件直接 readinto 共享内存，不经过中间的bytes对象；无法读取的文件被跳过。
+        """
+        files: List[Tuple[str, int]] = []
+        for path in paths:
+            path = os.path.abspath(path)
+            try:
+                files.append((path, os.path.getsize(path)))
+            except OSError as e:
+                print(f"Error loading file {path}: {e}")
+        total = sum(size for _, size in files)
+        data = shared_memory.SharedMemory(create=True, size=max(1, total))
+
+        kept: List[str] = []
+        offsets = [0]
+        line_starts = []
+        try:
+            offset = 0
+            for path, size in files:
+                try:
+                    with open(path, "rb") as f:
+                        # 文件在列出后变长时只读取列出时的大小
+                        read = f.readinto(data.buf[offset:offset + size]) if size else 0
+                except OSError as e:
+                    print(f"Error loading file {path}: {e}")
+                    continue
+                if read:
+                    line_starts.append(_line_starts(data.buf, offset, read))
+                kept.append(path)
+                offset += read
+                offsets.append(offset)
+        except BaseException:
+            data.close()
+            data.unlink()
+            raise
+
+        lines = np.concatenate(line_starts) if line_starts else np.zeros(0, dtype=np.int64)
+        line_index = np.zeros(len(kept) + 1, dtype=np.int64)
+        if lines.size:
+            line_index[:] = np.searchsorted(lines, offsets, side="left")
+        ints = np.concatenate((np.asarray(offsets, dtype=np.int64), line_index, lines.astype(np.int64)))
+        table = shared_memory.SharedMemory(create=True, size=max(8, ints.nbytes))
+        table.buf[:ints.nbytes] = ints.tobytes()
+        handle = SourceStoreHandle(data.name, table.name, tuple(kept), offsets[-1], int(lines.size))
+        return cls(handle, data, table, owner=True)
+
+    @classmethod
+    def attach(cls, handle: SourceStoreHandle) -> "SharedSourceStore":
+        """在工作进程中附加已创建的存储（只读使用）。"""
+        return cls(handle, _attach_shm(handle.data_name), _attach_shm(handle.table_name), owner=False)
+
+    def __len__(self) -> int:
+        return len(self.handle.paths)
+
+    def __contains__(self, path: str) -> bool:
+        return self._key(path) is not None
+
+    def _key(self, path: str) -> Optional[int]:
+        i = self._index.get(path)
+        if i is None:
+            i = self._index.get(os.path.abspath(path))
+        return i
+
+    def get_bytes(self, path: str) -> Optional[memoryview]:
+        """文件的原始字节（共享内存上的memoryview），不存在时返回None。"""
+        i = self._key(path)
+        if i is None:
+            return None
+        return self._buf[self._file_offsets[i]:self._file_offsets[i + 1]]
+
+    def line_count(self, path: str) -> int:
+        """文件按 str.splitlines 划分的行数，最后一行没有换行符时也计为一行。"""
+        i = self._key(path)
+        return 0 if i is None else self._line_index[i + 1] - self._line_index[i]
+
+    def byte_count(self, path: str) -> int:
+        i = self._key(path)
+        return 0 if i is None else self._file_offsets[i + 1] - self._file_offsets[i]
+
+    def snippet(self, path: str, start_line: int, end_line: int) -> Optional[memoryview]:
+        """
+        第 start_line 到 end_line 行（从1开始，含两端）的字节，行号超出范围时截断，与 ClonePair 的取片段规则一致。
+        """
+        i = self._key(path)
+        if i is None:
+            return None
+        first, last = self._line_index[i], self._line_index[i + 1]
+        lo = first + max(0, start_line - 1)
+        hi = first + min(last - first, end_line)
+        if lo >= hi:
+            return self._buf[0:0]
+        end = self._line_starts[hi] if hi < last else self._file_offsets[i + 1]
+        return self._buf[self._line_starts[lo]:end]
+
+    def snippet_text(self, path: str, start_line: int, end_line: int) -> Optional[str]:
+        view = self.snippet(path, start_line, end_line)
+        return None if view is None else decode_source(view)
+
+    # 与 FileCache 相同的接口
+    def get_file(self, file_path: str) -> Optional[str]:
+        view = self.get_bytes(file_path)
+        return None if view is None else decode_source(view)
+
+    def get_all_files(self) -> List[str]:
+        return list(self.handle.paths)
+
+    def has_file(self, file_path: str) -> bool:
+        return file_path in self
+
+    def get_snippet(self, file_path: str, start_line: int, end_line: int) -> Optional[str]:
+        return self.snippet_text(file_path, start_line, end_line)
+
+    def close(self):
+        """解除映射；创建者同时释放共享内存。"""
+        for view in (self._file_offsets, self._line_index, self._line_starts, self._ints, self._buf):
+            view.release()
+        self._data.close()
+        self._table.close()
+        if self._owner:
+            self._data.unlink()
+            self._table.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+_worker_store: Optional[SharedSourceStore] = None
+
+
+def init_worker_store(handle: SourceStoreHandle):
+    """进程池的initializer：在工作进程中附加共享源码存储。"""
+    global _worker_store
+    _worker_store = SharedSourceStore.attach(handle)
+
+
+def worker_store() -> Optional[SharedSourceStore]:
+    """当前工作进程附加的共享源码存储，未附加时为None。"""
+    return _worker_store
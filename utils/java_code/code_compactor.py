@@ -0,0 +1,187 @@
+import re
+import threading
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+import javalang
+
+from utils.llm.token_counter import estimate_tokens
+
+TRUNCATION_MARKER = "/* TRUNCATED */"
+
+_WORD_CHARS = re.compile(r"[A-Za-z0-9_$]")
+# 相邻时可能被粘成另一个运算符（如 + + -> ++，/ * -> 注释）的字符
+_OPERATOR_CHARS = set("+-*/%<>=!&|^~?:")
+# 这些词法单元紧跟在 "}" 等之后时不换行，例如匿名类结尾的 "};" 和 "})"
+_NO_BREAK_BEFORE = {";", ")", ",", "."}
+_COMMENT_RE = re.compile(r"//[^\n]*|/\*.*?\*/", re.S)
+_WHITESPACE_RE = re.compile(r"[ \t]+")
+_BLANK_LINES_RE = re.compile(r"\n\s*\n+")
+
+
+@dataclass(frozen=True)
+class CompactedCode:
+    code: str
+    original_tokens: int
+    tokens: int
+    truncated: bool = False
+
+    @property
+    def saved_tokens(self) -> int:
+        return self.original_tokens - self.tokens
+
+
+class CompactionStats:
+    """线程安全的代码压缩统计，按提示词累计节省的token数。"""
+
+    def __init__(self):
+        self.prompts = 0
+        self.saved_tokens = 0
+        self._lock = threading.Lock()
+
+    def record(self, saved_tokens: int):
+        with self._lock:
+            self.prompts += 1
+            self.saved_tokens += saved_tokens
+
+    def summary(self) -> str:
+        average = self.saved_tokens / self.prompts if self.prompts else 0.0
+        return (
+            f"Code compaction: saved ~{self.saved_tokens} tokens over {self.prompts} prompts "
+            f"(~{average:.0f} per prompt)"
+        )
+
+
+def _needs_space(prev: str, current: str) -> bool:
+    if _WORD_CHARS.match(prev[-1]) and _WORD_CHARS.match(current[0]):
+        return True
+    return prev[-1] in _OPERATOR_CHARS and current[0] in _OPERATOR_CHARS
+
+
+def _is_local_name(tokens: List, i: int) -> bool:
+    """tokens[i] 是否可能是局部名字：不是方法名（后跟"("）、成员访问（前有"."）或首字母大写的类型名。"""
+    token = tokens[i]
+    if not isinstance(token, javalang.tokenizer.Identifier) or token.value[0].isupper():
+        return False
+    if i + 1 < len(tokens) and tokens[i + 1].value == "(":
+        return False
+    return not (i > 0 and tokens[i - 1].value == ".")
+
+
+def _abbreviations(tokens: List, min_length: int) -> Dict[str, str]:
+    """
+    为较长的局部名字分配短别名，以免丢掉API和类型带来的语义，方法名、成员访问和类型名保持不变（见 _is_local_name）。
+    别名跳过片段中已出现的标识符，不会把两个不同的名字合并成一个。
+    """
+    used = {t.value for t in tokens if isinstance(t, javalang.tokenizer.Identifier)}
+    mapping: Dict[str, str] = {}
+    n = 0
+    for i, token in enumerate(tokens):
+        if not _is_local_name(tokens, i):
+            continue
+        name = token.value
+        if len(name) < min_length or name in mapping:
+            continue
+        while f"v{n}" in used:
+            n += 1
+        mapping[name] = f"v{n}"
+        n += 1
+    return mapping
+
+
+def _fallback_compact(code: str, max_tokens: Optional[int]) -> CompactedCode:
+    """无法词法分析的片段：正则去注释、合并空白，按字符近似截断。"""
+    text = _COMMENT_RE.sub("", code)
+    text = _BLANK_LINES_RE.sub("\n", "\n".join(_WHITESPACE_RE.sub(" ", line).strip() for line in text.splitlines()))
+    text = text.strip()
+    truncated = False
+    if max_tokens is not None and estimate_tokens(text) > max_tokens:
+        text = text[: max_tokens * 4].rstrip() + " " + TRUNCATION_MARKER
+        truncated = True
+    return CompactedCode(text, estimate_tokens(code), estimate_tokens(text), truncated)
+
+
+def compact_code(
+    code: str,
+    max_tokens: Optional[int] = None,
+    abbreviate_identifiers: bool = False,
+    min_identifier_length: int = 12,
+) -> CompactedCode:
+    """
+    基于Java词法分析压缩代码，用于放进提示词。
+
+    丢弃注释（含Javadoc）、缩进和空行；词法单元之间只在必要时保留一个空格；
+    括号外的 ";" "{" "}" 之后换行，保留每行一条语句的可读性。
+    可选地把较长的局部标识符替换为短别名。超出 max_tokens（本地估计）时在语句边界附近截断，
+    并追加截断标记，而不是按字符数硬切。
+
+    Args:
+        code: 原始代码
+        max_tokens: 压缩后代码的token上限，None表示不截断
+        abbreviate_identifiers: 是否缩写长标识符
+        min_identifier_length: 被缩写的标识符最短长度
+
+    Returns:
+        CompactedCode，包含压缩后代码和压缩前后的估计token数
+    """
+    if not code:
+        return CompactedCode("", 0, 0)
+    try:
+        tokens = list(javalang.tokenizer.tokenize(code))
+    except (javalang.tokenizer.LexerError, TypeError):
+        return _fallback_compact(code, max_tokens)
+
+    aliases = _abbreviations(tokens, min_identifier_length) if abbreviate_identifiers else {}
+    budget_chars = max_tokens * 4 if max_tokens is not None else None
+    pieces: List[str] = []
+    length = 0
+    depth = 0
+    prev = None
+    newline_pending = False
+    boundary = 0  # 最近一个语句边界之后 pieces 的长度，截断时回退到这里
+    truncated = False
+    for i, token in enumerate(tokens):
+        value = token.value
+        # 与建立别名时同样的判断：同名的方法调用和成员访问（如 this.count）不替换
+        if value in aliases and _is_local_name(tokens, i):
+            value = aliases[value]
+
+        if prev is None:
+            piece = value
+        elif newline_pending and value not in _NO_BREAK_BEFORE:
+            piece = "\n" + value
+        elif _needs_space(prev, value):
+            piece = " " + value
+        else:
+            piece = value
+        if newline_pending:
+            boundary = len(pieces)
+            newline_pending = False
+
+        if budget_chars is not None and length + len(piece) > budget_chars:
+            truncated = True
+            if boundary:
+                pieces = pieces[:boundary]
+            break
+        pieces.append(piece)
+        length += len(piece)
+        prev = value
+
+        if value == "(":
+            depth += 1
+        elif value == ")":
+            depth = max(0, depth - 1)
+        elif value in ("{", "}") or (value == ";" and depth == 0):
+            newline_pending = True
+
+    text = "".join(pieces)
+    if truncated:
+        text += ("\n" if text else "") + TRUNCATION_MARKER
+    return CompactedCode(text, estimate_tokens(code), estimate_tokens(text), truncated)
+
+
+@lru_cache(maxsize=65536)
+def compact_code_cached(code: str, max_tokens: Optional[int], abbreviate_identifiers: bool) -> CompactedCode:
+    """compact_code的带缓存版本：代表函数会出现在大量提示词中，只压缩一次。"""
+    return compact_code(code, max_tokens=max_tokens, abbreviate_identifiers=abbreviate_identifiers)
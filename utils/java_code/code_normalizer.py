@@ -0,0 +1,32 @@
+import hashlib
+import re
+from typing import List
+
+import javalang
+
+_COMMENT_RE = re.compile(r"//[^\n]*|/\*.*?\*/", re.S)
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def code_tokens(code: str) -> List[str]:
+    """
+    返回代码的词法单元值列表，注释和空白被丢弃。
+
+    片段无法被javalang词法分析时（如截断的字符串字面量），退化为按空白切分去掉注释后的文本。
+    """
+    if not code:
+        return []
+    try:
+        return [token.value for token in javalang.tokenizer.tokenize(code)]
+    except (javalang.tokenizer.LexerError, TypeError):
+        return _WHITESPACE_RE.split(_COMMENT_RE.sub(" ", code).strip())
+
+
+def normalize_code(code: str) -> str:
+    """把代码规范化为以单个空格分隔的词法单元序列，使仅空白或注释不同的片段得到相同结果。"""
+    return " ".join(code_tokens(code))
+
+
+def code_hash(code: str) -> str:
+    """规范化代码的内容哈希（128位blake2b十六进制串）。"""
+    return hashlib.blake2b(normalize_code(code).encode("utf-8"), digest_size=16).hexdigest()
@@ -0,0 +1,263 @@
+import json
+import os
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+
+class BudgetExceededError(Exception):
+    """花费达到硬上限，后续请求不再发出。"""
+
+
+@dataclass(frozen=True)
+class ModelPrice:
+    """每百万token的价格；batch_multiplier为批处理接口相对实时接口的价格系数。"""
+
+    prompt: float
+    completion: float
+    batch_multiplier: float = 0.5
+
+
+# 默认价格表（每百万token，美元）。实际价格以服务商为准，可通过 load_price_table 覆盖
+DEFAULT_PRICES: Dict[str, ModelPrice] = {
+    "gpt-4": ModelPrice(30.0, 60.0),
+    "gpt-4o": ModelPrice(2.5, 10.0),
+    "gpt-4o-mini": ModelPrice(0.15, 0.6),
+    "glm-4-flash": ModelPrice(0.0, 0.0),
+    "glm-4.5-flash": ModelPrice(0.0, 0.0),
+}
+
+
+def load_price_table(path: Optional[str] = None) -> Dict[str, ModelPrice]:
+    """
+    读取价格表JSON：{"模型名": {"prompt": 每百万输入token价格, "completion": ..., "batch_multiplier": ...}}。
+    文件中的条目覆盖默认价格表中的同名条目。
+    """
+    prices = dict(DEFAULT_PRICES)
+    if path:
+        with open(path, "r", encoding="utf-8") as f:
+            for model, entry in json.load(f).items():
+                prices[model] = ModelPrice(**entry)
+    return prices
+
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * q
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+class UsageLedger:
+    """
+    LLM调用记账：token用量（来自响应，缺失时用本地估计）、耗时分位数、重试次数、错误类别和花费。
+
+    两种预算上限：
+    - 软上限：花费首次达到时暂停发出新请求 soft_pause 秒（0表示只警告），期间可调用 resume() 提前继续
+    - 硬上限：admit()/reserve() 发现本次请求（按估计用量）会使花费超过硬上限时抛出 BudgetExceededError。
+      并发请求通过 reserve() 预占估计花费，record()/record_error()/release() 结算，
+      已花费加上所有在途请求的预占不会超过硬上限
+
+    可在多线程中共享同一个实例。
+    """
+
+    def __init__(
+        self,
+        prices: Optional[Dict[str, ModelPrice]] = None,
+        soft_budget: Optional[float] = None,
+        hard_budget: Optional[float] = None,
+        soft_pause: float = 0.0,
+    ):
+        self.prices = prices if prices is not None else dict(DEFAULT_PRICES)
+        self.soft_budget = soft_budget
+        self.hard_budget = hard_budget
+        self.soft_pause = soft_pause
+        self.requests = 0
+        self.cached = 0
+        self.estimated = 0
+        self.retries = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cost = 0.0
+        self.reserved = 0.0
+        self.errors: Counter = Counter()
+        self.by_model: Dict[str, Dict[str, float]] = {}
+        self.latencies: List[float] = []
+        self.unpriced_models = set()
+        self.started = time.time()
+        self._soft_triggered = False
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def price_of(self, model: str, prompt_tokens: int, completion_tokens: int, batch: bool = False) -> float:
+        price = self.prices.get(model)
+        if price is None:
+            # 带日期等后缀的模型名按最长前缀匹配
+            matches = [name for name in self.prices if model.startswith(name)]
+            price = self.prices[max(matches, key=len)] if matches else None
+        if price is None:
+            self.unpriced_models.add(model)
+            return 0.0
+        cost = (prompt_tokens * price.prompt + completion_tokens * price.completion) / 1_000_000
+        return cost * price.batch_multiplier if batch else cost
+
+    def admit(
+        self,
+        model: str,
+        estimated_prompt_tokens: int = 0,
+        estimated_completion_tokens: int = 0,
+        batch: bool = False,
+    ) -> float:
+        """
+        请求发出前调用。
+
+        :return: 需要等待的秒数（软上限暂停中），0表示可以立即发出
+        :raises BudgetExceededError: 本次请求会超过硬上限
+        """
+        with self._lock:
+            self._check_hard_budget(self.price_of(model, estimated_prompt_tokens, estimated_completion_tokens, batch))
+            return max(0.0, self._paused_until - time.monotonic())
+
+    def reserve(
+        self,
+        model: str,
+        estimated_prompt_tokens: int = 0,
+        estimated_completion_tokens: int = 0,
+        batch: bool = False,
+    ) -> float:
+        """
+        请求发出前预占估计花费：检查硬上限和预占在同一把锁内完成，并发的请求不会一起越过硬上限。
+        返回值需在请求结束后传给 record()/record_error() 的 reserved 参数，或调用 release() 释放。
+
+        :return: 预占的花费
+        :raises BudgetExceededError: 本次请求会超过硬上限
+        """
+        with self._lock:
+            amount = self.price_of(model, estimated_prompt_tokens, estimated_completion_tokens, batch=batch)
+            self._check_hard_budget(amount)
+            self.reserved += amount
+            return amount
+
+    def release(self, reserved: float):
+        """释放 reserve() 预占的花费（请求没有发出或没有结果时）。"""
+        with self._lock:
+            self.reserved = max(0.0, self.reserved - reserved)
+
+    def _check_hard_budget(self, amount: float):
+        # 调用方需持有 self._lock
+        if self.hard_budget is None:
+            return
+        committed = self.cost + self.reserved
+        if committed >= self.hard_budget or committed + amount > self.hard_budget:
+            raise BudgetExceededError(
+                f"Hard budget {self.hard_budget:.4f} reached (spent {self.cost:.4f}, in flight {self.reserved:.4f})"
+            )
+
+    def resume(self):
+        """结束软上限触发的暂停。"""
+        with self._lock:
+            self._paused_until = 0.0
+
+    def record(
+        self,
+        model: str,
+        prompt_tokens: int,
+        completion_tokens: int,
+        latency: Optional[float] = None,
+        attempts: int = 1,
+        cached: bool = False,
+        estimated: bool = False,
+        batch: bool = False,
+        reserved: float = 0.0,
+    ) -> float:
+        """
+        记录一次成功的调用，返回本次花费。缓存命中不计花费。
+
+        :param reserved: 该请求 reserve() 预占的花费，在此结算为实际花费
+        """
+        cost = 0.0 if cached else self.price_of(model, prompt_tokens, completion_tokens, batch=batch)
+        with self._lock:
+            self.reserved = max(0.0, self.reserved - reserved)
+            self.requests += 1
+            self.cached += cached
+            self.estimated += estimated
+            self.retries += max(0, attempts - 1)
+            if not cached:
+                self.prompt_tokens += prompt_tokens
+                self.completion_tokens += completion_tokens
+                self.cost += cost
+                model_stats = self.by_model.setdefault(
+                    model, {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0, "cost": 0.0}
+                )
+                model_stats["requests"] += 1
+                model_stats["prompt_tokens"] += prompt_tokens
+                model_stats["completion_tokens"] += completion_tokens
+                model_stats["cost"] += cost
+            if latency is not None and not cached:
+                self.latencies.append(latency)
+            if self.soft_budget is not None and not self._soft_triggered and self.cost >= self.soft_budget:
+                self._soft_triggered = True
+                print(f"WARNING: soft budget {self.soft_budget:.4f} reached (spent {self.cost:.4f})"
+                      + (f", pausing new requests for {self.soft_pause:.0f}s" if self.soft_pause else ""))
+                self._paused_until = time.monotonic() + self.soft_pause
+        return cost
+
+    def record_error(self, error, attempts: int = 1, reserved: float = 0.0):
+        """
+        记录一次失败的调用，按错误类别（HTTP状态码或异常类名；传入字符串时即为类别）计数。
+
+        :param reserved: 该请求 reserve() 预占的花费，失败的请求不计花费，预占全部释放
+        """
+        if isinstance(error, str):
+            kind = error
+        else:
+            status = getattr(error, "status_code", None)
+            kind = f"HTTP {status}" if status else error.__class__.__name__
+        with self._lock:
+            self.reserved = max(0.0, self.reserved - reserved)
+            self.errors[kind] += 1
+            self.retries += max(0, attempts - 1)
+
+    def summary(self) -> dict:
+        with self._lock:
+            latencies = sorted(self.latencies)
+            return {
+                "requests": self.requests,
+                "cached": self.cached,
+                "estimated_usage": self.estimated,
+                "retries": self.retries,
+                "errors": dict(self.errors),
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "cost": round(self.cost, 6),
+                "soft_budget": self.soft_budget,
+                "hard_budget": self.hard_budget,
+                "latency": {
+                    "p50": round(_percentile(latencies, 0.5), 3),
+                    "p90": round(_percentile(latencies, 0.9), 3),
+                    "p99": round(_percentile(latencies, 0.99), 3),
+                    "max": round(latencies[-1], 3) if latencies else 0.0,
+                },
+                "by_model": {m: dict(s, cost=round(s["cost"], 6)) for m, s in self.by_model.items()},
+                "unpriced_models": sorted(self.unpriced_models),
+                "wall_time": round(time.time() - self.started, 1),
+            }
+
+    def format(self) -> str:
+        s = self.summary()
+        errors = ", ".join(f"{k}: {v}" for k, v in s["errors"].items()) or "none"
+        return (
+            f"LLM usage: {s['requests']} requests ({s['cached']} cached, {s['retries']} retries), "
+            f"{s['prompt_tokens']} prompt + {s['completion_tokens']} completion tokens, cost {s['cost']:.4f}\n"
+            f"  latency p50 {s['latency']['p50']}s, p90 {s['latency']['p90']}s, p99 {s['latency']['p99']}s; "
+            f"errors: {errors}"
+        )
+
+    def write_summary(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, ensure_ascii=False, indent=2)
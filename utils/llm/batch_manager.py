@@ -0,0 +1,347 @@
+import json
+import os
+import random
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Dict, Iterator, List, Optional
+
+import httpx
+
+from utils.llm.llm_client import PROVIDERS, RETRYABLE_STATUS, LLMRequestError, ProviderConfig
+
+# 智谱批处理接口的单文件限制：最多50000行、100MB
+DEFAULT_MAX_LINES = 50_000
+DEFAULT_MAX_BYTES = 100 * 1024 * 1024
+
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+# 任务以这些状态结束时，输入中没有出现在输出和错误文件里的请求按出错上报
+UNFINISHED_STATUSES = TERMINAL_STATUSES - {"completed"}
+
+
+def shard_jsonl(
+    path: str,
+    out_dir: str,
+    max_lines: int = DEFAULT_MAX_LINES,
+    max_bytes: int = DEFAULT_MAX_BYTES,
+) -> List[str]:
+    """
+    把批处理输入JSONL按行数和字节数上限切成若干分片，逐行流式处理。
+    文件本身未超限时直接返回原路径，不复制。
+
+    :return: 分片文件路径列表
+    """
+    size = os.path.getsize(path)
+    if size <= max_bytes:
+        with open(path, "rb") as f:
+            lines = sum(1 for _ in f)
+        if lines <= max_lines:
+            return [path]
+
+    os.makedirs(out_dir, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(path))[0]
+    shards: List[str] = []
+    out = None
+    lines = written = 0
+    with open(path, "rb") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            if not line.endswith(b"\n"):
+                line += b"\n"
+            if len(line) > max_bytes:
+                raise ValueError(f"A single request in {path} is larger than the {max_bytes}-byte limit")
+            if out is None or lines >= max_lines or written + len(line) > max_bytes:
+                if out is not None:
+                    out.close()
+                shards.append(os.path.join(out_dir, f"{stem}.part{len(shards):04d}.jsonl"))
+                out = open(shards[-1], "wb")
+                lines = written = 0
+            out.write(line)
+            lines += 1
+            written += len(line)
+    if out is not None:
+        out.close()
+    return shards
+
+
+@dataclass
+class BatchShard:
+    """一个分片对应的批处理任务状态。"""
+
+    input_path: str
+    file_id: Optional[str] = None
+    batch_id: Optional[str] = None
+    status: str = "pending"
+    output_file_id: Optional[str] = None
+    error_file_id: Optional[str] = None
+    output_path: Optional[str] = None
+    error_path: Optional[str] = None
+
+
+@dataclass
+class BatchJobState:
+    """整个批处理作业的状态，保存为JSON，进程重启后从这里继续。"""
+
+    shards: List[BatchShard] = field(default_factory=list)
+
+    @classmethod
+    def load(cls, path: str) -> "BatchJobState":
+        if not os.path.exists(path):
+            return cls()
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(shards=[BatchShard(**s) for s in data.get("shards", [])])
+
+    def save(self, path: str):
+        # 先写临时文件再原子替换，崩溃时不会留下半个状态文件
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"shards": [asdict(s) for s in self.shards]}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, path)
+
+
+class BatchManager:
+    """
+    批处理作业管理：切分输入、上传并创建任务、带退避的轮询、下载并解析输出。
+
+    所有进度都记录在 state_path 指向的JSON中。重启后再次调用 run() 不会重复上传或重复创建任务，
+    已经下载过的结果文件也不会再下载。
+    """
+
+    def __init__(
+        self,
+        state_path: str,
+        provider: str = "zhipu",
+        api_key: Optional[str] = None,
+        endpoint: str = "/v4/chat/completions",
+        work_dir: Optional[str] = None,
+        poll_interval: float = 30.0,
+        max_poll_interval: float = 600.0,
+        max_lines: int = DEFAULT_MAX_LINES,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        metadata: Optional[dict] = None,
+        config: Optional[ProviderConfig] = None,
+    ):
+        """
+        :param state_path: 作业状态文件路径
+        :param provider: llm_client.PROVIDERS 中的服务商名，决定base_url和API Key
+        :param api_key: 覆盖服务商配置中的API Key
+        :param endpoint: 批处理请求体中的接口路径
+        :param work_dir: 分片和下载结果的存放目录，默认与状态文件同目录
+        :param poll_interval: 初始轮询间隔（秒），之后逐次放大到 max_poll_interval
+        :param config: 直接指定服务商配置，优先于provider
+        """
+        self.state_path = state_path
+        self.config = config or PROVIDERS[provider]
+        self.endpoint = endpoint
+        self.work_dir = work_dir or os.path.join(os.path.dirname(state_path) or ".", "batch")
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.max_lines = max_lines
+        self.max_bytes = max_bytes
+        self.metadata = metadata or {}
+        self.state = BatchJobState.load(state_path)
+
+        api_key = api_key or self.config.resolve_api_key()
+        headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+        self._http = httpx.Client(base_url=self.config.base_url, headers=headers, timeout=self.config.timeout)
+
+    # ---------- HTTP ----------
+
+    def _request(self, method: str, url: str, upload_path: Optional[str] = None, **kwargs) -> httpx.Response:
+        """发送请求，暂时性错误按带抖动的指数退避重试。上传文件时每次重试都会重新打开文件。"""
+        last_error = "no attempt made"
+        for attempt in range(self.config.max_retries + 1):
+            opened = None
+            if upload_path is not None:
+                opened = open(upload_path, "rb")
+                kwargs["files"] = {"file": (os.path.basename(upload_path), opened)}
+            try:
+                resp = self._http.request(method, url, **kwargs)
+            except httpx.TransportError as e:
+                last_error = f"{e.__class__.__name__}: {e}"
+            else:
+                if resp.status_code < 300:
+                    return resp
+                last_error = f"HTTP {resp.status_code}: {resp.text[:300]}"
+                if resp.status_code not in RETRYABLE_STATUS:
+                    raise LLMRequestError(f"{method} {url} failed: {last_error}", resp.status_code)
+            finally:
+                if opened is not None:
+                    opened.close()
+            if attempt < self.config.max_retries:
+                self._backoff(attempt)
+        raise LLMRequestError(f"{method} {url} failed after {self.config.max_retries + 1} attempts: {last_error}")
+
+    def _backoff(self, attempt: int):
+        time.sleep(random.uniform(0, min(self.config.backoff_max, self.config.backoff_base * 2 ** attempt)))
+
+    def _save(self):
+        self.state.save(self.state_path)
+
+    # ---------- 工作流 ----------
+
+    def submit(self, input_paths: List[str]):
+        """
+        切分并提交输入文件。状态中已有分片时沿用已有分片（续跑），只补做尚未完成的上传和创建。
+        """
+        if not self.state.shards:
+            shards = []
+            for path in input_paths:
+                shards.extend(shard_jsonl(path, os.path.join(self.work_dir, "input"), self.max_lines, self.max_bytes))
+            self.state.shards = [BatchShard(input_path=p) for p in shards]
+            self._save()
+
+        for shard in self.state.shards:
+            if shard.file_id is None:
+                resp = self._request("POST", "/files", data={"purpose": "batch"}, upload_path=shard.input_path)
+                shard.file_id = resp.json()["id"]
+                shard.status = "uploaded"
+                self._save()
+            if shard.batch_id is None:
+                resp = self._request("POST", "/batches", json={
+                    "input_file_id": shard.file_id,
+                    "endpoint": self.endpoint,
+                    "completion_window": "24h",
+                    "auto_delete_input_file": True,
+                    "metadata": self.metadata,
+                })
+                batch = resp.json()
+                shard.batch_id = batch["id"]
+                shard.status = batch.get("status", "validating")
+                self._save()
+
+    def refresh(self) -> bool:
+        """查询所有未结束任务的状态，全部结束时返回True。"""
+        for shard in self.state.shards:
+            if shard.batch_id is None or shard.status in TERMINAL_STATUSES:
+                continue
+            batch = self._request("GET", f"/batches/{shard.batch_id}").json()
+            shard.status = batch.get("status", shard.status)
+            shard.output_file_id = batch.get("output_file_id") or shard.output_file_id
+            shard.error_file_id = batch.get("error_file_id") or shard.error_file_id
+        self._save()
+        return all(s.status in TERMINAL_STATUSES for s in self.state.shards)
+
+    def wait(self, timeout: Optional[float] = None, show_progress: bool = True):
+        """
+        轮询直到所有任务结束，轮询间隔每次放大1.5倍直到 max_poll_interval。
+
+        :raises TimeoutError: 超过timeout秒仍未结束
+        """
+        started = time.monotonic()
+        interval = self.poll_interval
+        while not self.refresh():
+            if show_progress:
+                counts: Dict[str, int] = {}
+                for s in self.state.shards:
+                    counts[s.status] = counts.get(s.status, 0) + 1
+                print(f"Batch status: {counts}")
+            if timeout is not None and time.monotonic() - started + interval > timeout:
+                raise TimeoutError(f"Batch job not finished after {timeout}s, state saved to {self.state_path}")
+            time.sleep(interval)
+            interval = min(self.max_poll_interval, interval * 1.5)
+
+    def _download(self, file_id: str, dest: str):
+        """流式下载到临时文件后原子替换。暂时性错误和中途断开的连接按与 _request 相同的退避重试，每次从头下载。"""
+        os.makedirs(os.path.dirname(dest) or ".", exist_ok=True)
+        tmp = dest + ".tmp"
+        last_error = "no attempt made"
+        for attempt in range(self.config.max_retries + 1):
+            try:
+                with self._http.stream("GET", f"/files/{file_id}/content") as resp:
+                    if resp.status_code < 300:
+                        with open(tmp, "wb") as f:
+                            for chunk in resp.iter_bytes():
+                                f.write(chunk)
+                        os.replace(tmp, dest)
+                        return
+                    resp.read()
+                    last_error = f"HTTP {resp.status_code}"
+                    if resp.status_code not in RETRYABLE_STATUS:
+                        raise LLMRequestError(f"Downloading {file_id} failed: {last_error}", resp.status_code)
+            except httpx.TransportError as e:
+                last_error = f"{e.__class__.__name__}: {e}"
+            if attempt < self.config.max_retries:
+                self._backoff(attempt)
+        raise LLMRequestError(
+            f"Downloading {file_id} failed after {self.config.max_retries + 1} attempts: {last_error}"
+        )
+
+    def download(self):
+        """下载已完成任务的输出和错误文件，已下载的跳过。"""
+        out_dir = os.path.join(self.work_dir, "output")
+        for i, shard in enumerate(self.state.shards):
+            if shard.output_file_id and not (shard.output_path and os.path.exists(shard.output_path)):
+                shard.output_path = os.path.join(out_dir, f"output.part{i:04d}.jsonl")
+                self._download(shard.output_file_id, shard.output_path)
+                self._save()
+            if shard.error_file_id and not (shard.error_path and os.path.exists(shard.error_path)):
+                shard.error_path = os.path.join(out_dir, f"error.part{i:04d}.jsonl")
+                self._download(shard.error_file_id, shard.error_path)
+                self._save()
+
+    def iter_results(self) -> Iterator[dict]:
+        """
+        逐条解析已下载的结果，产出 {"custom_id", "content"} 或 {"custom_id", "error"}。
+        任务以失败、过期或取消结束时，输入中没有任何结果的请求也按出错产出，调用方可据此重新提交。
+        """
+        for shard in self.state.shards:
+            seen = set()
+            for path in (shard.output_path, shard.error_path):
+                if not path or not os.path.exists(path):
+                    continue
+                with open(path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        if line.strip():
+                            result = parse_result_line(json.loads(line))
+                            seen.add(result["custom_id"])
+                            yield result
+            if shard.status in UNFINISHED_STATUSES:
+                error = f"Batch {shard.batch_id} ended with status {shard.status!r} without a result"
+                for custom_id in _custom_ids(shard.input_path):
+                    if custom_id not in seen:
+                        yield {"custom_id": custom_id, "error": error}
+
+    def run(self, input_paths: List[str], timeout: Optional[float] = None) -> Dict[str, dict]:
+        """提交、等待、下载并解析，返回 custom_id -> 结果。可在中断后用同一状态文件重复调用。"""
+        self.submit(input_paths)
+        self.wait(timeout=timeout)
+        self.download()
+        return {r["custom_id"]: r for r in self.iter_results()}
+
+    def close(self):
+        self._http.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def _custom_ids(path: str) -> Iterator[str]:
+    """批处理输入JSONL中各请求的custom_id。"""
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)["custom_id"]
+
+
+def parse_result_line(record: dict) -> dict:
+    """
+    解析批处理输出中的一行（OpenAI/智谱格式）：
+    {"custom_id": ..., "response": {"status_code": 200, "body": {"choices": [...]}}, "error": ...}
+    """
+    custom_id = record.get("custom_id")
+    response = record.get("response") or {}
+    body = response.get("body") or {}
+    if record.get("error") or response.get("status_code", 200) != 200 or not body.get("choices"):
+        error = record.get("error") or body.get("error") or f"HTTP {response.get('status_code')}"
+        return {"custom_id": custom_id, "error": error}
+    return {
+        "custom_id": custom_id,
+        "content": body["choices"][0]["message"]["content"],
+        "usage": body.get("usage") or {},
+    }
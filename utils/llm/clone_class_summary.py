@@ -1,8 +1,15 @@
+import argparse
 import json
+import os
+import pickle
 import random
 
-from zai import ZhipuAiClient
+from utils.file.sharded_jsonl import ShardedJsonlWriter, load_manifest
+from utils.llm.accounting import UsageLedger, load_price_table
+from utils.llm.batch_manager import DEFAULT_MAX_BYTES, DEFAULT_MAX_LINES, BatchManager
 from utils.llm.generate_prompt import generate_prompt
+from utils.llm.response_cache import ResponseCache
+from utils.llm.token_counter import estimate_message_tokens
 
 
 def get_clone_class_functions(clone_class, function_index):
@@ -30,34 +37,86 @@ def get_clone_class_string(clone_class, function_index):
         index += 1
     return '\n'.join(function_strs)
 
-def generate_jsonl(clone_class_list, function_index, model, file_path):
-    jsonl = []
+def pick_clone_class_function(clone_class, function_index, rng=None, attempts=8):
+    """
+    随机挑选克隆类中的一个函数：随机取一个克隆对的一侧，在函数索引中命中即返回，
+    不为此构造整个克隆类的去重函数列表。多次都未命中时才退回 get_clone_class_functions。
 
-    index = 0
-    for clone_class in clone_class_list:
-        json_entry = {
-            "custom_id": f"clone_class_{index}",
-            "method": "POST",
-            "url": "/v4/chat/completions",
-            "body": {
-                "model": model,
-                "messages": [
-                    {"role": "system","content": generate_prompt("prompts/function_summary.md", {}),},
-                    {"role": "user", "content": random.choice(get_clone_class_functions(clone_class, function_index)).code_snippet}
-                ],
-            }
-        }
+    :param rng: 随机数生成器，缺省时以克隆类的内容为种子，同一个克隆类每次运行都挑中同一个函数，
+        请求内容不变，响应缓存才能命中
+    """
+    pairs = clone_class.clone_pairs
+    if rng is None:
+        rng = random.Random(repr(min(
+            ((p.file1, p.start1, p.end1, p.file2, p.start2, p.end2) for p in pairs), default=None
+        )))
+    for _ in range(attempts if pairs else 0):
+        pair = rng.choice(pairs)
+        key = (pair.file1, pair.start1, pair.end1) if rng.random() < 0.5 else (pair.file2, pair.start2, pair.end2)
+        func = function_index.get(key)
+        if func is not None:
+            return func
+    functions = get_clone_class_functions(clone_class, function_index)
+    return rng.choice(functions) if functions else None
 
-        jsonl.append(json_entry)
+# 与同步调用（function_summary.ask_llm_for_function_summary）相同的请求参数，两条路径共用缓存键
+SUMMARY_PARAMS = {"response_format": {"type": "json_object"}}
 
-        index += 1
+def _request_key(body):
+    """批处理请求体对应的响应缓存键，与 AsyncLLMClient.chat 的缓存键一致。"""
+    params = {k: v for k, v in body.items() if k not in ("model", "messages")}
+    return ResponseCache.make_key(body["model"], body["messages"], params)
+
+def generate_jsonl(clone_class_list, function_index, model, file_path, cache=None,
+                   max_lines=None, max_bytes=None, compress=False, manifest_path=None):
+    """
+    流式生成批处理请求JSONL：系统提示词只渲染一次，每个克隆类的请求生成后立即写入。
+    提供响应缓存时，已缓存的请求不写入批处理文件。
+
+    :param max_lines: 每个分片最多行数，None表示不限
+    :param max_bytes: 每个分片最多字节数，None表示不限
+    :param compress: 是否gzip压缩分片
+    :param manifest_path: custom_id -> 克隆类下标 的清单路径
+    :return: (缓存命中的 custom_id -> 响应内容, 写出的分片路径列表)。全部命中缓存时分片路径列表为空
+    """
+    system_prompt = generate_prompt("prompts/function_summary.md", {})
+    cached = {}
 
-    with open(file_path, 'w') as f:  # 使用上下文管理器打开文件
-        for entry in jsonl:  # 遍历数据列表中的每个 JSON 对象
-            json_line = json.dumps(entry)  # 将字典转换为 JSON 字符串
-            f.write(json_line + '\n')  # 将 JSON 字符串写入文件并换行
+    with ShardedJsonlWriter(file_path, max_lines=max_lines, max_bytes=max_bytes, compress=compress,
+                            manifest_path=manifest_path) as writer:
+        for index, clone_class in enumerate(clone_class_list):
+            custom_id = f"clone_class_{index}"
+            func = pick_clone_class_function(clone_class, function_index)
+            if func is None:
+                continue
+            messages = [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": func.code_snippet},
+            ]
+            body = {"model": model, "messages": messages, **SUMMARY_PARAMS}
+
+            if cache is not None:
+                hit = cache.get(_request_key(body), messages)
+                if hit is not None:
+                    cached[custom_id] = hit["content"]
+                    continue
+
+            writer.write({
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": "/v4/chat/completions",
+                "body": body,
+            }, key=custom_id, clone_class=index)
+
+    if cache is not None:
+        print(f"{len(cached)} of {len(clone_class_list)} requests served from cache, "
+              f"{writer.records} written to {len(writer.paths) if writer.records else 0} file(s)")
+    # 没有写出任何请求时 ShardedJsonlWriter 仍会留下一个空分片，不能把它当作待提交的输入
+    return cached, writer.paths if writer.records else []
 
 def upload_batch(file_path, api_key):
+    from zai import ZhipuAiClient
+
     client = ZhipuAiClient(api_key=api_key)
 
     # 上传批处理文件
@@ -69,6 +128,8 @@ def upload_batch(file_path, api_key):
     return file_object
 
 def create_batch_task(file_object, api_key):
+    from zai import ZhipuAiClient
+
     client = ZhipuAiClient(api_key=api_key)
     # 创建批处理任务
     batch = client.batches.create(
@@ -80,3 +141,154 @@ def create_batch_task(file_object, api_key):
             "project": "DeepCloneFinder"
         }
     )
+    return batch
+
+def _clone_class_index(custom_id, manifest):
+    if manifest is not None and custom_id in manifest:
+        return manifest[custom_id]["clone_class"]
+    return int(custom_id.rsplit("_", 1)[1])
+
+def join_batch_results(results, clone_class_list, cached=None, manifest=None):
+    """
+    把批处理结果（custom_id -> 结果）按 custom_id 对应回克隆类。
+
+    :param results: BatchManager.run() 的返回值
+    :param clone_class_list: 生成JSONL时使用的克隆类列表，custom_id 为 clone_class_<下标>
+    :param cached: generate_jsonl() 返回的缓存命中结果，一并合入
+    :param manifest: generate_jsonl() 写出的清单（load_manifest），缺省时从 custom_id 解析下标
+    :return: (克隆类下标 -> 回复内容, 克隆类下标 -> 错误信息)
+    """
+    summaries = {}
+    errors = {}
+    for custom_id, content in (cached or {}).items():
+        summaries[_clone_class_index(custom_id, manifest)] = content
+    for custom_id, result in results.items():
+        if not custom_id or not custom_id.startswith("clone_class_"):
+            continue
+        index = _clone_class_index(custom_id, manifest)
+        if not 0 <= index < len(clone_class_list):
+            continue
+        if "error" in result:
+            errors[index] = result["error"]
+        else:
+            summaries[index] = result["content"]
+    return summaries, errors
+
+def _iter_requests(input_paths):
+    for path in input_paths:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                yield json.loads(line)
+
+def summarize_clone_classes_batch(clone_class_list, function_index, model, work_dir, api_key=None, cache=None,
+                                  timeout=None, ledger=None):
+    """
+    端到端的批处理摘要：生成请求JSONL、切分提交、轮询、下载并对应回克隆类。
+    作业状态保存在 work_dir/batch_state.json，中断后用相同参数重新调用即可继续，不会重复提交。
+
+    :param ledger: UsageLedger，提交前按估计的输入token检查硬预算，结束后按批处理价格记录用量
+    :return: (克隆类下标 -> 回复内容, 克隆类下标 -> 错误信息)
+    :raises BudgetExceededError: 预计花费超过硬预算，作业未提交
+    """
+    os.makedirs(work_dir, exist_ok=True)
+    state_path = os.path.join(work_dir, "batch_state.json")
+    input_path = os.path.join(work_dir, "clone_class_summaries.jsonl")
+    cached_path = os.path.join(work_dir, "cached_results.json")
+    manifest_path = os.path.join(work_dir, "manifest.jsonl")
+    if not os.path.exists(state_path):
+        # 生成时直接按批处理接口的限制分片，提交时不必再切分
+        cached, input_paths = generate_jsonl(
+            clone_class_list, function_index, model, input_path, cache=cache,
+            max_lines=DEFAULT_MAX_LINES, max_bytes=DEFAULT_MAX_BYTES, manifest_path=manifest_path,
+        )
+        with open(cached_path, "w", encoding="utf-8") as f:
+            json.dump({"cached": cached, "input_paths": input_paths}, f, ensure_ascii=False)
+    else:
+        # 续跑：沿用上次生成的输入文件和缓存命中结果
+        with open(cached_path, "r", encoding="utf-8") as f:
+            previous = json.load(f)
+        cached, input_paths = previous["cached"], previous["input_paths"]
+
+    reserved = 0.0
+    if ledger is not None and input_paths and not os.path.exists(state_path):
+        # 批处理作业一旦提交无法中途停止，只能在提交前按输入token估计检查预算并预占
+        prompt_tokens = sum(estimate_message_tokens(r["body"]["messages"]) for r in _iter_requests(input_paths))
+        if ledger.admit(model, prompt_tokens, batch=True) > 0:
+            print("WARNING: soft budget reached before submitting the batch job")
+        reserved = ledger.reserve(model, prompt_tokens, batch=True)
+
+    try:
+        if not input_paths:
+            # 全部命中缓存，不上传也不提交批处理作业
+            results = {}
+        else:
+            with BatchManager(state_path, provider="zhipu", api_key=api_key, work_dir=work_dir, metadata={
+                "description": "DeepCloneFinder Clone Class Summarization",
+                "project": "DeepCloneFinder",
+            }) as manager:
+                results = manager.run(input_paths, timeout=timeout)
+    finally:
+        # 作业结束（或失败）后按实际用量记账，预占全部释放
+        if ledger is not None:
+            ledger.release(reserved)
+
+    if ledger is not None:
+        for _ in cached:
+            ledger.record(model, 0, 0, cached=True)
+        for result in results.values():
+            if "content" not in result:
+                ledger.record_error("batch error")
+                continue
+            usage = result.get("usage") or {}
+            ledger.record(
+                model, int(usage.get("prompt_tokens", 0)), int(usage.get("completion_tokens", 0)),
+                estimated="prompt_tokens" not in usage, batch=True,
+            )
+
+    if cache is not None:
+        # 批处理结果也写入响应缓存，之后相同的请求不再付费
+        for request in _iter_requests(input_paths):
+            result = results.get(request["custom_id"])
+            if result and "content" in result:
+                cache.put(_request_key(request["body"]), result["content"], result.get("usage"), model=model)
+    return join_batch_results(results, clone_class_list, cached, load_manifest(manifest_path))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Summarize clone classes through the batch API")
+    parser.add_argument("--clone-classes", default="process/clone_classes.pkl", help="parse_clone_class.py 的输出")
+    parser.add_argument("--function-index", default="process/function_index.pkl")
+    parser.add_argument("--model", default="glm-4-flash")
+    parser.add_argument("--work-dir", default="process/clone_class_batch", help="批处理作业状态目录，中断后用相同参数续跑")
+    parser.add_argument("--out", default="process/clone_class_summaries.json")
+    parser.add_argument("--api-key", default=None, help="默认读取环境变量 ZHIPUAI_API_KEY")
+    parser.add_argument("--llm-cache", default=None, help="LLM响应缓存路径，缓存命中的克隆类不再提交")
+    parser.add_argument("--timeout", type=float, default=None, help="等待批处理作业的最长秒数")
+    parser.add_argument("--price-table", default=None, help="价格表JSON（每百万token价格），覆盖内置价格")
+    parser.add_argument("--hard-budget", type=float, default=None, help="预计花费超过该值时不提交作业")
+    args = parser.parse_args(argv)
+
+    with open(args.clone_classes, "rb") as f:
+        clone_classes = pickle.load(f)
+    with open(args.function_index, "rb") as f:
+        function_index = pickle.load(f)
+    cache = ResponseCache(args.llm_cache) if args.llm_cache else None
+    ledger = UsageLedger(load_price_table(args.price_table), hard_budget=args.hard_budget)
+    try:
+        summaries, errors = summarize_clone_classes_batch(
+            clone_classes, function_index, args.model, args.work_dir,
+            api_key=args.api_key or os.getenv("ZHIPUAI_API_KEY"), cache=cache, timeout=args.timeout, ledger=ledger,
+        )
+    finally:
+        if cache is not None:
+            cache.close()
+    print(ledger.format())
+
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump({"summaries": summaries, "errors": errors}, f, ensure_ascii=False, indent=2)
+    print(f"{len(summaries)} summaries and {len(errors)} errors written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,13 @@
 import json
-from zai import ZhipuAiClient
 
+from utils.llm.llm_client import chat_sync
 
-def ask_llm_for_function_summary(system_prompt, user_prompt, api_key, model="glm-4.5-flash"):
-    client = ZhipuAiClient(api_key=api_key)
 
-    response = client.chat.completions.create(
-        model=model,
-        messages=[
+def ask_llm_for_function_summary(system_prompt, user_prompt, api_key, model="glm-4.5-flash"):
+    result = chat_sync(
+        "zhipu",
+        model,
+        [
             {
                 "role": "system",
                 "content": system_prompt
@@ -17,9 +17,12 @@ def ask_llm_for_function_summary(system_prompt, user_prompt, api_key, model="glm
                 "content": user_prompt
             }
         ],
+        api_key=api_key,
         response_format={
             "type": "json_object"
-        }
+        },
+        # 只缓存能解析的回复，否则坏回复会被写入响应缓存，之后每次运行都命中
+        validate=json.loads,
     )
 
-    return json.loads(response.choices[0].message.content)
+    return json.loads(result.content)
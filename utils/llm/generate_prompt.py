@@ -1,6 +1,98 @@
+import logging
+import os
+import re
+import threading
+from typing import Dict, List, Mapping, Optional, Set, Tuple
+
+logger = logging.getLogger('DeepCloneFinder')
+
+# 模板中的占位符写作 {{key}}
+_PLACEHOLDER_RE = re.compile(r"\{\{([^{}]+)\}\}")
+
+
+class PromptTemplate:
+    """
+    预编译的提示词模板：加载时把文本切分为字面量片段和占位符片段，渲染时只做一次join。
+    """
+
+    def __init__(self, text: str, name: str = "<string>"):
+        self.name = name
+        # 偶数下标为字面量，奇数下标为占位符名
+        self.segments: List[str] = _PLACEHOLDER_RE.split(text)
+        self.placeholders: Set[str] = set(self.segments[1::2])
+        self._reported: Set[Tuple[str, str]] = set()
+
+    def render(self, values: Mapping[str, str]) -> str:
+        """
+        用values填充占位符。缺少值的占位符原样保留，多余的键被忽略；两种情况都会记录一次警告。
+        """
+        parts = []
+        missing = []
+        for i, segment in enumerate(self.segments):
+            if i % 2 == 0:
+                parts.append(segment)
+            elif segment in values:
+                parts.append(str(values[segment]))
+            else:
+                missing.append(segment)
+                parts.append("{{" + segment + "}}")
+        for key in missing:
+            self._report("missing", key)
+        for key in values:
+            if key not in self.placeholders:
+                self._report("unknown", key)
+        return "".join(parts)
+
+    def _report(self, kind: str, key: str):
+        # 同一模板的同一问题只报告一次，避免在逐条生成的循环中刷屏
+        if (kind, key) in self._reported:
+            return
+        self._reported.add((kind, key))
+        if kind == "missing":
+            logger.warning(f"Prompt template {self.name}: no value for placeholder {{{{{key}}}}}")
+        else:
+            logger.warning(f"Prompt template {self.name}: unknown placeholder {key!r} ignored")
+
+
+class TemplateRegistry:
+    """
+    模板注册表：每个模板文件只读取、编译一次，文件修改时间变化时才重新加载。可在多线程中共享。
+    """
+
+    def __init__(self):
+        self._templates: Dict[str, Tuple[Tuple[int, int], PromptTemplate]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, filepath: str) -> PromptTemplate:
+        path = os.path.abspath(filepath)
+        stat = os.stat(path)
+        # 同时比较大小，弥补部分文件系统修改时间精度不足
+        signature = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            cached = self._templates.get(path)
+            if cached is not None and cached[0] == signature:
+                return cached[1]
+        with open(path, 'r', encoding='utf-8') as f:
+            template = PromptTemplate(f.read(), name=filepath)
+        with self._lock:
+            self._templates[path] = (signature, template)
+        return template
+
+    def render(self, filepath: str, replacement_dict: Optional[Mapping[str, str]] = None) -> str:
+        return self.get(filepath).render(replacement_dict or {})
+
+    def clear(self):
+        with self._lock:
+            self._templates.clear()
+
+
+_registry = TemplateRegistry()
+
+
+def get_template_registry() -> TemplateRegistry:
+    return _registry
+
+
 def generate_prompt(filepath, replacement_dict):
-    with open(filepath, 'r', encoding='utf-8') as f:
-        prompt = f.read()
-    for key, value in replacement_dict.items():
-        prompt = prompt.replace(f'{{{{{key}}}}}', value)
-    return prompt
\ No newline at end of file
+    """读取（缓存的）模板文件并把 {{key}} 替换为 replacement_dict 中对应的值。"""
+    return _registry.render(filepath, replacement_dict)
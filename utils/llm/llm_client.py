@@ -0,0 +1,376 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass, field, replace
+from typing import Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+from utils.llm.accounting import UsageLedger
+from utils.llm.response_cache import ResponseCache
+from utils.llm.token_counter import estimate_message_tokens, estimate_tokens
+
+# 这些状态码被视为暂时性错误，按退避策略重试
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+@dataclass
+class ProviderConfig:
+    """一个兼容OpenAI Chat Completions接口的LLM服务商的连接与限流配置。"""
+
+    name: str
+    base_url: str
+    api_key_env: Optional[str] = None
+    api_key: Optional[str] = None
+    requests_per_minute: float = 60
+    tokens_per_minute: float = 100_000
+    max_in_flight: int = 8
+    max_retries: int = 5
+    backoff_base: float = 1.0
+    backoff_max: float = 60.0
+    timeout: float = 120.0
+
+    def resolve_api_key(self) -> Optional[str]:
+        if self.api_key:
+            return self.api_key
+        if self.api_key_env:
+            return os.getenv(self.api_key_env)
+        return None
+
+
+PROVIDERS: Dict[str, ProviderConfig] = {
+    "openai": ProviderConfig("openai", "https://xiaoai.plus/v1", api_key_env="OPENAI_API_KEY"),
+    "zhipu": ProviderConfig("zhipu", "https://open.bigmodel.cn/api/paas/v4", api_key_env="ZHIPUAI_API_KEY"),
+}
+
+
+class LLMRequestError(Exception):
+    """请求在重试耗尽后仍然失败。"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None, attempts: int = 1):
+        super().__init__(message)
+        self.status_code = status_code
+        self.attempts = attempts
+
+
+@dataclass
+class ChatResult:
+    content: str
+    usage: dict = field(default_factory=dict)
+    attempts: int = 1
+    latency: float = 0.0
+    cached: bool = False
+
+
+class TokenBucket:
+    """
+    异步令牌桶限流器。
+
+    capacity为桶容量（即允许的突发量），rate为每秒补充的令牌数。
+    单次申请超过容量时按容量计，避免超大请求永远拿不到令牌。
+    """
+
+    def __init__(self, capacity: float, rate: float):
+        self.capacity = float(capacity)
+        self.rate = float(rate)
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, amount: float = 1.0):
+        amount = min(float(amount), self.capacity)
+        # 持锁等待保证先到先得，后来的请求不会插队饿死大请求
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return
+                await asyncio.sleep((amount - self._tokens) / self.rate)
+
+
+def _per_minute_bucket(per_minute: float) -> Optional[TokenBucket]:
+    if not per_minute or per_minute <= 0:
+        return None
+    return TokenBucket(capacity=per_minute, rate=per_minute / 60.0)
+
+
+class AsyncLLMClient:
+    """
+    单个服务商的异步客户端：一个复用连接的httpx.AsyncClient、请求数/分钟与token数/分钟两个令牌桶、
+    限制在途请求数的信号量，以及带抖动的指数退避重试。
+    提供响应缓存时，请求先查缓存，命中则不发请求也不占用限流额度。
+    提供记账器时，每次请求前检查预算，结束后记录用量、耗时、重试和错误。
+    """
+
+    def __init__(
+        self,
+        config: ProviderConfig,
+        cache: Optional[ResponseCache] = None,
+        ledger: Optional[UsageLedger] = None,
+    ):
+        self.config = config
+        self.cache = cache
+        self.ledger = ledger
+        api_key = config.resolve_api_key()
+        headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+        self._http = httpx.AsyncClient(
+            base_url=config.base_url,
+            headers=headers,
+            timeout=config.timeout,
+            limits=httpx.Limits(
+                max_connections=config.max_in_flight,
+                max_keepalive_connections=config.max_in_flight,
+            ),
+        )
+        self._semaphore = asyncio.Semaphore(config.max_in_flight)
+        self._request_bucket = _per_minute_bucket(config.requests_per_minute)
+        self._token_bucket = _per_minute_bucket(config.tokens_per_minute)
+
+    def _backoff(self, attempt: int, retry_after: Optional[str]) -> float:
+        # full jitter：在[0, base*2^attempt]内均匀取值，避免所有请求同时重试
+        delay = random.uniform(0, min(self.config.backoff_max, self.config.backoff_base * (2 ** attempt)))
+        if retry_after:
+            try:
+                delay = max(delay, float(retry_after))
+            except ValueError:
+                pass
+        return delay
+
+    async def chat(
+        self, model: str, messages: List[dict], validate: Optional[Callable[[str], object]] = None, **params
+    ) -> ChatResult:
+        """
+        发送一次chat completion请求。
+
+        Args:
+            model: 模型名
+            messages: OpenAI格式的消息列表
+            validate: 校验回复文本的函数，不合格时应抛出异常。提供时只有通过校验的回复才写入缓存，
+                不合格的缓存条目视为未命中；校验异常原样抛出，下次同样的请求会重新发送
+            **params: 透传给接口的其它参数（max_tokens、temperature、response_format等）
+
+        Returns:
+            ChatResult，包含回复文本、usage、尝试次数和耗时
+
+        Raises:
+            LLMRequestError: 非重试类错误，或重试次数耗尽
+            BudgetExceededError: 记账器的硬预算上限已达到
+        """
+        ledger = self.ledger
+        cache_key = None
+        if self.cache is not None:
+            cache_key = ResponseCache.make_key(model, messages, params)
+            hit = self.cache.get(cache_key, messages)
+            if hit is not None and validate is not None:
+                try:
+                    validate(hit["content"])
+                except Exception:
+                    hit = None
+            if hit is not None:
+                if ledger is not None:
+                    ledger.record(model, 0, 0, cached=True)
+                return ChatResult(content=hit["content"], usage=hit["usage"], attempts=0, cached=True)
+
+        payload = {"model": model, "messages": messages, **params}
+        prompt_estimate = estimate_message_tokens(messages)
+        completion_limit = int(params.get("max_tokens") or 0)
+        estimated = prompt_estimate + completion_limit
+        reserved = 0.0
+        if ledger is not None:
+            # 软上限触发后暂停，期间仍需检查硬上限（其它在途请求可能把花费推过上限）
+            while True:
+                wait = ledger.admit(model, prompt_estimate, completion_limit)
+                if wait <= 0:
+                    break
+                await asyncio.sleep(min(wait, 5.0))
+            # 预占估计花费，并发的在途请求合计也不会越过硬上限
+            reserved = ledger.reserve(model, prompt_estimate, completion_limit)
+
+        try:
+            result = await self._send(payload, estimated)
+        except LLMRequestError as e:
+            if ledger is not None:
+                ledger.record_error(e, attempts=e.attempts, reserved=reserved)
+            raise
+        except BaseException:
+            # 取消等情况下请求结果未知，只释放预占
+            if ledger is not None:
+                ledger.release(reserved)
+            raise
+        if ledger is not None:
+            # 服务商没有返回usage时用本地估计
+            reported = "prompt_tokens" in result.usage
+            ledger.record(
+                model,
+                int(result.usage["prompt_tokens"]) if reported else prompt_estimate,
+                int(result.usage.get("completion_tokens", 0)) if reported else estimate_tokens(result.content),
+                latency=result.latency,
+                attempts=result.attempts,
+                estimated=not reported,
+                reserved=reserved,
+            )
+        if validate is not None:
+            validate(result.content)
+        if cache_key is not None:
+            self.cache.put(cache_key, result.content, result.usage, model=model)
+        return result
+
+    async def _send(self, payload: dict, estimated: int) -> ChatResult:
+        """在限流和重试策略下发送请求，直到成功或放弃。"""
+        last_error: Tuple[str, Optional[int]] = ("no attempt made", None)
+        started = time.monotonic()
+
+        for attempt in range(self.config.max_retries + 1):
+            retry_after = None
+            # 信号量只在发请求期间持有，退避等待时让出，其它请求不会被一个429拖住
+            async with self._semaphore:
+                if self._request_bucket:
+                    await self._request_bucket.acquire(1)
+                if self._token_bucket:
+                    await self._token_bucket.acquire(estimated)
+
+                try:
+                    resp = await self._http.post("/chat/completions", json=payload)
+                except httpx.TransportError as e:
+                    last_error = (f"{e.__class__.__name__}: {e}", None)
+                else:
+                    if resp.status_code == 200:
+                        try:
+                            data = resp.json()
+                            return ChatResult(
+                                content=data["choices"][0]["message"]["content"],
+                                usage=data.get("usage") or {},
+                                attempts=attempt + 1,
+                                latency=time.monotonic() - started,
+                            )
+                        except (ValueError, KeyError, IndexError, TypeError) as e:
+                            # 网关截断或返回非JSON的200响应，按可重试错误处理
+                            detail = f"{e.__class__.__name__}: {resp.text[:300]}"
+                            last_error = (f"Malformed response body ({detail})", 200)
+                    else:
+                        last_error = (f"HTTP {resp.status_code}: {resp.text[:300]}", resp.status_code)
+                        if resp.status_code not in RETRYABLE_STATUS:
+                            raise LLMRequestError(last_error[0], resp.status_code, attempts=attempt + 1)
+                        retry_after = resp.headers.get("Retry-After")
+
+            if attempt < self.config.max_retries:
+                await asyncio.sleep(self._backoff(attempt, retry_after))
+
+        raise LLMRequestError(
+            f"Giving up after {self.config.max_retries + 1} attempts: {last_error[0]}",
+            last_error[1],
+            attempts=self.config.max_retries + 1,
+        )
+
+    async def aclose(self):
+        await self._http.aclose()
+
+
+class _LoopThread:
+    """在后台守护线程中运行的事件循环，供同步代码（包括线程池中的代码）提交协程。"""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="llm-client-loop", daemon=True)
+        self._thread.start()
+
+    def run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+
+_loop_thread: Optional[_LoopThread] = None
+_clients: Dict[Tuple[str, Optional[str]], AsyncLLMClient] = {}
+_response_cache: Optional[ResponseCache] = None
+_usage_ledger: Optional[UsageLedger] = None
+_registry_lock = threading.Lock()
+
+
+def configure_provider(name: str, **overrides) -> ProviderConfig:
+    """
+    修改服务商配置（如限流参数），需在该服务商的客户端第一次创建之前调用。
+    """
+    with _registry_lock:
+        base = PROVIDERS.get(name) or ProviderConfig(name, overrides.pop("base_url"))
+        PROVIDERS[name] = replace(base, **overrides)
+        return PROVIDERS[name]
+
+
+def set_response_cache(cache: Optional[ResponseCache]):
+    """设置所有共享客户端使用的响应缓存，传入None关闭缓存。"""
+    global _response_cache
+    with _registry_lock:
+        _response_cache = cache
+        for client in _clients.values():
+            client.cache = cache
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    return _response_cache
+
+
+def set_usage_ledger(ledger: Optional[UsageLedger]):
+    """设置所有共享客户端使用的记账器，传入None关闭记账。"""
+    global _usage_ledger
+    with _registry_lock:
+        _usage_ledger = ledger
+        for client in _clients.values():
+            client.ledger = ledger
+
+
+def get_usage_ledger() -> Optional[UsageLedger]:
+    return _usage_ledger
+
+
+def _get_loop_thread() -> _LoopThread:
+    global _loop_thread
+    with _registry_lock:
+        if _loop_thread is None:
+            _loop_thread = _LoopThread()
+        return _loop_thread
+
+
+def get_llm_client(provider: str, api_key: Optional[str] = None) -> AsyncLLMClient:
+    """
+    返回某服务商（及API Key）共享的客户端，每个服务商只建立一个连接池。
+    客户端绑定在后台事件循环上，请通过chat_sync调用，或把协程提交到该循环。
+    """
+    loop_thread = _get_loop_thread()
+    with _registry_lock:
+        key = (provider, api_key)
+        if key not in _clients:
+            config = PROVIDERS[provider]
+            if api_key:
+                config = replace(config, api_key=api_key)
+
+            async def _create():
+                return AsyncLLMClient(config, cache=_response_cache, ledger=_usage_ledger)
+
+            # asyncio原语在创建时不绑定循环，但放到后台循环中创建更稳妥
+            _clients[key] = asyncio.run_coroutine_threadsafe(_create(), loop_thread.loop).result()
+        return _clients[key]
+
+
+def chat_sync(provider: str, model: str, messages: List[dict], api_key: Optional[str] = None, **params) -> ChatResult:
+    """同步调用共享客户端的chat()，可在任意线程中使用。"""
+    client = get_llm_client(provider, api_key)
+    return _get_loop_thread().run(client.chat(model, messages, **params))
+
+
+def close_all_clients():
+    """关闭所有共享客户端的连接池。后台事件循环保留，之后创建的客户端继续使用。"""
+    with _registry_lock:
+        clients = list(_clients.values())
+        _clients.clear()
+        loop_thread = _loop_thread
+    if loop_thread is None:
+        return
+    for client in clients:
+        loop_thread.run(client.aclose())
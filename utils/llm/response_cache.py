@@ -0,0 +1,119 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import List, Optional
+
+from utils.llm.token_counter import estimate_message_tokens, estimate_tokens
+
+
+class ResponseCache:
+    """
+    以内容哈希为键的本地LLM响应缓存（SQLite）。
+
+    键为 sha256(模型 + 消息 + 其它请求参数) ，相同的请求在不同运行、不同实验之间只付费一次。
+    支持可选的过期时间（TTL）和条目数上限，超过上限时按最近访问时间淘汰（LRU）。
+    可以在多个线程中共享同一个实例。
+    """
+
+    def __init__(self, path: str, ttl: Optional[float] = None, max_entries: Optional[int] = None):
+        """
+        :param path: SQLite文件路径
+        :param ttl: 条目有效期（秒），None表示永不过期
+        :param max_entries: 最多保留的条目数，None表示不限
+        """
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.saved_prompt_tokens = 0
+        self.saved_completion_tokens = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # 多个分片进程可能共用同一个缓存文件，写锁被占用时等待而不是立即报错
+        self._conn = sqlite3.connect(path, timeout=30.0, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, model TEXT, content TEXT NOT NULL, usage TEXT,"
+            " created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(model: str, messages: List[dict], params: Optional[dict] = None) -> str:
+        canonical = json.dumps(
+            {"model": model, "messages": messages, "params": params or {}},
+            sort_keys=True, ensure_ascii=False, separators=(",", ":"),
+        )
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def get(self, key: str, messages: Optional[List[dict]] = None) -> Optional[dict]:
+        """
+        查询缓存，命中时返回 {"content": ..., "usage": ...}，并累计节省的token数。
+
+        :param key: make_key() 生成的键
+        :param messages: 原始消息，缓存记录没有usage时用来估计节省的prompt token数
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT content, usage, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.ttl is not None and now - row[2] > self.ttl:
+                with self._conn:
+                    self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+
+            with self._conn:
+                self._conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            content, usage_json, _ = row
+            usage = json.loads(usage_json) if usage_json else {}
+            self.hits += 1
+            self.saved_prompt_tokens += usage.get("prompt_tokens") or (
+                estimate_message_tokens(messages) if messages else 0
+            )
+            self.saved_completion_tokens += usage.get("completion_tokens") or estimate_tokens(content)
+            return {"content": content, "usage": usage}
+
+    def put(self, key: str, content: str, usage: Optional[dict] = None, model: Optional[str] = None):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, content, json.dumps(usage or {}), now, now),
+            )
+            if self.max_entries is not None:
+                count = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+                if count > self.max_entries:
+                    self._conn.execute(
+                        "DELETE FROM responses WHERE key IN "
+                        "(SELECT key FROM responses ORDER BY accessed ASC LIMIT ?)",
+                        (count - self.max_entries,),
+                    )
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            row = self._conn.execute("SELECT created FROM responses WHERE key = ?", (key,)).fetchone()
+        return row is not None and (self.ttl is None or time.time() - row[0] <= self.ttl)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def summary(self) -> str:
+        total = self.hits + self.misses
+        rate = self.hits / total * 100 if total else 0.0
+        return (
+            f"LLM cache: {self.hits} hits, {self.misses} misses ({rate:.1f}% hit rate), "
+            f"saved ~{self.saved_prompt_tokens} prompt + {self.saved_completion_tokens} completion tokens"
+        )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,22 @@
+import re
+from typing import Iterable
+
+# 代码和英文混合文本大约每4个字符1个token；CJK字符基本每字1个token
+_CJK_RE = re.compile(r"[\u3000-\u9fff\uac00-\ud7af\uff00-\uffef]")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    在本地粗略估计文本的token数，不依赖具体模型的分词器。
+
+    估计值偏保守（略高于BPE分词器的真实值），用于限流、预算和上下文长度检查。
+    """
+    if not text:
+        return 0
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def estimate_message_tokens(messages: Iterable[dict]) -> int:
+    """估计一组chat消息的token数，每条消息额外计入角色等格式开销。"""
+    return sum(estimate_tokens(m.get("content") or "") + 4 for m in messages) + 2
@@ -54,4 +54,8 @@ def get_log_file_path():
     return _log_file_path
 
 
-logger = setup_logger('logs')
+def __getattr__(name):
+    # `from utils.logger.logger import logger` 在第一次访问时才创建日志文件，导入本模块没有副作用
+    if name == "logger":
+        return setup_logger('logs')
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")